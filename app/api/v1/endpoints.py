@@ -1,18 +1,121 @@
-from fastapi import APIRouter, HTTPException
-from app.models.request import ComplianceCheckRequest
-from app.models.response import ComplianceCheckResponse
-from app.rag.retrieval import check_compliance
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.jobs.runner import get_job_runner
+from app.jobs.store import get_job_store
+from app.models.request import BatchComplianceCheckRequest, ComplianceCheckRequest, RequestOptions
+from app.models.response import (
+    BatchComplianceCheckResponse,
+    ComplianceCheckResponse,
+    JobResultsResponse,
+    JobStatusResponse,
+)
+from app.rag.retrieval import BATCH_MAX_ITEMS, check_compliance, check_compliance_batch, stream_compliance_check
+from app.workflow.prescreen import PRESCREEN_MODES
+from app.workflow.query_generation import QUERY_MODES
+from app.workflow.registry import available_pipelines
 
 router = APIRouter()
 
+def _validate_options(options: Optional[RequestOptions]):
+    """パイプライン名などの指定誤りは400で返す"""
+    if options is None:
+        return
+    if options.pipeline and options.pipeline not in available_pipelines():
+        raise HTTPException(status_code=400, detail=f"Unknown pipeline: {options.pipeline}")
+    if options.query_mode and options.query_mode not in QUERY_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown query_mode: {options.query_mode}")
+    if options.prescreen and options.prescreen not in PRESCREEN_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown prescreen: {options.prescreen}")
+
 @router.post("/compliance/check", response_model=ComplianceCheckResponse)
 async def compliance_check(request: ComplianceCheckRequest):
     """
     投稿内容の法律コンプライアンスをチェックするエンドポイント
     """
+    _validate_options(request.options)
     try:
         # RAGを使用してコンプライアンスチェックを実行
         result = await check_compliance(request)
         return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/compliance/check/stream")
+async def compliance_check_stream(request: ComplianceCheckRequest):
+    """
+    コンプライアンスチェックの途中経過をServer-Sent Eventsで返すエンドポイント
+    prescreen（事前判定）→ evidence（根拠文書）→ analysis_delta / analysis（IRAC分析）→ recommendations_delta / recommendations（言い換え提案）→ result の順に送る
+    """
+    _validate_options(request.options)
+
+    async def event_stream():
+        try:
+            async for event, data in stream_compliance_check(request):
+                yield _sse(event, data)
+        except Exception as e:
+            # ストリーム開始後はHTTPステータスを変えられないため、errorイベントで通知する
+            print(f"Streaming compliance check failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/compliance/check/batch", response_model=BatchComplianceCheckResponse)
+async def compliance_check_batch(request: BatchComplianceCheckRequest):
+    """
+    複数の投稿内容をまとめてチェックするエンドポイント
+    項目ごとの失敗は results 内のエラーとして返す（HTTPステータスは200）
+    """
+    _validate_options(request.options)
+    if not request.contents:
+        raise HTTPException(status_code=400, detail="contents must not be empty")
+    if len(request.contents) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many contents: {len(request.contents)} (max {BATCH_MAX_ITEMS})")
+    try:
+        return await check_compliance_batch(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def submit_job(request: BatchComplianceCheckRequest):
+    """
+    一括チェックのジョブを投入するエンドポイント（件数の上限なし）
+    進捗は GET /jobs/{job_id}、結果は GET /jobs/{job_id}/results で取得する
+    """
+    _validate_options(request.options)
+    if not request.contents:
+        raise HTTPException(status_code=400, detail="contents must not be empty")
+    store = get_job_store()
+    job_id = await asyncio.to_thread(
+        store.create_job,
+        [c.model_dump() for c in request.contents],
+        request.options.model_dump(exclude_none=True) if request.options else None
+    )
+    get_job_runner().notify()
+    return await asyncio.to_thread(store.get_job, job_id)
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}/results", response_model=JobResultsResponse)
+async def get_job_results(job_id: str,
+                          offset: int = Query(0, ge=0),
+                          limit: int = Query(100, ge=1, le=1000)):
+    """処理済みの項目の結果を位置順にページ単位で返す（ジョブの実行中でも取得できる）"""
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    results = await asyncio.to_thread(store.get_results, job_id, offset, limit)
+    return {"job_id": job_id, "status": job["status"], "offset": offset, "limit": limit, "results": results}
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from typing import Optional
+
+from app.jobs.store import JobStore, get_job_store
+
+# 1回にまとめて処理する項目数（この単位で結果を保存する）
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "32"))
+# 新しいジョブを確認する間隔（秒）。投入時は即座に起こされる
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+# 実行中のジョブのリースを延長する間隔（秒）。0の場合はリース（JOB_LEASE_SECONDS）の1/3
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "0"))
+# APIプロセス内でジョブを実行するか（複数プロセス構成で実行役を限定する場合にfalse）
+JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "true").lower() == "true"
+
+
+class JobRunner:
+    """
+    ジョブキューから1件ずつジョブを取り出し、未完了の項目を JOB_CHUNK_SIZE 件ずつ
+    check_compliance_batch で処理するバックグラウンドタスク
+    各uvicornワーカーで動くため、ジョブの取得は JobStore.claim_next_job の条件付き更新で排他し、
+    処理中はハートビートでリースを延長する。リースが他のワーカーに引き継がれた場合は処理を止める。
+    """
+
+    def __init__(self, store: Optional[JobStore] = None,
+                 chunk_size: int = JOB_CHUNK_SIZE,
+                 poll_seconds: float = JOB_POLL_SECONDS,
+                 heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS):
+        self.store = store or get_job_store()
+        self.chunk_size = chunk_size
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds if heartbeat_seconds > 0 else max(self.store.lease_seconds / 3, 1.0)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        print("Job runner started")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """ジョブが投入されたことを知らせる"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                job_id = await asyncio.to_thread(self.store.claim_next_job)
+                if job_id is not None:
+                    await self.run_job(job_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 実行中のまま残ったジョブはリースが切れた後に再開される
+                print(f"Job runner error: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, job_id: str, lost: asyncio.Event):
+        """処理中のジョブのリースを一定間隔で延長する（引き継がれていたら lost をセットして終わる）"""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if not await asyncio.to_thread(self.store.renew_lease, job_id):
+                lost.set()
+                return
+
+    async def run_job(self, job_id: str):
+        """ジョブの未完了の項目を順に処理する（再開時は保存済みの項目を飛ばす）"""
+        from app.models.request import BatchComplianceCheckRequest
+        from app.rag.retrieval import check_compliance_batch
+
+        options = await asyncio.to_thread(self.store.get_job_options, job_id)
+        print(f"Running job {job_id}")
+        lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, lost))
+        try:
+            while not lost.is_set():
+                items = await asyncio.to_thread(self.store.pending_items, job_id, self.chunk_size)
+                if not items:
+                    break
+                batch = await check_compliance_batch(BatchComplianceCheckRequest(
+                    contents=[item["content"] for item in items],
+                    options=options
+                ))
+                results = [
+                    {
+                        "index": items[r.index]["index"],
+                        "status": r.status,
+                        "result": r.response.model_dump(mode="json") if r.response else None,
+                        "error": r.error,
+                    }
+                    for r in batch.results
+                ]
+                if not await asyncio.to_thread(self.store.save_results, job_id, results):
+                    lost.set()
+        finally:
+            heartbeat.cancel()
+        if lost.is_set() or not await asyncio.to_thread(self.store.finish_job, job_id):
+            print(f"Job {job_id} was taken over by another worker; stopped")
+            return
+        print(f"Job {job_id} completed")
+
+
+_default_runner: Optional[JobRunner] = None
+
+
+def get_job_runner() -> JobRunner:
+    global _default_runner
+    if _default_runner is None:
+        _default_runner = JobRunner()
+    return _default_runner
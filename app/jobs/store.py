@@ -0,0 +1,227 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+# 一括チェックジョブの永続キュー（SQLite）
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "./data/jobs.sqlite3")
+# 実行中のジョブがこの秒数以上更新されない場合、ワーカーが停止したとみなして再開する
+# 実行中のワーカーは処理中もハートビートでリースを延長する（app/jobs/runner.py）
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+# ジョブの状態: queued → running → completed（項目ごとの失敗は項目のstatusで表す）
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+# 項目の状態
+ITEM_PENDING = "pending"
+ITEM_SUCCESS = "success"
+ITEM_ERROR = "error"
+
+
+class JobStore:
+    """
+    一括チェックジョブと各項目の結果をSQLiteに保存する
+    項目は完了ごとに保存するため、プロセスが再起動しても未完了の項目から再開できる。
+    複数のプロセス（uvicornのワーカー）が同じファイルを共有するため、ジョブの取得・リースの延長は
+    条件付きのUPDATEで行い、threading.Lock はプロセス内の接続の共有だけを守る。
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        # リースの所有者（プロセスごとのストアを識別する）
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                options TEXT,
+                total INTEGER NOT NULL,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, idx)
+            )"""
+        )
+        # owner 列のない既存のDBに列を追加する
+        if "owner" not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def create_job(self, contents: List[Dict], options: Optional[Dict] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, options, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(options, ensure_ascii=False) if options else None,
+                 len(contents), now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, idx, content, status) VALUES (?, ?, ?, ?)",
+                [(job_id, i, json.dumps(c, ensure_ascii=False), ITEM_PENDING) for i, c in enumerate(contents)]
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim_next_job(self) -> Optional[str]:
+        """
+        実行待ちのジョブ（またはリースの切れた実行中のジョブ）を1件取得して実行中にする
+        候補を選んだ後、状態が変わっていない場合だけ更新する条件付きのUPDATEで取得するため、
+        同じジョブを複数のプロセスが同時に取得することはない（先に更新したプロセスだけが rowcount 1 になる）。
+        """
+        with self._lock:
+            while True:
+                now = time.time()
+                expired = now - self.lease_seconds
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) "
+                    "ORDER BY created_at ASC LIMIT 1",
+                    (JOB_QUEUED, JOB_RUNNING, expired)
+                ).fetchone()
+                if row is None:
+                    return None
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, updated_at = ? "
+                    "WHERE id = ? AND (status = ? OR (status = ? AND updated_at < ?))",
+                    (JOB_RUNNING, self.worker_id, now, row[0], JOB_QUEUED, JOB_RUNNING, expired)
+                )
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    return row[0]
+                # 他のプロセスが先に取得したため、次の候補を探す
+
+    def _renew_lease(self, job_id: str) -> bool:
+        # 他のワーカーに引き継がれていなければ更新時刻（リース）を延長する（呼び出し側でロックを取る）
+        cursor = self._conn.execute(
+            "UPDATE jobs SET updated_at = ? WHERE id = ? AND (owner IS NULL OR owner = ?)",
+            (time.time(), job_id, self.worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def renew_lease(self, job_id: str) -> bool:
+        """
+        ジョブのリースを延長する（実行中のワーカーのハートビート）
+        リースが切れて他のワーカーに引き継がれていた場合は False
+        """
+        with self._lock:
+            renewed = self._renew_lease(job_id)
+            self._conn.commit()
+        return renewed
+
+    def get_job_options(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT options FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def pending_items(self, job_id: str, limit: int) -> List[Dict]:
+        """未完了の項目を位置順に返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, content FROM job_items WHERE job_id = ? AND status = ? ORDER BY idx ASC LIMIT ?",
+                (job_id, ITEM_PENDING, limit)
+            ).fetchall()
+        return [{"index": idx, "content": json.loads(content)} for idx, content in rows]
+
+    def save_results(self, job_id: str, results: List[Dict]) -> bool:
+        """
+        項目の結果を保存し、ジョブの更新時刻（リース）を延長する
+        results: [{"index": int, "status": "success" | "error", "result": dict, "error": str}, ...]
+        リースが他のワーカーに引き継がれていた場合は保存せずに False を返す
+        """
+        with self._lock:
+            if not self._renew_lease(job_id):
+                self._conn.rollback()
+                return False
+            self._conn.executemany(
+                "UPDATE job_items SET status = ?, result = ?, error = ? WHERE job_id = ? AND idx = ?",
+                [(r["status"],
+                  json.dumps(r["result"], ensure_ascii=False) if r.get("result") is not None else None,
+                  r.get("error"), job_id, r["index"]) for r in results]
+            )
+            self._conn.commit()
+        return True
+
+    def finish_job(self, job_id: str) -> bool:
+        """ジョブを完了にする（リースが他のワーカーに引き継がれていた場合は False）"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND (owner IS NULL OR owner = ?)",
+                (JOB_COMPLETED, now, now, job_id, self.worker_id)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """ジョブの状態と項目の集計を返す"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, total, created_at, updated_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        status, total, created_at, updated_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "completed": counts.get(ITEM_SUCCESS, 0) + counts.get(ITEM_ERROR, 0),
+            "succeeded": counts.get(ITEM_SUCCESS, 0),
+            "failed": counts.get(ITEM_ERROR, 0),
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "finished_at": finished_at,
+        }
+
+    def get_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """完了済みの項目の結果を位置順に返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, status, result, error FROM job_items WHERE job_id = ? AND status != ? "
+                "ORDER BY idx ASC LIMIT ? OFFSET ?",
+                (job_id, ITEM_PENDING, limit, offset)
+            ).fetchall()
+        return [
+            {"index": idx, "status": status, "response": json.loads(result) if result else None, "error": error}
+            for idx, status, result, error in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """プロセス内で共有するジョブストアを返す"""
+    global _default_store
+    if _default_store is None:
+        _default_store = JobStore()
+    return _default_store
@@ -1,7 +1,49 @@
+from app.rag.memory_report import startup_report
+
+# ワーカーごとのメモリ使用量の起点（以降のimportと起動処理で読み込むライブラリ・インデックス・モデルの分を増加量として測る）
+startup_report.mark("start")
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.v1.endpoints import router as api_v1_router
+from app.jobs.runner import JOB_RUNNER_ENABLED, get_job_runner
+from app.rag import vector_store
+from app.rag.embedding import EMBEDDING_PRELOAD
+from app.workflow.langgraph import init_llms
+from app.workflow.registry import compile_all
+
+startup_report.mark("imports")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 重いリソース（インデックス・LLMクライアント・embeddingモデル）はimport時ではなくここで初期化する
+    # インデックスは構築せず、公開済みのものを開くだけ（構築は python -m app.rag.build_index）
+    vector_store.open_current_index()
+    startup_report.mark("index", mapped_prefix=vector_store.current_dir)
+    if vector_store.backend is None:
+        print("⚠ Index not found. Run `python -m app.rag.build_index` before serving requests.")
+    else:
+        print(f"Serving index version {vector_store.index_info.get('version')}")
+    # GOOGLE_API_KEY がない場合はここでエラーになり、サーバーは起動しない
+    init_llms()
+    if EMBEDDING_PRELOAD:
+        # 最初のリクエストでモデルの読み込みを待たないようにする
+        await asyncio.to_thread(lambda: vector_store.embedding_func.model)
+        startup_report.mark("model", mapped_prefix=vector_store.current_dir)
+    # ワークフローを起動時に1回だけコンパイルする（グラフ定義の誤りはここで検出する）
+    print(f"Compiled workflows: {', '.join(compile_all())}")
+    # 一括チェックジョブの実行（再起動前に未完了だったジョブもここから再開される）
+    runner = get_job_runner() if JOB_RUNNER_ENABLED else None
+    if runner is not None:
+        runner.start()
+    startup_report.mark("ready", mapped_prefix=vector_store.current_dir)
+    startup_report.print_report()
+    yield
+    if runner is not None:
+        await runner.stop()
 
-app = FastAPI(title="AI Legal Checker API", version="0.1.0")
+app = FastAPI(title="AI Legal Checker API", version="0.1.0", lifespan=lifespan)
 
 # APIルートの登録
 app.include_router(api_v1_router, prefix="/api/v1")
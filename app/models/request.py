@@ -9,7 +9,14 @@ class RequestOptions(BaseModel):
     target_laws: Optional[List[str]] = None  # チェック対象の法律リスト
     category: Optional[str] = None  # 商品カテゴリ
     product_specifications: Optional[str] = None  # 商品仕様情報
+    pipeline: Optional[str] = None  # 実行するワークフロー: "full"（IRAC分析＋言い換え提案）/ "quick"（簡易スクリーニング）
+    query_mode: Optional[str] = None  # 検索クエリの生成方法: "llm"（既定、結果はキャッシュ）/ "local"（LLMを使わず語彙照合）
+    prescreen: Optional[str] = None  # 表現辞書による事前判定: "off" / "annotate"（既定、結果の付与のみ）/ "short_circuit"（明白な違反はLLM分析を省略）
 
 class ComplianceCheckRequest(BaseModel):
     content: ContentData
-    options: Optional[RequestOptions] = None
\ No newline at end of file
+    options: Optional[RequestOptions] = None
+
+class BatchComplianceCheckRequest(BaseModel):
+    contents: List[ContentData]  # チェック対象の投稿内容（同一テキストは1回だけチェックする）
+    options: Optional[RequestOptions] = None  # 全件共通のオプション
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 class ViolationDetail(BaseModel):
     law: str  # 抵触した法律
@@ -13,6 +13,31 @@ class Recommendation(BaseModel):
     revised_text: str  # 提案された修正版
     reason: str  # 修正理由
 
+class ComplianceIssue(BaseModel):
+    expression: str  # 問題となる表現（入力テキストからの引用）
+    start: Optional[int] = None  # 入力テキスト上の開始位置（見つからない場合はNone）
+    end: Optional[int] = None  # 入力テキスト上の終了位置
+    law: str  # 抵触するおそれのある法律
+    cited_articles: List[str] = []  # 根拠とした条文・ガイドライン（例: "薬機法 第66条第1項"）
+    risk_level: Literal["high", "medium", "low"]  # 違反リスク
+    reason: str  # あてはめ（なぜ抵触するか）
+
+class ComplianceAnalysis(BaseModel):
+    verdict: Literal["compliant", "non_compliant", "unclear"]  # 結論
+    risk_level: Literal["high", "medium", "low", "none"]  # テキスト全体の違反リスク
+    issues: List[ComplianceIssue] = []  # 論点（問題となる表現ごと）
+    rule: str = ""  # 適用される規定の要約（Rule）
+    application: str = ""  # あてはめの要約（Application）
+    conclusion: str = ""  # 結論の説明（Conclusion）
+
+class RevisedExpression(BaseModel):
+    original_text: str  # 元の問題表現
+    revised_text: str  # 代替表現
+    reason: str  # その表現が安全である理由
+
+class RecommendationSet(BaseModel):
+    revisions: List[RevisedExpression] = []  # 代替表現の提案
+
 class AnalysisStep(BaseModel):
     step: str  # 処理ステップ名
     input: str  # ステップへの入力
@@ -23,4 +48,36 @@ class ComplianceCheckResponse(BaseModel):
     status: str  # success or error
     result: Optional[dict] = None  # チェック結果
     processing_time: Optional[int] = None  # 処理時間（ms）
-    # cost_estimate: Optional[float] = None  # 推定コスト
\ No newline at end of file
+    # cost_estimate: Optional[float] = None  # 推定コスト
+
+class BatchItemResult(BaseModel):
+    index: int  # リクエストのcontents内の位置
+    status: str  # success or error
+    response: Optional[ComplianceCheckResponse] = None  # 個別のチェック結果
+    error: Optional[str] = None  # 失敗した場合のエラー内容
+    duplicate_of: Optional[int] = None  # 同一テキストの結果を共有した場合、その元の位置
+
+class BatchComplianceCheckResponse(BaseModel):
+    status: str  # success（全件成功） / partial（一部失敗） / error（全件失敗）
+    results: List[BatchItemResult]  # contentsと同じ順序の結果
+    summary: dict  # 件数（total / unique / succeeded / failed / cache_hits / verdicts）
+    token_usage: dict  # 全件の合計トークン使用量（キャッシュヒット分は含まない）
+    processing_time: Optional[int] = None  # 処理時間（ms）
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # queued / running / completed
+    total: int  # 項目数
+    completed: int  # 処理済みの項目数（成功＋失敗）
+    succeeded: int
+    failed: int
+    created_at: float  # UNIX時刻
+    updated_at: float
+    finished_at: Optional[float] = None
+
+class JobResultsResponse(BaseModel):
+    job_id: str
+    status: str
+    offset: int
+    limit: int
+    results: List[BatchItemResult]  # 処理済みの項目（位置順）
@@ -0,0 +1,92 @@
+"""
+インデックス構築コマンド（オフライン実行用）
+
+    python -m app.rag.build_index          # 公開中のバージョンを起点に差分ビルド
+    python -m app.rag.build_index --full   # 全件再構築
+
+新しいバージョンのディレクトリにビルドし、完了後にCURRENTポインタを切り替える。
+公開済みのバージョンは変更しないため、稼働中のAPIワーカーに影響しない。
+"""
+import argparse
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+from app.rag import index_artifact
+from app.rag.loaders import SOURCE_DOCS_DIR
+
+
+def build_index(full: bool = False,
+                source_docs_dir: Path = SOURCE_DOCS_DIR,
+                index_root: str = index_artifact.INDEX_ROOT) -> Dict:
+    """
+    インデックスをビルドして公開し、公開したバージョンのメタ情報を返す
+    """
+    from app.rag import vector_store
+    from app.rag.indexer import sync_index
+    from app.rag.lexical_index import build_lexical_index, save_lexical_index
+    from app.rag.vector_backend import VECTOR_BACKEND
+    from app.rag.vocabulary import build_vocabulary, save_vocabulary
+
+    start_time = time.time()
+    base_version = None if full else index_artifact.current_version(index_root)
+    # ベクトル検索バックエンドを切り替えた場合は前回のバージョンを引き継がない
+    if base_version is not None:
+        base_info = index_artifact.read_index_info(index_artifact.version_dir(base_version, index_root))
+        if base_info.get("vector_backend", "chroma") != VECTOR_BACKEND:
+            print(f"Vector backend changed ({base_info.get('vector_backend', 'chroma')} -> {VECTOR_BACKEND}), rebuilding.")
+            base_version = None
+    version = index_artifact.prepare_version(index_root, base_version=base_version)
+    target_dir = index_artifact.version_dir(version, index_root)
+    print(f"Building index version {version} (base={base_version or 'none'})...")
+
+    try:
+        vector_store.open_for_build(target_dir)
+        stats = sync_index(
+            source_docs_dir=source_docs_dir,
+            manifest_path=os.path.join(target_dir, index_artifact.MANIFEST_FILE),
+            force=full
+        )
+        # ローカル検索クエリ生成用の語彙（全チャンクから集計）
+        save_vocabulary(build_vocabulary(vector_store.iter_all_documents()), target_dir)
+        # ハイブリッド検索用の語彙索引（BM25・条文番号）
+        save_lexical_index(build_lexical_index(vector_store.iter_all_documents()), target_dir)
+        vector_store.persist()
+    except Exception:
+        # 失敗したビルドは公開せずに破棄する
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+
+    info = {
+        "version": version,
+        "base_version": base_version,
+        "embedding_model": vector_store.EMBEDDING_MODEL,
+        "vector_backend": VECTOR_BACKEND,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "build_seconds": round(time.time() - start_time, 2),
+        "chunk_count": vector_store.get_collection_count(),
+        "stats": stats,
+        "embedding": vector_store.embedding_func.report()
+    }
+    index_artifact.publish_version(version, info, index_root)
+    removed = index_artifact.prune_versions(index_root)
+    print(f"✓ Published index version {version} ({info['chunk_count']} chunks, {info['build_seconds']}s, "
+          f"{info['embedding']['docs_per_sec'] or '-'} docs/sec)")
+    if removed:
+        print(f"Removed old index versions: {', '.join(removed)}")
+    return info
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="source_docsから検索インデックスを構築する")
+    parser.add_argument("--full", action="store_true",
+                        help="前回のインデックスを引き継がずに全件再構築する")
+    args = parser.parse_args(argv)
+    return build_index(full=args.full or os.getenv("FORCE_REINDEX", "").lower() == "true")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+チャンク分割方式の比較ベンチマーク（オフライン実行用）
+
+    python -m app.rag.chunk_benchmark                            # page（従来）と sentence を比較
+    python -m app.rag.chunk_benchmark --queries 300 --top-k 5 --output chunk_benchmark.json
+
+PDF・Markdownの本文から抜き出した文をクエリにし、その文を含むチャンクが上位k件に入る割合（ヒット率）とMRRを
+分割方式ごとに測る。あわせてインデックスの大きさ（チャンク数・文字数・embeddingのバイト数・
+embeddingモデルの入力上限を超えるチャンクの割合）を比較する。
+クエリは分割方式によらず同じものを使い、検索はChromaを使わずにメモリ上のコサイン類似度で行う。
+"""
+import argparse
+import json
+import random
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from app.rag.chunker import CHUNK_STRATEGIES, split_sections
+from app.rag.loaders import SOURCE_DOCS_DIR, extract_pdf_pages, iter_source_files, load_file
+
+# クエリにする文の長さ
+QUERY_MIN_CHARS = 20
+QUERY_MAX_CHARS = 80
+
+
+def _key(text: str) -> str:
+    """包含判定用に正規化する（分割方式によって改行・空白の入り方が違うため除く）"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text))
+
+
+def sample_queries(paths: Sequence[Path], source_docs_dir: Path, n: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    各ファイルの本文から文を抜き出し、(ファイルの相対パス, 文) を n 件返す
+    PDFはページごとに抜き出す（ページをまたぐ文は従来方式のチャンクに含まれ得ないため除く）
+    """
+    candidates = []
+    for path in paths:
+        rel_path = str(path.relative_to(source_docs_dir))
+        if path.suffix.lower() == ".pdf":
+            pages = [[page] for page in extract_pdf_pages(path)]
+            join_lines = True
+        else:
+            pages = [[(None, path.read_text(encoding="utf-8"))]]
+            join_lines = False
+        for page in pages:
+            for section in split_sections(page, join_lines):
+                for sentence, _, _ in section["sentences"]:
+                    if QUERY_MIN_CHARS <= len(sentence) <= QUERY_MAX_CHARS and sentence.endswith("。"):
+                        candidates.append((rel_path, sentence))
+    candidates = list(dict.fromkeys(candidates))
+    random.Random(seed).shuffle(candidates)
+    return candidates[:n]
+
+
+def _percentile(values: List[int], q: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def evaluate(strategy: str, paths: Sequence[Path], source_docs_dir: Path,
+             queries: List[Tuple[str, str]], top_k: int, service) -> Dict:
+    """1つの分割方式でチャンクを作り、ヒット率・MRR・インデックスの大きさを測る"""
+    import numpy as np
+
+    chunks = [c for path in paths for c in load_file(path, source_docs_dir, strategy=strategy)]
+    texts = [c["content"] for c in chunks]
+    keys = [_key(t) for t in texts]
+
+    start_time = time.time()
+    doc_vectors = np.asarray(service.encode(texts), dtype=np.float32)
+    encode_seconds = time.time() - start_time
+    query_vectors = np.asarray(service.encode([q for _, q in queries]), dtype=np.float32)
+    doc_vectors /= np.linalg.norm(doc_vectors, axis=1, keepdims=True) + 1e-12
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True) + 1e-12
+    ranking = np.argsort(-(query_vectors @ doc_vectors.T), axis=1)[:, :top_k]
+
+    hits_at_1 = hits_at_k = 0
+    reciprocal_ranks = 0.0
+    unanswerable = 0
+    for (rel_path, sentence), ranked in zip(queries, ranking):
+        target = _key(sentence)
+        relevant = {i for i, c in enumerate(chunks) if c["metadata"]["path"] == rel_path and target in keys[i]}
+        if not relevant:
+            unanswerable += 1
+            continue
+        for rank, i in enumerate(ranked, 1):
+            if int(i) in relevant:
+                hits_at_k += 1
+                hits_at_1 += rank == 1
+                reciprocal_ranks += 1.0 / rank
+                break
+
+    # embeddingモデルの入力上限を超えるチャンク（超えた部分はembeddingに反映されない）
+    over_limit = None
+    try:
+        tokenizer = service.model.tokenizer
+        token_counts = [len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]]
+        over_limit = round(sum(1 for t in token_counts if t > service.max_seq_length) / max(len(texts), 1), 3)
+    except Exception as e:
+        print(f"⚠ トークン数を数えられませんでした: {e}")
+
+    lengths = [len(t) for t in texts]
+    n_queries = max(len(queries), 1)
+    return {
+        "strategy": strategy,
+        "chunks": len(chunks),
+        "total_chars": sum(lengths),
+        "mean_chars": round(sum(lengths) / max(len(lengths), 1), 1),
+        "p95_chars": _percentile(lengths, 0.95),
+        "max_chars": max(lengths, default=0),
+        "over_token_limit": over_limit,
+        "text_bytes": sum(len(t.encode("utf-8")) for t in texts),
+        "embedding_bytes": int(doc_vectors.nbytes),
+        "encode_seconds": round(encode_seconds, 2),
+        "queries": len(queries),
+        "unanswerable": unanswerable,
+        "hit_at_1": round(hits_at_1 / n_queries, 3),
+        f"hit_at_{top_k}": round(hits_at_k / n_queries, 3),
+        "mrr": round(reciprocal_ranks / n_queries, 3),
+    }
+
+
+def run_benchmark(strategies: Sequence[str] = CHUNK_STRATEGIES,
+                  source_docs_dir: Path = SOURCE_DOCS_DIR,
+                  n_queries: int = 200,
+                  top_k: int = 5,
+                  seed: int = 0) -> List[Dict]:
+    from app.rag.embedding import get_embedding_service
+
+    paths = [p for p in iter_source_files(source_docs_dir) if p.suffix.lower() in (".md", ".pdf")]
+    queries = sample_queries(paths, source_docs_dir, n_queries, seed)
+    print(f"{len(paths)} files, {len(queries)} queries")
+    service = get_embedding_service()
+    return [evaluate(strategy, paths, source_docs_dir, queries, top_k, service) for strategy in strategies]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="チャンク分割方式ごとの検索ヒット率とインデックスの大きさを比較する")
+    parser.add_argument("--strategies", nargs="+", default=list(CHUNK_STRATEGIES), choices=CHUNK_STRATEGIES)
+    parser.add_argument("--queries", type=int, default=200, help="クエリ数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.strategies, n_queries=args.queries, top_k=args.top_k, seed=args.seed)
+    columns = list(results[0].keys()) if results else []
+    for column in columns:
+        print(f"{column:>18}: " + "  ".join(f"{str(r[column]):>12}" for r in results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# PDF・Markdownのチャンク分割方式:
+# - sentence: 見出し・Q&Aの区切りと文の境界（。）に沿って、目標サイズのチャンクにまとめる
+# - page: 従来の方式（PDFは1ページ1チャンク、Markdownは "# " 見出し単位）
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "sentence")
+CHUNK_STRATEGIES = ("sentence", "page")
+# チャンクの目標文字数（embeddingモデルの入力上限 128トークンに収まる程度）
+CHUNK_TARGET_CHARS = int(os.getenv("CHUNK_TARGET_CHARS", "300"))
+# チャンクの最大文字数（これを超える文は途中で区切る）
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "500"))
+# 前のチャンクの末尾の文をこの文字数まで次のチャンクの先頭に重ねる（同じ見出しの中のみ）
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "80"))
+# これより短いチャンクは前のチャンクに併合する
+CHUNK_MIN_CHARS = int(os.getenv("CHUNK_MIN_CHARS", "50"))
+# PDFの各ページに繰り返し現れる行（ヘッダー・フッター）を除く
+CHUNK_STRIP_REPEATED_LINES = os.getenv("CHUNK_STRIP_REPEATED_LINES", "true").lower() == "true"
+# この割合以上のページに現れる行を繰り返し行とみなす（3ページ以上の場合のみ）
+REPEATED_LINE_PAGE_RATIO = 0.5
+
+# 見出しとして扱う行
+# - Markdownの見出し（見出し行自体は本文に含めない）
+_MD_HEADING = re.compile(r"^#{1,6}\s+(.+)$")
+# - 条・章・節（例: 第3条、第二章、第26条の2、基準の「第1 目的」）
+#   本文中の参照（「第36条第1項の規定に基づき」の折り返しなど）と区別するため、番号の後は行末・空白・括弧に限る
+_ARTICLE_HEADING = re.compile(
+    r"^第[0-9一二三四五六七八九十百千]+[編章節款条]?(?:の[0-9一二三四五六七八九十]+)?(?=$|\s|[（(「])")
+# - Q&Aの質問（例: Q1、Q.、問3）。回答（A、答）は質問と同じ区切りに含める
+_QUESTION_HEADING = re.compile(r"^(?:Q[0-9]*[.:\s)]|Q[0-9]+|問[0-9一二三四五六七八九十]+)", re.IGNORECASE)
+# 段落の始まりとして扱う行（箇条書き・番号付きの項目）
+_ITEM_START = re.compile(r"^(?:[・●○◆■□※\-*]|[0-9]+[.)]|\([0-9]+\)|[①-⑳]|[ア-ン][.)]|[A-ZＡ-Ｚ][.)：:]\s)")
+# 文の終わり
+_SENTENCE_END_CHARS = ("。", "！", "？", "!", "?")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+# 見出しの直前の短い行（条の見出し「目的」「定義」など）は見出しに含める
+_CAPTION_MAX_CHARS = 20
+# 見出しとして残す最大文字数（長い質問文などは切り詰める）
+_HEADING_MAX_CHARS = 60
+
+
+def chunker_signature(strategy: str = CHUNK_STRATEGY) -> Dict:
+    """インデックスのマニフェストに記録する分割設定（変わった場合は全件再構築する）"""
+    if strategy == "page":
+        return {"strategy": strategy}
+    return {
+        "strategy": strategy,
+        "target_chars": CHUNK_TARGET_CHARS,
+        "max_chars": CHUNK_MAX_CHARS,
+        "overlap_chars": CHUNK_OVERLAP_CHARS,
+        "min_chars": CHUNK_MIN_CHARS,
+        "strip_repeated_lines": CHUNK_STRIP_REPEATED_LINES,
+    }
+
+
+def _normalize(line: str) -> str:
+    return unicodedata.normalize("NFKC", line).strip()
+
+
+def _line_key(line: str) -> str:
+    """繰り返し行の判定用（「- 3 -」のようなページ番号も同じ行とみなすため数字をそろえる）"""
+    return re.sub(r"[0-9]+", "#", re.sub(r"\s+", "", _normalize(line)))
+
+
+def strip_repeated_lines(pages: List[Tuple[Optional[int], str]],
+                         ratio: float = REPEATED_LINE_PAGE_RATIO) -> List[Tuple[Optional[int], str]]:
+    """
+    ページの先頭・末尾の数行のうち、ratio 以上のページに現れる行（ヘッダー・フッター・ページ番号）を除く
+    """
+    if len(pages) < 3:
+        return pages
+    edge = 3
+    counts: Dict[str, int] = {}
+    for _, text in pages:
+        lines = [line for line in text.splitlines() if line.strip()]
+        for key in {_line_key(line) for line in lines[:edge] + lines[-edge:]}:
+            counts[key] = counts.get(key, 0) + 1
+    repeated = {key for key, count in counts.items() if count >= max(3, len(pages) * ratio)}
+    if not repeated:
+        return pages
+    stripped = []
+    for page, text in pages:
+        lines = text.splitlines()
+        body = [n for n, line in enumerate(lines) if line.strip()]
+        edges = set(body[:edge] + body[-edge:])
+        stripped.append((page, "\n".join(line for n, line in enumerate(lines)
+                                          if n not in edges or _line_key(line) not in repeated)))
+    return stripped
+
+
+def _heading_of(line: str) -> Optional[Tuple[str, str]]:
+    """
+    見出し行であれば (見出し, 本文として残す部分) を返す
+    条の行は「第3条 本文…」のように本文が続く場合があるため、番号以降を本文として残す
+    """
+    normalized = _normalize(line)
+    m = _MD_HEADING.match(normalized)
+    if m:
+        return m.group(1).strip(), ""
+    m = _ARTICLE_HEADING.match(normalized)
+    if m:
+        if len(normalized) <= _CAPTION_MAX_CHARS * 2 and not normalized.endswith("。"):
+            return normalized, ""
+        return m.group(0), line.strip()[len(m.group(0)):].strip()
+    if _QUESTION_HEADING.match(normalized):
+        return normalized[:_HEADING_MAX_CHARS], line.strip()
+    return None
+
+
+def _is_caption(line: str) -> bool:
+    """条の見出しの前に置かれる短い行（「目的」「（誇大広告等）」など）か"""
+    normalized = _normalize(line)
+    if normalized.startswith("(") and normalized.endswith(")"):
+        return len(normalized) <= _HEADING_MAX_CHARS
+    return len(normalized) <= _CAPTION_MAX_CHARS
+
+
+def _join(left: str, right: str) -> str:
+    """PDFの行の折り返しをつなぐ（英数字同士の場合のみ空白を入れる）"""
+    if left and right and left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return f"{left} {right}"
+    return left + right
+
+
+def split_sections(pages: Iterable[Tuple[Optional[int], str]], join_lines: bool = True) -> List[Dict]:
+    """
+    テキストを見出しごとの区切り（セクション）に分け、各セクションを文に分割する
+    pages: [(ページ番号 または None, テキスト), ...]
+    戻り値: [{"heading": str, "sentences": [(文, ページ番号, 段落の先頭か), ...]}, ...]
+    空行・箇条書きの行頭・見出しで段落を区切る。
+    join_lines=True（PDF）の場合は行の折り返しをつなぎ、False（Markdown）の場合は1行を1段落とする。
+    """
+    lines: List[Tuple[str, Optional[int]]] = []
+    for page, text in pages:
+        lines.extend((line, page) for line in text.splitlines())
+
+    sections: List[Dict] = [{"heading": "", "sentences": []}]
+    buffer, buffer_page = "", None
+    paragraph_start = True
+
+    def flush(paragraph_end: bool = True):
+        nonlocal buffer, buffer_page, paragraph_start
+        if buffer.strip():
+            sections[-1]["sentences"].append((buffer.strip(), buffer_page, paragraph_start))
+            paragraph_start = False
+        buffer, buffer_page = "", None
+        if paragraph_end:
+            paragraph_start = True
+
+    for n, (line, page) in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            flush()
+            continue
+        heading = _heading_of(stripped)
+        # 条の見出しの直前の短い行（「目的」など）は見出しに含める
+        if heading is None and n + 1 < len(lines) and _is_caption(stripped) \
+                and not stripped.endswith(_SENTENCE_END_CHARS) and not _ITEM_START.match(_normalize(stripped)) \
+                and _ARTICLE_HEADING.match(_normalize(lines[n + 1][0])):
+            flush()
+            if sections[-1]["sentences"] or not sections[-1]["heading"]:
+                sections.append({"heading": "", "sentences": []})
+            sections[-1]["heading"] = f"{sections[-1]['heading']} {stripped}".strip()
+            continue
+        if heading is not None:
+            flush()
+            title, body = heading
+            if sections[-1]["sentences"] or not sections[-1]["heading"]:
+                sections.append({"heading": title, "sentences": []})
+            else:
+                # 本文のない見出しが続く場合（章と条など）は1つの見出しにまとめる
+                sections[-1]["heading"] = f"{sections[-1]['heading']} {title}"
+            if not body:
+                continue
+            stripped = body
+        elif not join_lines or _ITEM_START.match(_normalize(stripped)):
+            flush()
+
+        for piece in _SENTENCE_END.split(stripped):
+            if not piece:
+                continue
+            if not buffer:
+                buffer_page = page
+            buffer = _join(buffer, piece)
+            if piece.endswith(_SENTENCE_END_CHARS):
+                flush(paragraph_end=False)
+    flush()
+    return [s for s in sections if s["sentences"] or s["heading"]]
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """max_chars を超える文を読点・空白の位置で（なければ文字数で）区切る"""
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = max(sentence.rfind("、", 0, max_chars), sentence.rfind(" ", 0, max_chars))
+        cut = cut + 1 if cut > max_chars // 2 else max_chars
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def pack_sentences(sentences: List[Tuple[str, Optional[int], bool]],
+                   target_chars: int = CHUNK_TARGET_CHARS,
+                   max_chars: int = CHUNK_MAX_CHARS,
+                   overlap_chars: int = CHUNK_OVERLAP_CHARS,
+                   min_chars: int = CHUNK_MIN_CHARS) -> List[Dict]:
+    """
+    1セクション分の文を目標サイズのチャンクにまとめる（段落の先頭の文の前では改行する）
+    sentences: [(文, ページ番号, 段落の先頭か), ...]
+    戻り値: [{"text": str, "page_start": int|None, "page_end": int|None}, ...]
+    """
+    units = [(piece, page, starts and n == 0)
+             for sentence, page, starts in sentences
+             for n, piece in enumerate(_split_long(sentence, max_chars))]
+    chunks: List[List[Tuple[str, Optional[int], bool]]] = []
+    current: List[Tuple[str, Optional[int], bool]] = []
+    size = 0
+    fresh = False  # current に前のチャンクと重ならない文が含まれるか
+    for unit in units:
+        if current and fresh and size + len(unit[0]) > target_chars:
+            chunks.append(current)
+            # 末尾の文を overlap_chars まで次のチャンクに重ねる
+            tail: List[Tuple[str, Optional[int], bool]] = []
+            tail_size = 0
+            for prev in reversed(current):
+                if tail_size + len(prev[0]) > overlap_chars:
+                    break
+                tail.insert(0, prev)
+                tail_size += len(prev[0])
+            if tail_size + len(unit[0]) > max_chars:
+                tail, tail_size = [], 0
+            current, size, fresh = tail, tail_size, False
+        current.append(unit)
+        size += len(unit[0])
+        fresh = True
+    if current and fresh:
+        chunks.append(current)
+
+    # 短すぎる末尾のチャンクは前のチャンクに併合する
+    if len(chunks) >= 2:
+        last_size = sum(len(u[0]) for u in chunks[-1])
+        prev_texts = {u[0] for u in chunks[-2]}
+        extra = [u for u in chunks[-1] if u[0] not in prev_texts]
+        if last_size < min_chars and sum(len(u[0]) for u in chunks[-2] + extra) <= max_chars:
+            chunks[-2] = chunks[-2] + extra
+            chunks.pop()
+
+    result = []
+    for chunk in chunks:
+        pages = [page for _, page, _ in chunk if page is not None]
+        result.append({
+            "text": "".join(f"\n{text}" if starts and n else text for n, (text, _, starts) in enumerate(chunk)),
+            "page_start": min(pages) if pages else None,
+            "page_end": max(pages) if pages else None,
+        })
+    return result
+
+
+def chunk_text(pages: Iterable[Tuple[Optional[int], str]],
+               join_lines: bool = True,
+               strip_repeated: bool = CHUNK_STRIP_REPEATED_LINES,
+               target_chars: int = CHUNK_TARGET_CHARS,
+               max_chars: int = CHUNK_MAX_CHARS,
+               overlap_chars: int = CHUNK_OVERLAP_CHARS,
+               min_chars: int = CHUNK_MIN_CHARS) -> List[Dict]:
+    """
+    テキストを見出し・文の境界に沿ってチャンクに分割する
+    各チャンクの先頭には見出しを付ける（embeddingとLLMに文脈を渡すため）
+    PDF（join_lines=True）は、先に各ページに繰り返し現れるヘッダー・フッターを除く
+    戻り値: [{"text", "heading", "page_start", "page_end", "chunk"}, ...]（chunk は見出し内の連番）
+    """
+    if strip_repeated and join_lines:
+        pages = strip_repeated_lines(list(pages))
+    results = []
+    sections = split_sections(pages, join_lines)
+    carry, carry_page = "", None
+    for i, section in enumerate(sections):
+        heading = section["heading"]
+        packed = pack_sentences(section["sentences"], target_chars, max_chars, overlap_chars, min_chars)
+        if not packed:
+            continue
+        body = "".join(text for text, _, _ in section["sentences"])
+        # 本文が min_chars に満たない区切り（文書の表題だけの行など）は次の区切りの先頭に付ける
+        if len(body) < min_chars and i + 1 < len(sections):
+            carry = "\n".join(t for t in (carry, heading, body) if t)
+            carry_page = carry_page if carry_page is not None else packed[0]["page_start"]
+            continue
+        for n, piece in enumerate(packed):
+            text = piece["text"]
+            if heading and not _normalize(text).startswith(heading):
+                text = f"{heading}\n{text}"
+            page_start = piece["page_start"]
+            if n == 0 and carry:
+                text = f"{carry}\n{text}"
+                page_start = carry_page if carry_page is not None else page_start
+                carry, carry_page = "", None
+            results.append({"text": text, "heading": heading, "page_start": page_start,
+                            "page_end": piece["page_end"], "chunk": n})
+    return results
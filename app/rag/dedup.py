@@ -0,0 +1,137 @@
+import base64
+import json
+import os
+import random
+import re
+import struct
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# インデックス構築時に近似重複のチャンクを1つにまとめる
+NEAR_DUPLICATE_DEDUP = os.getenv("NEAR_DUPLICATE_DEDUP", "true").lower() == "true"
+# 推定Jaccard類似度（文字shingle集合）がこの値以上のチャンクを重複とみなす
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+# 重複判定の対象（条文XMLは条項ごとに別の根拠となるため対象外）
+DEDUP_SOURCE_TYPES = tuple(t for t in os.getenv("DEDUP_SOURCE_TYPES", "pdf,md").split(",") if t)
+
+# MinHashの設定
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+# LSHのバンド数（1バンドあたり MINHASH_PERMUTATIONS / LSH_BANDS 行）
+LSH_BANDS = 16
+
+# (a * x + b) mod p のハッシュ族（乱数の種を固定し、ビルドをまたいで同じ署名になるようにする）
+_PRIME = 4294967311
+_rng = random.Random(20240601)
+_HASH_PARAMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+_WHITESPACE = re.compile(r"\s+")
+
+
+def dedup_signature() -> Dict:
+    """インデックスのマニフェストに記録する重複判定の設定（変わった場合は全件再構築する）"""
+    return {
+        "enabled": NEAR_DUPLICATE_DEDUP,
+        "threshold": NEAR_DUPLICATE_THRESHOLD,
+        "source_types": list(DEDUP_SOURCE_TYPES),
+        "shingle_size": SHINGLE_SIZE,
+        "permutations": MINHASH_PERMUTATIONS,
+    }
+
+
+def is_dedup_target(chunk: Dict) -> bool:
+    return NEAR_DUPLICATE_DEDUP and chunk.get("metadata", {}).get("source_type") in DEDUP_SOURCE_TYPES
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """NFKC正規化して空白を除いた文字列の文字shingle（PDFの改行位置の違いを無視するため空白は除く）"""
+    t = _WHITESPACE.sub("", unicodedata.normalize("NFKC", text))
+    if len(t) <= size:
+        return {t}
+    return {t[i:i + size] for i in range(len(t) - size + 1)}
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """文字shingle集合のMinHash（32bit整数 × MINHASH_PERMUTATIONS）"""
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles(text)]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _HASH_PARAMS)
+
+
+def encode_signature(signature: Sequence[int]) -> str:
+    """マニフェストに保存するためにbase64の文字列にする"""
+    return base64.b64encode(struct.pack(f"<{len(signature)}I", *signature)).decode("ascii")
+
+
+def decode_signature(encoded: str) -> Tuple[int, ...]:
+    data = base64.b64decode(encoded)
+    return struct.unpack(f"<{len(data) // 4}I", data)
+
+
+def estimate_jaccard(a: Sequence[int], b: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class NearDuplicateIndex:
+    """
+    MinHashのLSH（バンド分割）による近似重複の検索
+    同じバンドのハッシュを持つ候補だけを比較し、推定Jaccard類似度が threshold 以上のものを重複とする
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, bands: int = LSH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def _keys(self, signature: Sequence[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+        rows = len(signature) // self.bands
+        return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def find(self, signature: Sequence[int]) -> Optional[str]:
+        """重複とみなす登録済みのチャンクID（最も類似度が高いもの、同じ場合は先に登録したもの）"""
+        best, best_score = None, self.threshold
+        seen = set()
+        for key in self._keys(signature):
+            for chunk_id in self.buckets.get(key, []):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                score = estimate_jaccard(signature, self.signatures[chunk_id])
+                if score > best_score or (score == best_score and best is None):
+                    best, best_score = chunk_id, score
+        return best
+
+    def add(self, chunk_id: str, signature: Sequence[int]):
+        self.signatures[chunk_id] = signature
+        for key in self._keys(signature):
+            self.buckets.setdefault(key, []).append(chunk_id)
+
+
+def find_duplicates(signatures: Iterable[Tuple[str, str]],
+                    threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Dict[str, str]:
+    """
+    (チャンクID, エンコード済みMinHash) を順に見て、先に出たチャンクと近似重複するものを返す
+    戻り値: {重複チャンクID: 残すチャンクID}
+    順序が同じなら結果も同じになるため、差分ビルドでも残すチャンクは変わらない
+    """
+    index = NearDuplicateIndex(threshold)
+    duplicates = {}
+    for chunk_id, encoded in signatures:
+        signature = decode_signature(encoded)
+        canonical = index.find(signature)
+        if canonical is not None:
+            duplicates[chunk_id] = canonical
+        else:
+            index.add(chunk_id, signature)
+    return duplicates
+
+
+def source_metadata(own_path: str, duplicate_paths: List[str]) -> Dict:
+    """
+    まとめたチャンクのメタデータ（Chromaのメタデータはリストを持てないためJSON文字列にする）
+    sources: 出典ファイルの一覧（自身のファイルが先頭）、duplicate_count: まとめた重複チャンクの数
+    """
+    return {
+        "sources": json.dumps(list(dict.fromkeys([own_path, *duplicate_paths])), ensure_ascii=False),
+        "duplicate_count": len(duplicate_paths),
+    }
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# ★ 日本語対応の多言語embeddingモデル
+# paraphrase-multilingual-MiniLM-L12-v2 は50言語以上に対応し、日本語のセマンティック検索が可能
+EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+# encodeのバッチサイズ
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# トークナイザの最大長（MiniLMの学習時の上限は128）
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "128"))
+# CPUスレッド数（0の場合はtorchのデフォルト）
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# 推論バックエンド: torch / onnx
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# 推論精度: float32 / bfloat16 / int8（torchの動的量子化、onnxの場合は量子化済みモデル）
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+
+# APIサーバーの起動時（FastAPIのlifespan）にモデルを読み込む（falseの場合は最初のencode時）
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "true").lower() == "true"
+
+# onnxバックエンドでint8を指定した場合に読み込む量子化済みモデル
+ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+
+class EmbeddingService:
+    """
+    SentenceTransformerモデルのembedding処理をまとめたサービス
+    ChromaDBのEmbeddingFunctionとしてもそのまま渡せる（__call__(input) を実装）。
+    モデルは初回のencode時に読み込む。
+    """
+
+    def __init__(self,
+                 model_name: str = EMBEDDING_MODEL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_seq_length: int = EMBEDDING_MAX_SEQ_LENGTH,
+                 num_threads: int = EMBEDDING_THREADS,
+                 backend: str = EMBEDDING_BACKEND,
+                 dtype: str = EMBEDDING_DTYPE,
+                 model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_seq_length = max_seq_length
+        self.num_threads = num_threads
+        self.backend = backend
+        self.dtype = dtype
+        self._model = model
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "docs": 0, "seconds": 0.0, "cache_hits": 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        start_time = time.time()
+        if self.num_threads > 0:
+            import torch
+            torch.set_num_threads(self.num_threads)
+
+        model = None
+        if self.backend == "onnx":
+            try:
+                model_kwargs = {"file_name": ONNX_INT8_FILE} if self.dtype == "int8" else None
+                model = SentenceTransformer(self.model_name, backend="onnx", model_kwargs=model_kwargs)
+            except Exception as e:
+                print(f"⚠ ONNXバックエンドの読み込みに失敗したためtorchで実行します: {e}")
+
+        if model is None:
+            model = SentenceTransformer(self.model_name, device="cpu")
+            if self.dtype == "int8":
+                import torch
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif self.dtype == "bfloat16":
+                import torch
+                model = model.to(torch.bfloat16)
+
+        model.max_seq_length = self.max_seq_length
+        print(f"✓ Embedding model loaded: {self.model_name} "
+              f"(backend={self.backend}, dtype={self.dtype}, max_seq_length={self.max_seq_length}, "
+              f"{time.time() - start_time:.2f}s)")
+        return model
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """
+        テキストをまとめてembeddingする
+        （SentenceTransformer.encode内でテキスト長順にソートしてからバッチ化されるため、パディングの無駄が少ない）
+        """
+        if not texts:
+            return []
+        start_time = time.time()
+        embeddings = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        elapsed = time.time() - start_time
+
+        self.stats["calls"] += 1
+        self.stats["docs"] += len(texts)
+        self.stats["seconds"] += elapsed
+        if len(texts) > 1:
+            print(f"Embedded {len(texts)} docs in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} docs/sec)")
+        return embeddings.astype("float32").tolist()
+
+    @property
+    def model_key(self) -> str:
+        """embeddingキャッシュのキー（同じモデルでも精度・バックエンドが違えばベクトルが変わるため含める）"""
+        return f"{self.model_name}:{self.backend}:{self.dtype}:{self.max_seq_length}"
+
+    def encode_documents(self, texts: List[str], cache=None) -> List[List[float]]:
+        """
+        インデックス用のembedding。キャッシュにあるものはそれを使い、ミスしたものだけモデルで計算する
+        """
+        if cache is None:
+            from app.rag.embedding_cache import get_embedding_cache
+            cache = get_embedding_cache()
+        if cache is None:
+            return self.encode(texts)
+
+        hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+        cached = cache.get_many(self.model_key, hashes)
+        misses = {}
+        for text, content_hash in zip(texts, hashes):
+            if content_hash not in cached:
+                misses.setdefault(content_hash, text)
+        self.stats["cache_hits"] += len(texts) - len(misses)
+
+        if misses:
+            vectors = self.encode(list(misses.values()))
+            computed = dict(zip(misses.keys(), vectors))
+            cache.put_many(self.model_key, computed.items())
+            cached.update(computed)
+        print(f"Embedding cache: {len(texts) - len(misses)} hits / {len(misses)} misses")
+        return [cached[h] for h in hashes]
+
+    def docs_per_second(self) -> Optional[float]:
+        if not self.stats["seconds"]:
+            return None
+        return self.stats["docs"] / self.stats["seconds"]
+
+    def report(self) -> Dict:
+        """累計のembedding処理量（インデックス構築のログ用）"""
+        rate = self.docs_per_second()
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "dtype": self.dtype,
+            "batch_size": self.batch_size,
+            "docs": self.stats["docs"],
+            "cache_hits": self.stats["cache_hits"],
+            "seconds": round(self.stats["seconds"], 2),
+            "docs_per_sec": round(rate, 1) if rate else None,
+        }
+
+    # ChromaDB EmbeddingFunction インターフェース
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.encode(input)
+
+
+_default_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """プロセス内で共有するEmbeddingServiceを返す"""
+    global _default_service
+    if _default_service is None:
+        _default_service = EmbeddingService()
+    return _default_service
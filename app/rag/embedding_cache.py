@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# ディスク上のembeddingキャッシュ (model_key, 本文のsha256) → ベクトル
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite3")
+# 保持する最大件数。超過した場合は最終利用時刻の古いものから削除する
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# 削除時は上限の90%まで減らし、毎回の削除を避ける
+_EVICT_TARGET_RATIO = 0.9
+# SQLiteの変数上限を超えないように分割して問い合わせる
+_QUERY_CHUNK = 500
+
+
+class EmbeddingCache:
+    """
+    SQLiteによる永続embeddingキャッシュ
+    再インデックス時に変更のないチャンクの再embeddingを避けるために使う。
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model_key TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_key, content_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, model_key: str, content_hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """キャッシュ済みのベクトルを {content_hash: vector} で返す（ヒットしたものの最終利用時刻を更新する）"""
+        found: Dict[str, List[float]] = {}
+        unique_hashes = list(dict.fromkeys(content_hashes))
+        with self._lock:
+            for i in range(0, len(unique_hashes), _QUERY_CHUNK):
+                part = unique_hashes[i:i + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings "
+                    f"WHERE model_key = ? AND content_hash IN ({placeholders})",
+                    [model_key, *part]
+                ).fetchall()
+                for content_hash, blob in rows:
+                    found[content_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model_key = ? AND content_hash = ?",
+                    [(now, model_key, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model_key: str, items: Iterable):
+        """(content_hash, vector) の組を保存し、上限を超えていれば古いものを削除する"""
+        now = time.time()
+        rows = []
+        for content_hash, vector in items:
+            arr = np.asarray(vector, dtype=np.float32)
+            rows.append((model_key, content_hash, arr.shape[0], arr.tobytes(), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_key, content_hash, dim, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict_locked()
+
+    def _evict_locked(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        remove = count - int(self.max_entries * _EVICT_TARGET_RATIO)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC, rowid ASC LIMIT ?)",
+            (remove,)
+        )
+        self._conn.commit()
+        print(f"Embedding cache evicted {remove} entries (max={self.max_entries})")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """プロセス内で共有するキャッシュを返す。EMBEDDING_CACHE_PATHが空の場合は無効"""
+    global _default_cache
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# バージョン付きインデックス成果物の配置
+# data/index/
+#   CURRENT              … 公開中のバージョン名
+#   20260101120000/      … 1バージョン分の成果物（公開後は変更しない）
+#     chroma_db/
+#     manifest.json
+#     index_info.json
+INDEX_ROOT = os.getenv("INDEX_ROOT", "./data/index")
+CURRENT_POINTER = "CURRENT"
+INDEX_INFO_FILE = "index_info.json"
+MANIFEST_FILE = "manifest.json"
+CHROMA_DIR = "chroma_db"
+
+# 公開中のもの以外に残しておく旧バージョン数（稼働中のワーカーが参照している可能性があるため）
+KEEP_OLD_VERSIONS = 2
+
+
+def current_version(index_root: str = INDEX_ROOT) -> Optional[str]:
+    """公開中のインデックスバージョン名を返す。未構築の場合はNone"""
+    pointer = os.path.join(index_root, CURRENT_POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        version = f.read().strip()
+    if not version or not os.path.isdir(os.path.join(index_root, version)):
+        return None
+    return version
+
+
+def version_dir(version: str, index_root: str = INDEX_ROOT) -> str:
+    return os.path.join(index_root, version)
+
+
+def current_index_dir(index_root: str = INDEX_ROOT) -> Optional[str]:
+    """公開中のインデックスディレクトリを返す。未構築の場合はNone"""
+    version = current_version(index_root)
+    return version_dir(version, index_root) if version else None
+
+
+def read_index_info(index_dir: str) -> Dict:
+    """インデックスのメタ情報（バージョン・モデル・チャンク数など）を読み込む"""
+    path = os.path.join(index_dir, INDEX_INFO_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def new_version_name() -> str:
+    return datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+
+def prepare_version(index_root: str = INDEX_ROOT, base_version: Optional[str] = None) -> str:
+    """
+    新しいバージョンの作業ディレクトリを作成する。
+    base_versionが指定された場合はその成果物をコピーし、差分ビルドの起点にする。
+    """
+    version = new_version_name()
+    target = version_dir(version, index_root)
+    os.makedirs(index_root, exist_ok=True)
+    if base_version:
+        shutil.copytree(version_dir(base_version, index_root), target)
+        # 旧バージョンのメタ情報は引き継がない
+        info_path = os.path.join(target, INDEX_INFO_FILE)
+        if os.path.exists(info_path):
+            os.remove(info_path)
+    else:
+        os.makedirs(target)
+    return version
+
+
+def publish_version(version: str, info: Dict, index_root: str = INDEX_ROOT):
+    """
+    メタ情報を書き込み、CURRENTポインタを新バージョンにアトミックに切り替える
+    """
+    target = version_dir(version, index_root)
+    with open(os.path.join(target, INDEX_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    pointer = os.path.join(index_root, CURRENT_POINTER)
+    tmp_pointer = f"{pointer}.tmp"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_pointer, pointer)
+
+
+def list_versions(index_root: str = INDEX_ROOT) -> List[str]:
+    if not os.path.isdir(index_root):
+        return []
+    return sorted(
+        name for name in os.listdir(index_root)
+        if os.path.isdir(os.path.join(index_root, name))
+    )
+
+
+def prune_versions(index_root: str = INDEX_ROOT, keep: int = KEEP_OLD_VERSIONS) -> List[str]:
+    """公開中のバージョンと直近の旧バージョンを残し、それ以外を削除する"""
+    current = current_version(index_root)
+    old_versions = [v for v in list_versions(index_root) if v != current]
+    removed = old_versions[:-keep] if keep else old_versions
+    for version in removed:
+        shutil.rmtree(version_dir(version, index_root), ignore_errors=True)
+    return removed
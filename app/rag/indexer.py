@@ -0,0 +1,214 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from app.rag.chunker import chunker_signature
+from app.rag.dedup import dedup_signature, encode_signature, find_duplicates, is_dedup_target, minhash, source_metadata
+from app.rag.ingest import iter_loaded_files
+from app.rag.loaders import SOURCE_DOCS_DIR, content_sha256, file_sha256, iter_source_files, load_file
+
+# ファイル単位・チャンク単位のハッシュ（と近似重複判定用のMinHash）を記録するマニフェストの形式バージョン
+MANIFEST_VERSION = 2
+# パース済みチャンクをこの件数ごとにまとめてembedding・upsertする
+UPSERT_BATCH_SIZE = 256
+
+
+def load_manifest(manifest_path: str) -> Dict:
+    """マニフェストを読み込む。存在しない・壊れている場合は空のマニフェストを返す"""
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except Exception as e:
+            print(f"⚠ マニフェストの読み込みに失敗しました: {e}")
+    return {"version": MANIFEST_VERSION, "embedding_model": None, "chunker": None, "dedup": None,
+            "files": {}, "duplicates": {}}
+
+
+def save_manifest(manifest: Dict, manifest_path: str):
+    """マニフェストを一時ファイル経由で書き込む（書き込み途中のクラッシュで壊さないため）"""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def diff_chunks(old_chunks: Dict[str, str], new_chunks: List[Dict]):
+    """
+    旧チャンク {id: content_hash} と新チャンク一覧を比較し、
+    (upsert対象チャンク, 削除対象ID) を返す
+    """
+    new_ids = set()
+    to_upsert = []
+    for chunk in new_chunks:
+        new_ids.add(chunk["id"])
+        if old_chunks.get(chunk["id"]) != chunk["content_hash"]:
+            to_upsert.append(chunk)
+    to_delete = [chunk_id for chunk_id in old_chunks if chunk_id not in new_ids]
+    return to_upsert, to_delete
+
+
+def _duplicate_sources(files: Dict[str, Dict], duplicates: Dict[str, str]) -> Dict[str, List[str]]:
+    """残すチャンクID → まとめた重複チャンクのファイルの一覧"""
+    chunk_paths = {chunk_id: rel_path for rel_path, entry in files.items() for chunk_id in entry["chunks"]}
+    sources: Dict[str, List[str]] = {}
+    for duplicate_id, canonical_id in duplicates.items():
+        sources.setdefault(canonical_id, []).append(chunk_paths[duplicate_id])
+    return sources
+
+
+def sync_index(manifest_path: str,
+               source_docs_dir: Path = SOURCE_DOCS_DIR,
+               force: bool = False) -> Dict:
+    """
+    source_docsとベクトルストアを差分同期する。
+    変更されたファイルのみ並列にパースし、内容が変わったチャンクのみembedding・upsertする。
+    消えたファイル・チャンクはベクトルストアから削除する。
+    チャンクはファイルごとにパースした時点でupsertし、メモリにはチャンクIDとハッシュ（MinHash）だけを残す。
+    PDF・Markdownのチャンクは近似重複（app/rag/dedup.py）を判定し、重複は先に出たチャンク1つにまとめて保存する
+    （メタデータ sources に出典ファイルの一覧を残す）。判定は全ファイルのMinHashがそろってから行うため、
+    重複と判定されたチャンクはupsertした後に削除し、出典の一覧はメタデータの更新で反映する。
+    """
+    from app.rag import vector_store
+
+    manifest = load_manifest(manifest_path)
+    old_files = manifest["files"]
+    old_duplicates = manifest.get("duplicates", {})
+    expected_count = sum(len(entry["chunks"]) for entry in old_files.values()) - len(old_duplicates)
+
+    # モデル・チャンク分割・重複判定の設定の変更、DB消失、強制指定の場合はフル再構築
+    if (force or manifest.get("embedding_model") != vector_store.EMBEDDING_MODEL
+            or manifest.get("chunker") != chunker_signature()
+            or manifest.get("dedup") != dedup_signature()
+            or vector_store.get_collection_count() != expected_count):
+        print("Full re-index required (model, chunker or dedup settings changed, store out of sync, or forced).")
+        vector_store.reset_vector_store()
+        old_files, old_duplicates = {}, {}
+
+    stats = {"files_scanned": 0, "files_parsed": 0, "files_removed": 0,
+             "chunks_upserted": 0, "chunks_deleted": 0, "chunks_total": 0, "chunks_collapsed": 0}
+    new_files: Dict[str, Dict] = {}
+    changed_files: Dict[Path, str] = {}
+    # 重複判定はこの順序（ファイルの走査順・ファイル内のチャンク順）で行い、先に出たチャンクを残す
+    scan_order: Dict[str, Path] = {}
+
+    if not source_docs_dir.exists():
+        print(f"Directory not found: {source_docs_dir}")
+        return stats
+
+    # 1. ファイルハッシュで変更の有無を判定（パースは行わない）
+    for path in iter_source_files(source_docs_dir):
+        rel_path = str(path.relative_to(source_docs_dir))
+        scan_order[rel_path] = path
+        stats["files_scanned"] += 1
+        try:
+            file_hash = file_sha256(path)
+        except Exception as e:
+            print(f"Error hashing {path}: {e}")
+            if rel_path in old_files:
+                new_files[rel_path] = old_files[rel_path]
+            continue
+        old_entry = old_files.get(rel_path)
+        if old_entry and old_entry["sha256"] == file_hash:
+            new_files[rel_path] = old_entry
+        else:
+            changed_files[path] = file_hash
+
+    stats["files_removed"] = sum(1 for rel_path in old_files if rel_path not in scan_order)
+
+    pending: List[Dict] = []
+    # upsertしたチャンクのID（重複と判定されたものは後で削除する）
+    upserted = set()
+
+    def flush(force_flush: bool = False):
+        while pending and (force_flush or len(pending) >= UPSERT_BATCH_SIZE):
+            batch = pending[:UPSERT_BATCH_SIZE]
+            del pending[:UPSERT_BATCH_SIZE]
+            vector_store.upsert_documents(batch)
+            upserted.update(c["id"] for c in batch)
+
+    # 2. 変更されたファイルを並列にパースし、内容が変わったチャンクをファイルごとにupsertする
+    #    重複判定の対象のチャンクは、まとめた出典がまだ分からないため自身の出典だけを付けておく
+    for path, chunks in iter_loaded_files(changed_files.keys(), source_docs_dir):
+        rel_path = str(path.relative_to(source_docs_dir))
+        old_entry = old_files.get(rel_path)
+        if chunks is None:
+            # 読み込みに失敗したファイルは前回の状態を維持する
+            if old_entry:
+                new_files[rel_path] = old_entry
+            continue
+
+        stats["files_parsed"] += 1
+        for chunk in chunks:
+            chunk["content_hash"] = content_sha256(chunk["content"])
+        upserts, _ = diff_chunks(old_entry["chunks"] if old_entry else {}, chunks)
+        for chunk in upserts:
+            if is_dedup_target(chunk):
+                chunk["metadata"].update(source_metadata(rel_path, []))
+        pending.extend(upserts)
+        new_files[rel_path] = {
+            "sha256": changed_files[path],
+            "chunks": {c["id"]: c["content_hash"] for c in chunks},
+            "signatures": {c["id"]: encode_signature(minhash(c["content"])) for c in chunks if is_dedup_target(c)}
+        }
+        flush()
+    flush(force_flush=True)
+
+    # 3. 近似重複の判定
+    duplicates = find_duplicates(
+        (chunk_id, signature)
+        for rel_path in scan_order if rel_path in new_files
+        for chunk_id, signature in new_files[rel_path].get("signatures", {}).items()
+    )
+    old_stored = {c for entry in old_files.values() for c in entry["chunks"]} - set(old_duplicates)
+    new_stored = {c for entry in new_files.values() for c in entry["chunks"]} - set(duplicates)
+    old_sources = _duplicate_sources(old_files, old_duplicates)
+    new_sources = _duplicate_sources(new_files, duplicates)
+    chunk_paths = {chunk_id: rel_path for rel_path, entry in new_files.items() for chunk_id in entry["chunks"]}
+
+    # 4. 重複から残す側に変わったチャンクが変更のないファイルにある場合（まとめ先のチャンクが消えた場合など）は、
+    #    そのファイルを読み直してupsertする
+    missing = (new_stored - old_stored) - upserted
+    for rel_path in sorted({chunk_paths[c] for c in missing}):
+        for chunk in load_file(scan_order[rel_path], source_docs_dir):
+            if chunk["id"] in missing:
+                chunk["metadata"].update(source_metadata(rel_path, new_sources.get(chunk["id"], [])))
+                pending.append(chunk)
+        flush()
+    flush(force_flush=True)
+    stats["chunks_upserted"] = len(upserted & new_stored)
+
+    # まとめた重複が変わったチャンクはメタデータのみ更新する（今回upsertしたチャンクは自身の出典だけで保存している）
+    source_updates = {}
+    for c in new_stored:
+        if c in upserted:
+            changed = bool(new_sources.get(c)) and c not in missing
+        else:
+            changed = c in old_stored and new_sources.get(c) != old_sources.get(c)
+        if changed:
+            source_updates[c] = source_metadata(chunk_paths[c], new_sources.get(c, []))
+    if source_updates:
+        vector_store.update_metadatas(source_updates)
+
+    # 5. 消えたチャンクと、重複としてまとめたチャンクを削除する
+    to_delete = sorted((old_stored | upserted) - new_stored)
+    if to_delete:
+        vector_store.delete_documents(to_delete)
+
+    stats["chunks_deleted"] = len(to_delete)
+    stats["chunks_total"] = len(new_stored)
+    stats["chunks_collapsed"] = len(duplicates)
+
+    manifest["embedding_model"] = vector_store.EMBEDDING_MODEL
+    manifest["chunker"] = chunker_signature()
+    manifest["dedup"] = dedup_signature()
+    manifest["files"] = new_files
+    manifest["duplicates"] = duplicates
+    save_manifest(manifest, manifest_path)
+
+    print(f"Index sync complete: {stats}")
+    return stats
@@ -0,0 +1,104 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.rag.loaders import (
+    SOURCE_DOCS_DIR,
+    assign_chunk_ids,
+    chunk_pdf_pages,
+    extract_pdf_pages,
+    load_file,
+    pdf_page_count,
+)
+
+# 並列取り込みのワーカープロセス数（1以下で逐次処理）
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# 大きなPDFはこのページ数ごとに分割して並列に抽出する
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+
+def _plan_tasks(paths: Iterable[Path]) -> List[Tuple[Path, Optional[Tuple[int, int]]]]:
+    """ファイル単位のタスクを作成する。大きなPDFはページ範囲ごとのタスクに分割する"""
+    tasks = []
+    for path in paths:
+        if path.suffix.lower() == ".pdf":
+            try:
+                page_count = pdf_page_count(path)
+            except Exception as e:
+                print(f"Error reading PDF {path}: {e}")
+                continue
+            if page_count > PDF_PAGES_PER_TASK:
+                for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                    tasks.append((path, (start, start + PDF_PAGES_PER_TASK)))
+                continue
+        tasks.append((path, None))
+    return tasks
+
+
+def _load_task(path: Path, page_range: Optional[Tuple[int, int]], source_docs_dir: Path) -> List:
+    """
+    ワーカープロセスで実行されるパース処理
+    ページ範囲のタスクはテキストの抽出のみ行う（チャンクがページ範囲の境界で切れないよう、分割は全ページが揃ってから行う）
+    """
+    if page_range is not None:
+        return extract_pdf_pages(path, page_range=page_range)
+    return load_file(path, source_docs_dir)
+
+
+def iter_loaded_files(paths: Iterable[Path],
+                      source_docs_dir: Path = SOURCE_DOCS_DIR,
+                      max_workers: int = INGEST_WORKERS) -> Iterator[Tuple[Path, Optional[List[Dict]]]]:
+    """
+    ファイルをプロセスプールで並列にパースし、完了したファイルから順に (path, chunks) を返す。
+    全ファイルのチャンクをメモリに溜めず、ファイル単位でストリームする。
+    パースに失敗したファイルは chunks=None で返す。
+    """
+    paths = list(paths)
+    if max_workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            try:
+                yield path, load_file(path, source_docs_dir)
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                yield path, None
+        return
+
+    tasks = _plan_tasks(paths)
+    # ページ分割したPDFは全パートのテキストが揃ってから分割して返す
+    pending_parts: Dict[Path, int] = {}
+    partial: Dict[Path, List[Tuple[int, List[Tuple[int, str]]]]] = {}
+    failed = set()
+    for path, page_range in tasks:
+        if page_range is not None:
+            pending_parts[path] = pending_parts.get(path, 0) + 1
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_load_task, path, page_range, source_docs_dir): (path, page_range)
+            for path, page_range in tasks
+        }
+        for future in as_completed(futures):
+            path, page_range = futures[future]
+            try:
+                chunks = future.result()
+            except Exception as e:
+                print(f"Error loading {path} (pages={page_range}): {e}")
+                chunks = None
+
+            if page_range is None:
+                yield path, chunks
+                continue
+
+            if chunks is None:
+                failed.add(path)
+            else:
+                partial.setdefault(path, []).append((page_range[0], chunks))
+            pending_parts[path] -= 1
+            if pending_parts[path] == 0:
+                parts = partial.pop(path, [])
+                if path in failed:
+                    yield path, None
+                else:
+                    pages = [page for _, part in sorted(parts, key=lambda p: p[0]) for page in part]
+                    yield path, assign_chunk_ids(chunk_pdf_pages(path, pages, source_docs_dir))
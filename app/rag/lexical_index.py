@@ -0,0 +1,223 @@
+import gzip
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# インデックス成果物内の語彙索引（BM25用の転置インデックス）ファイル
+LEXICAL_INDEX_FILE = "lexical_index.json.gz"
+LEXICAL_INDEX_VERSION = 2
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 英数字の連続は1語、それ以外（日本語）は文字bigramに分ける
+_WORD = re.compile(r"[0-9a-z]+|[^\W0-9a-z_]+")
+_KANJI_DIGITS = {"〇": 0, "零": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+_NUMBER = r"[0-9]+|[〇零一二三四五六七八九十百千]+"
+# 条文番号（第六十六条、第66条、第26条の2 など）
+_ARTICLE_REF = re.compile(rf"第({_NUMBER})条(?:の({_NUMBER}))?")
+# 法律名の略称 → law_group（条文番号の直接参照で対象の法律を絞る）
+_LAW_ALIASES = {
+    "yakkiho": ("薬機法", "医薬品医療機器等法", "医薬品、医療機器等の品質", "薬事法"),
+    "kehyoho": ("景表法", "景品表示法", "不当景品類及び不当表示防止法"),
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """NFKC正規化・小文字化し、英数字は語単位、日本語は文字bigramに分割する"""
+    tokens = []
+    for word in _WORD.findall(unicodedata.normalize("NFKC", text).lower()):
+        if word.isascii() or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def index_terms(text: str) -> List[str]:
+    """
+    検索語: tokenize の結果に条文番号の正規化トークン（"§66" など）を加える
+    （「第66条」と「第六十六条」のように表記が違っても一致させる）
+    """
+    return tokenize(text) + [f"§{key}" for key in article_keys(text)]
+
+
+def kanji_to_int(text: str) -> Optional[int]:
+    """漢数字（六十六、百二十 など）またはアラビア数字を整数にする"""
+    if text.isdigit():
+        return int(text)
+    total, digit = 0, None
+    for ch in text:
+        if ch in _KANJI_DIGITS:
+            digit = _KANJI_DIGITS[ch]
+        elif ch in _KANJI_UNITS:
+            total += (digit if digit is not None else 1) * _KANJI_UNITS[ch]
+            digit = None
+        else:
+            return None
+    return total + (digit or 0)
+
+
+def article_keys(text: str) -> List[str]:
+    """テキスト中の条文番号を "66" / "26-2" の形式で返す"""
+    keys = []
+    for number, branch in _ARTICLE_REF.findall(unicodedata.normalize("NFKC", text)):
+        article = kanji_to_int(number)
+        if article is None:
+            continue
+        key = str(article)
+        if branch:
+            sub = kanji_to_int(branch)
+            if sub is None:
+                continue
+            key += f"-{sub}"
+        keys.append(key)
+    return keys
+
+
+def law_groups_in(text: str) -> List[str]:
+    """テキスト中で言及されている法律の law_group"""
+    return [group for group, aliases in _LAW_ALIASES.items() if any(a in text for a in aliases)]
+
+
+def is_article_query(query: str) -> bool:
+    """クエリが条文番号の参照だけからなるか（例: "薬機法 第66条"）"""
+    normalized = unicodedata.normalize("NFKC", query)
+    if not article_keys(normalized):
+        return False
+    rest = _ARTICLE_REF.sub("", normalized)
+    for aliases in _LAW_ALIASES.values():
+        for alias in aliases:
+            rest = rest.replace(alias, "")
+    return not re.sub(r"[\s第項号、,・]", "", rest)
+
+
+class LexicalIndex:
+    """
+    チャンクの語彙索引（BM25）と条文番号の索引
+    本文はベクトルストアに保存されているため、ここではIDと検索用の情報のみを持つ。
+    """
+
+    def __init__(self, ids: List[str], doc_lens: List[int], fields: List[Dict],
+                 postings: Dict[str, Tuple[List[int], List[int]]], articles: Dict[str, List[int]]):
+        self.ids = ids
+        self.doc_lens = doc_lens
+        self.fields = fields
+        self.postings = postings
+        self.articles = articles
+        self.avg_len = (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _allowed(self, doc: int, where: Optional[Dict]) -> bool:
+        return not where or all(self.fields[doc].get(k) == v for k, v in where.items())
+
+    def search(self, query: str, top_k: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """BM25で検索し、(チャンクID, スコア) をスコアの高い順に返す"""
+        n_docs = len(self.ids)
+        if not n_docs:
+            return []
+        scores: Dict[int, float] = {}
+        for term, qtf in Counter(index_terms(query)).items():
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tf in zip(docs, tfs):
+                if not self._allowed(doc, where):
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[doc] / self.avg_len)
+                scores[doc] = scores.get(doc, 0.0) + qtf * idf * tf * (BM25_K1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(self.ids[doc], score) for doc, score in ranked]
+
+    def lookup_articles(self, query: str, where: Optional[Dict] = None) -> List[str]:
+        """
+        クエリ中の条文番号に一致するチャンクIDを返す（embeddingを使わない）
+        クエリで法律名に言及している場合はその法律の条文に絞る
+        """
+        groups = law_groups_in(unicodedata.normalize("NFKC", query))
+        found = []
+        for key in article_keys(query):
+            for doc in self.articles.get(key, []):
+                if not self._allowed(doc, where):
+                    continue
+                if groups and self.fields[doc].get("law_group") not in groups:
+                    continue
+                found.append(self.ids[doc])
+        return list(dict.fromkeys(found))
+
+
+def build_lexical_index(documents: Iterable[Dict]) -> LexicalIndex:
+    """
+    チャンク群から語彙索引を作る
+    documents: [{"id": str, "content": str, "metadata": {...}}, ...]
+    """
+    ids, doc_lens, fields = [], [], []
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    articles: Dict[str, List[int]] = {}
+    for doc_index, doc in enumerate(documents):
+        meta = doc.get("metadata", {})
+        ids.append(doc["id"])
+        fields.append({"law_group": meta.get("law_group", "other"), "category": meta.get("category", "")})
+        # タイトル・条文番号も検索対象に含める
+        counts = Counter(index_terms(f"{meta.get('title', '')} {meta.get('section', '')} {doc['content']}"))
+        doc_lens.append(sum(counts.values()))
+        for term, tf in counts.items():
+            docs, tfs = postings.setdefault(term, ([], []))
+            docs.append(doc_index)
+            tfs.append(tf)
+        # 条文番号の索引は本則の条文だけに付ける（改正法の附則「第五条」などが本則の条文番号に一致しないようにする）
+        if meta.get("category") == "01_statute" and meta.get("is_main_provision") is not False:
+            for key in article_keys(meta.get("section", "")):
+                articles.setdefault(key, []).append(doc_index)
+    return LexicalIndex(ids, doc_lens, fields, postings, articles)
+
+
+def save_lexical_index(index: LexicalIndex, index_dir: str):
+    """
+    gzip圧縮したJSONで保存する
+    ポスティングの文書番号は差分で符号化する（昇順のため小さな数値になり圧縮が効く）
+    """
+    postings = {}
+    for term, (docs, tfs) in index.postings.items():
+        deltas = [docs[0]] + [b - a for a, b in zip(docs, docs[1:])]
+        postings[term] = [deltas, tfs]
+    data = {
+        "version": LEXICAL_INDEX_VERSION,
+        "ids": index.ids,
+        "doc_lens": index.doc_lens,
+        "fields": index.fields,
+        "postings": postings,
+        "articles": index.articles,
+    }
+    with gzip.open(os.path.join(index_dir, LEXICAL_INDEX_FILE), 'wt', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_lexical_index(index_dir: Optional[str]) -> Optional[LexicalIndex]:
+    if not index_dir:
+        return None
+    path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get("version") != LEXICAL_INDEX_VERSION:
+        return None
+    postings = {}
+    for term, (deltas, tfs) in data["postings"].items():
+        docs, total = [], 0
+        for d in deltas:
+            total += d
+            docs.append(total)
+        postings[term] = (docs, tfs)
+    return LexicalIndex(data["ids"], data["doc_lens"], data["fields"], postings, data["articles"])
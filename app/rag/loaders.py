@@ -0,0 +1,229 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.rag.chunker import CHUNK_STRATEGY, chunk_text
+from app.rag.xml_chunker import iter_law_paragraphs
+
+SOURCE_DOCS_DIR = Path(__file__).parent.parent.parent / "source_docs"
+
+# インデックス対象の拡張子
+SUPPORTED_SUFFIXES = (".xml", ".md", ".pdf")
+
+
+def iter_source_files(source_docs_dir: Path = SOURCE_DOCS_DIR) -> Iterator[Path]:
+    """
+    source_docs配下のインデックス対象ファイルを種別順（XML → Markdown → PDF）に列挙する
+    """
+    for suffix in SUPPORTED_SUFFIXES:
+        yield from sorted(source_docs_dir.rglob(f"*{suffix}"))
+
+
+def file_sha256(path: Path) -> str:
+    """ファイル内容のsha256を返す"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def content_sha256(text: str) -> str:
+    """チャンク本文のsha256を返す"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(chunks: List[Dict]) -> List[Dict]:
+    """
+    path / section から安定したチャンクIDを付与する。
+    同一ファイル内で section が重複する場合（附則の「第一条」など）は出現順の連番で区別する。
+    """
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        meta = chunk.get("metadata", {})
+        key = f"{meta.get('path', '')}::{meta.get('section', '')}"
+        if meta.get("paragraph"):
+            key += f"::p{meta['paragraph']}"
+        if meta.get("chunk"):
+            key += f"::c{meta['chunk']}"
+        if meta.get("is_main_provision") is False:
+            key += "::suppl"
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        if occurrence:
+            key += f"::{occurrence}"
+        chunk["id"] = "chunk_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    return chunks
+
+
+def load_xml(xml_path: Path, source_docs_dir: Path = SOURCE_DOCS_DIR) -> List[Dict]:
+    """e-Gov法令XMLを項 (Paragraph) 単位で分割する"""
+    documents = []
+    for para in iter_law_paragraphs(xml_path):
+        law_title = para["law_title"]
+        is_main = para["is_main_provision"]
+        section_name = para["article_title"] or (para["suppl_label"] if not is_main else "本則") or "不明"
+        caption_text = para["article_caption"]
+
+        # ★ ベクトル検索の精度向上: 条文の内容にプレフィックスを付与
+        # 法律名・条項番号・見出しをコンテンツ先頭に付与してembedding品質を向上させる
+        # 附則には「附則」を明記する
+        prefix = law_title if is_main else f"{law_title}・附則"
+        enriched_content = f"【{prefix}】{section_name}{para['paragraph_label']} {caption_text}\n{para['text']}"
+
+        metadata = {
+            "title": law_title,
+            "category": "01_statute",
+            "law_group": para["law_group"],
+            "section": section_name,
+            "paragraph": para["paragraph_num"],
+            "caption": caption_text,
+            "is_main_provision": is_main,
+            "source_type": "xml",
+            "path": str(xml_path.relative_to(source_docs_dir))
+        }
+        documents.append({"content": enriched_content, "metadata": metadata})
+    return documents
+
+
+def load_markdown(md_path: Path, source_docs_dir: Path = SOURCE_DOCS_DIR,
+                  strategy: str = CHUNK_STRATEGY) -> List[Dict]:
+    """
+    Markdown (02_OK事例, 03_NG事例, 04_運用基準など) を分割する
+    strategy=sentence の場合は見出し・文の境界に沿って分割し（app/rag/chunker.py）、page の場合は "# " 見出し単位で分割する
+    """
+    documents = []
+    with open(md_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # ディレクトリ名からカテゴリを推測
+    parent_dir = md_path.parent.name
+    category = "unknown"
+    if "02" in parent_dir: category = "02_ok_example"
+    elif "03" in parent_dir: category = "03_ng_example"
+    elif "04" in parent_dir: category = "04_standard"
+
+    if strategy == "sentence":
+        for chunk in chunk_text([(None, content)], join_lines=False):
+            metadata = {
+                "title": md_path.stem,
+                "category": category,
+                "law_group": "other",
+                "section": chunk["heading"] or md_path.stem,
+                "chunk": chunk["chunk"],
+                "source_type": "md",
+                "path": str(md_path.relative_to(source_docs_dir))
+            }
+            documents.append({"content": chunk["text"], "metadata": metadata})
+        return documents
+
+    # 見出し（#）で分割
+    chunks = re.split(r'\n(?=# )', content)
+    for i, chunk in enumerate(chunks):
+        if not chunk.strip(): continue
+        # 最初の1行を見出し（セクション名）として抽出
+        first_line = chunk.split('\n')[0].replace('#', '').strip()
+        metadata = {
+            "title": md_path.stem,
+            "category": category,
+            "law_group": "other",
+            "section": first_line if first_line else f"Section {i+1}",
+            "source_type": "md",
+            "path": str(md_path.relative_to(source_docs_dir))
+        }
+        documents.append({"content": chunk.strip(), "metadata": metadata})
+    return documents
+
+
+def pdf_page_count(pdf_path: Path) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(pdf_path).pages)
+
+
+def extract_pdf_pages(pdf_path: Path, page_range: Optional[Tuple[int, int]] = None) -> List[Tuple[int, str]]:
+    """
+    PDFのページごとのテキストを (ページ番号（1始まり）, テキスト) で返す
+    page_range (start, end) を指定した場合はその範囲のページのみ処理する（並列取り込み用）
+    """
+    import pypdf
+    reader = pypdf.PdfReader(pdf_path)
+    start, end = page_range if page_range else (0, len(reader.pages))
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, min(end, len(reader.pages)))]
+
+
+def chunk_pdf_pages(pdf_path: Path, pages: List[Tuple[int, str]],
+                    source_docs_dir: Path = SOURCE_DOCS_DIR,
+                    strategy: str = CHUNK_STRATEGY) -> List[Dict]:
+    """
+    抽出したページのテキストをチャンクに分割する
+    strategy=sentence の場合は見出し・文の境界に沿って分割し（ページをまたぐチャンクもある）、
+    開始・終了ページをメタデータに残す。page の場合はページ単位で分割する。
+    """
+    documents = []
+    # ディレクトリ名からカテゴリを推測
+    parent_dir = pdf_path.parent.name
+    category = "04_standard" # デフォルト
+    if "02" in parent_dir: category = "02_ok_example"
+    elif "03" in parent_dir: category = "03_ng_example"
+
+    if strategy == "sentence":
+        for chunk in chunk_text(pages, join_lines=True):
+            if len(chunk["text"].strip()) < 50: continue
+            page_start, page_end = chunk["page_start"], chunk["page_end"]
+            metadata = {
+                "title": pdf_path.stem,
+                "category": category,
+                "law_group": "other",
+                "section": f"Page {page_start}" if page_start == page_end else f"Page {page_start}-{page_end}",
+                "heading": chunk["heading"],
+                "page": page_start,
+                "page_end": page_end,
+                "source_type": "pdf",
+                "path": str(pdf_path.relative_to(source_docs_dir))
+            }
+            documents.append({"content": chunk["text"], "metadata": metadata})
+        return documents
+
+    for page, page_text in pages:
+        if not page_text or len(page_text.strip()) < 50: continue
+
+        metadata = {
+            "title": pdf_path.stem,
+            "category": category,
+            "law_group": "other",
+            "section": f"Page {page}",
+            "source_type": "pdf",
+            "path": str(pdf_path.relative_to(source_docs_dir))
+        }
+        documents.append({"content": page_text.strip(), "metadata": metadata})
+    return documents
+
+
+def load_pdf(pdf_path: Path, source_docs_dir: Path = SOURCE_DOCS_DIR,
+             page_range: Optional[Tuple[int, int]] = None,
+             strategy: str = CHUNK_STRATEGY) -> List[Dict]:
+    """PDFのテキストを抽出してチャンクに分割する（page_range は extract_pdf_pages を参照）"""
+    return chunk_pdf_pages(pdf_path, extract_pdf_pages(pdf_path, page_range), source_docs_dir, strategy)
+
+
+_LOADERS = {
+    ".xml": load_xml,
+    ".md": load_markdown,
+    ".pdf": load_pdf,
+}
+
+
+def load_file(path: Path, source_docs_dir: Path = SOURCE_DOCS_DIR,
+              strategy: str = CHUNK_STRATEGY) -> List[Dict]:
+    """
+    1ファイルをチャンクに分割し、安定IDを付与して返す
+    strategy はPDF・Markdownの分割方式（XMLは常に項単位）
+    """
+    suffix = path.suffix.lower()
+    loader = _LOADERS.get(suffix)
+    if loader is None:
+        return []
+    if suffix == ".xml":
+        return assign_chunk_ids(loader(path, source_docs_dir))
+    return assign_chunk_ids(loader(path, source_docs_dir, strategy=strategy))
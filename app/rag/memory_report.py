@@ -0,0 +1,126 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+# APIワーカーの起動時にメモリ使用量のレポートを出力する
+MEMORY_REPORT = os.getenv("MEMORY_REPORT", "true").lower() == "true"
+
+_MB = 1024 * 1024
+
+
+def memory_usage(mapped_prefix: Optional[str] = None) -> Dict[str, Optional[int]]:
+    """
+    現在のプロセスのメモリ使用量（バイト）
+    - rss: 常駐サイズ
+    - pss: 他プロセスと共有しているページを共有数で按分したサイズ（ワーカー数を掛けるとノード全体の使用量になる）
+    - private / shared: 他プロセスと共有していない / しているページ（ワーカーを1つ増やしたときに増えるのは private）
+    - mapped / mapped_rss: mapped_prefix 以下のファイル（インデックスの成果物）をマップしたサイズと、そのうち常駐しているサイズ
+    Linuxは /proc/self/smaps から集計する。それ以外はpsutilがあれば rss / private（USS）のみ、なければ値はNone
+    """
+    mapped_prefix = os.path.abspath(mapped_prefix) if mapped_prefix else None
+    usage: Dict[str, Optional[int]] = {
+        "rss": None, "pss": None, "private": None, "shared": None, "mapped": None, "mapped_rss": None}
+    try:
+        with open("/proc/self/smaps", 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.readlines()
+    except OSError:
+        lines = None
+
+    if lines is None:
+        try:
+            import psutil
+            info = psutil.Process().memory_full_info()
+            usage["rss"], usage["private"] = info.rss, getattr(info, "uss", None)
+        except Exception:
+            pass
+        return usage
+
+    totals = dict.fromkeys(("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"), 0)
+    mapped = mapped_rss = 0
+    in_prefix = False
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if not fields[0].endswith(":"):
+            # マッピングの見出し行（アドレス範囲 権限 オフセット デバイス inode [パス]）。パスは空白を含みうるので残り全体
+            header = line.split(maxsplit=5)
+            path = header[5].rstrip("\n") if len(header) > 5 else ""
+            in_prefix = bool(mapped_prefix) and path.startswith(mapped_prefix)
+            continue
+        key = fields[0][:-1]
+        if key in totals:
+            totals[key] += int(fields[1]) * 1024
+        if in_prefix and key == "Size":
+            mapped += int(fields[1]) * 1024
+        elif in_prefix and key == "Rss":
+            mapped_rss += int(fields[1]) * 1024
+
+    usage.update({
+        "rss": totals["Rss"],
+        "pss": totals["Pss"],
+        "private": totals["Private_Clean"] + totals["Private_Dirty"],
+        "shared": totals["Shared_Clean"] + totals["Shared_Dirty"],
+    })
+    if mapped_prefix:
+        usage["mapped"], usage["mapped_rss"] = mapped, mapped_rss
+    return usage
+
+
+def _mb(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / _MB:.1f}MB"
+
+
+class StartupMemoryReport:
+    """
+    起動の段階ごとのメモリ使用量を記録し、段階ごとの増加量をレポートする
+    ワーカーごとに出力されるため、private の増加量がワーカー1つあたりのコスト、
+    mapped がページキャッシュで共有されるインデックスの大きさの目安になる
+    """
+
+    def __init__(self):
+        self.stages: List[Dict] = []
+
+    def mark(self, stage: str, mapped_prefix: Optional[str] = None):
+        if not MEMORY_REPORT:
+            return
+        self.stages.append({"stage": stage, "time": time.time(), **memory_usage(mapped_prefix)})
+
+    def report(self) -> Dict:
+        """段階ごとの使用量と、前の段階からの増加量（rss_growth / private_growth）"""
+        stages = []
+        previous = None
+        for stage in self.stages:
+            entry = dict(stage)
+            for key in ("rss", "private"):
+                if previous is not None and stage[key] is not None and previous[key] is not None:
+                    entry[f"{key}_growth"] = stage[key] - previous[key]
+            stages.append(entry)
+            previous = stage
+        total = {}
+        if len(self.stages) > 1:
+            first, last = self.stages[0], self.stages[-1]
+            for key in ("rss", "private"):
+                if first[key] is not None and last[key] is not None:
+                    total[f"{key}_growth"] = last[key] - first[key]
+        return {"pid": os.getpid(), "stages": stages, "total": total}
+
+    def print_report(self):
+        if not self.stages:
+            return
+        report = self.report()
+        print(f"Memory report (pid={report['pid']}):")
+        for stage in report["stages"]:
+            line = (f"  {stage['stage']:<12} rss={_mb(stage['rss'])} pss={_mb(stage['pss'])} "
+                    f"private={_mb(stage['private'])} shared={_mb(stage['shared'])}")
+            if "private_growth" in stage:
+                line += f" (+{_mb(stage['private_growth'])} private)"
+            if stage.get("mapped"):
+                line += f" index mapped={_mb(stage['mapped'])} resident={_mb(stage['mapped_rss'])}"
+            print(line)
+        if "private_growth" in report["total"]:
+            print(f"  per-worker private growth: {_mb(report['total']['private_growth'])}")
+
+
+# プロセス内で共有する起動時のレポート（app/main.py で段階を記録する）
+startup_report = StartupMemoryReport()
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+# 検索結果の並べ替え（リランキング）: none（ベクトル類似度のみ）/ cross_encoder（CPUのcross-encoderで再採点）
+RERANKER = os.getenv("RERANKER", "none")
+# cross-encoderのモデル（日本語を含む多言語対応）
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "256"))
+# リランキング後のスコアがこの値未満の文書はLLMに渡さない（未設定の場合は除外しない）
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "0") or 0)
+
+# ブースト規則のファイル（未設定の場合は DEFAULT_BOOST_RULES を使う）
+RETRIEVAL_BOOST_RULES_PATH = os.getenv("RETRIEVAL_BOOST_RULES_PATH", "")
+
+# ブースト規則: 条件をすべて満たす文書のスコアに factor を掛ける
+# - metadata: メタデータの値が一致する
+# - title_excludes: タイトルにいずれの語も含まれない
+# - section_in_query: 条文番号（section）が検索クエリに含まれる
+DEFAULT_BOOST_RULES = [
+    {"name": "main_act", "factor": 1.5,
+     "metadata": {"category": "01_statute"},
+     "title_excludes": ["施行令", "施行規則", "内閣府令", "府令"]},
+    {"name": "section_match", "factor": 1.3, "section_in_query": True},
+]
+
+
+def distance_to_similarity(distance: float, space: str = "l2") -> float:
+    """
+    Chromaの距離を類似度（大きいほど近い）にする
+    cosine / ip は 1 - 距離、l2（二乗距離）は 1 / (1 + 距離)
+    """
+    if space in ("cosine", "ip"):
+        return 1.0 - distance
+    return 1.0 / (1.0 + distance)
+
+
+def load_boost_rules(path: str = RETRIEVAL_BOOST_RULES_PATH) -> List[Dict]:
+    if not path:
+        return DEFAULT_BOOST_RULES
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def apply_boosts(score: float, metadata: Dict, query_text: str, rules: Sequence[Dict]) -> Tuple[float, List[str]]:
+    """条件を満たすブースト規則を適用したスコアと、適用した規則名を返す"""
+    applied = []
+    for rule in rules:
+        if any(metadata.get(key) != value for key, value in rule.get("metadata", {}).items()):
+            continue
+        title = metadata.get("title", "")
+        if any(word in title for word in rule.get("title_excludes", [])):
+            continue
+        if rule.get("section_in_query"):
+            section = metadata.get("section", "")
+            if len(section) <= 1 or section not in query_text:
+                continue
+        score *= rule["factor"]
+        applied.append(rule["name"])
+    return score, applied
+
+
+class CrossEncoderReranker:
+    """
+    cross-encoderによるリランキング（CPU）
+    複数スロットの候補をまとめて1回のpredictで採点する。モデルは初回の呼び出し時に読み込み、プロセス内で共有する。
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL,
+                 batch_size: int = RERANKER_BATCH_SIZE,
+                 max_length: int = RERANKER_MAX_LENGTH,
+                 model=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = model
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    start_time = time.time()
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                    print(f"✓ Reranker model loaded: {self.model_name} ({time.time() - start_time:.2f}s)")
+        return self._model
+
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """(クエリ, 文書) の組ごとの関連度（0〜1）"""
+        if not pairs:
+            return []
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(s) for s in scores]
+
+
+_default_reranker = None
+_lock = threading.Lock()
+
+
+def get_reranker():
+    """設定されたリランカーを返す（RERANKER=none の場合はNone）"""
+    global _default_reranker
+    if RERANKER == "none":
+        return None
+    if _default_reranker is None:
+        with _lock:
+            if _default_reranker is None:
+                if RERANKER != "cross_encoder":
+                    raise ValueError(f"Unknown reranker: {RERANKER}")
+                _default_reranker = CrossEncoderReranker()
+    return _default_reranker
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# コンプライアンスチェック結果のキャッシュ設定
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+# 類似テキストのヒット判定に使うコサイン類似度の閾値（0で類似ヒットを無効化）
+RESULT_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RESULT_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC正規化し、空白の連続を1つにまとめる（全角・半角や改行位置の違いを同一視する）"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def options_key(options: Optional[Dict]) -> str:
+    """リクエストオプションを順序によらない文字列にする（未指定の項目は除く）"""
+    if not options:
+        return ""
+    return json.dumps({k: v for k, v in options.items() if v is not None}, sort_keys=True, ensure_ascii=False)
+
+
+class ResultCache:
+    """
+    コンプライアンスチェック結果のLRU + TTLキャッシュ（プロセス内）
+    - 完全一致: 正規化済みテキスト + オプション + インデックスバージョン
+    - 類似一致（任意）: 同じオプション・インデックスバージョンのエントリのうち、
+      embeddingのコサイン類似度が閾値以上のもの
+    インデックスのバージョンが変わった場合は全エントリを破棄する。
+    """
+
+    def __init__(self,
+                 max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+                 semantic_threshold: float = RESULT_CACHE_SEMANTIC_THRESHOLD,
+                 embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._embed_fn = embed_fn
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._index_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold > 0
+
+    def _embed(self, text: str) -> np.ndarray:
+        if self._embed_fn is None:
+            from app.rag.embedding import get_embedding_service
+            self._embed_fn = get_embedding_service().encode
+        vector = np.asarray(self._embed_fn([text])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @staticmethod
+    def make_key(normalized: str, opts_key: str, index_version: Optional[str]) -> str:
+        raw = f"{index_version}\x00{opts_key}\x00{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _sync_version_locked(self, index_version: Optional[str]):
+        if index_version != self._index_version:
+            if self._entries:
+                print(f"Result cache invalidated (index version {self._index_version} -> {index_version})")
+            self._entries.clear()
+            self._index_version = index_version
+
+    def get(self, text: str, options: Optional[Dict], index_version: Optional[str]) -> Optional[Tuple[Any, Dict]]:
+        """
+        キャッシュを引く。ヒットした場合は (値, ヒット情報) を返す
+        """
+        normalized = normalize_text(text)
+        opts_key = options_key(options)
+        key = self.make_key(normalized, opts_key, index_version)
+        now = time.time()
+
+        with self._lock:
+            self._sync_version_locked(index_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["expires_at"] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["exact_hits"] += 1
+                    return entry["value"], {"hit": "exact"}
+                del self._entries[key]
+
+        if not self.semantic_enabled:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        # 類似一致（embeddingはロック外で計算する）
+        vector = self._embed(normalized)
+        with self._lock:
+            best_key, best_score = None, self.semantic_threshold
+            for k, e in list(self._entries.items()):
+                if e["expires_at"] <= now:
+                    del self._entries[k]
+                    continue
+                if e["options_key"] != opts_key or e["vector"] is None:
+                    continue
+                score = float(np.dot(vector, e["vector"]))
+                if score >= best_score:
+                    best_key, best_score = k, score
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.stats["semantic_hits"] += 1
+            entry = self._entries[best_key]
+            return entry["value"], {"hit": "semantic", "similarity": round(best_score, 4),
+                                    "cached_input": entry["text"]}
+
+    def put(self, text: str, options: Optional[Dict], index_version: Optional[str], value: Any):
+        normalized = normalize_text(text)
+        opts_key = options_key(options)
+        key = self.make_key(normalized, opts_key, index_version)
+        vector = self._embed(normalized) if self.semantic_enabled else None
+
+        with self._lock:
+            self._sync_version_locked(index_version)
+            self._entries[key] = {
+                "value": value,
+                "text": text,
+                "options_key": opts_key,
+                "vector": vector,
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """プロセス内で共有する結果キャッシュを返す。RESULT_CACHE_MAX_ENTRIES=0 の場合は無効"""
+    global _default_cache
+    if RESULT_CACHE_MAX_ENTRIES <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
@@ -1,165 +1,51 @@
 import asyncio
-from typing import Dict, Any
-from app.models.request import ComplianceCheckRequest
-from app.models.response import ComplianceCheckResponse, ViolationDetail, Recommendation
-from app.rag.vector_store import search_documents, initialize_vector_store, get_collection_count
-from app.workflow.langgraph import create_workflow
 import json
 import os
-import re
-from pathlib import Path
-
-# サンプル法律文書の読み込みとベクトルストアへの追加（初回のみ）
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from app.models.request import BatchComplianceCheckRequest, ComplianceCheckRequest
+from app.models.response import (
+    BatchComplianceCheckResponse,
+    BatchItemResult,
+    ComplianceCheckResponse,
+    Recommendation,
+    ViolationDetail,
+)
+from app.rag.ingest import iter_loaded_files
+from app.rag import vector_store
+from app.rag.loaders import SOURCE_DOCS_DIR, iter_source_files
+from app.rag.result_cache import get_result_cache, normalize_text
+from app.workflow.registry import DEFAULT_PIPELINE, get_workflow
+from app.workflow.structured_output import REPAIR_TAG, JsonFieldStream, iter_string_fields
+
+# ストリーミング時にLLMの出力を送るノードと、そのイベント名（途中経過は "<イベント名>_delta"）
+STREAMED_NODES = {"analyze": "analysis", "recommend": "recommendations"}
+# ストリーミング時に、終了した時点で分析結果（IRAC）を送るノード
+ANALYSIS_NODES = ("analyze", "conclude")
+# 構造化された言い換え提案を得られなかった場合の代替案の修正版
+RECOMMENDATION_PLACEHOLDER = "AIの提案を確認してください"
+
+# バッチチェックで同時に実行するワークフロー数の上限（LLMの同時実行数はプロバイダごとにも制限される）
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# 1回のバッチリクエストで受け付ける最大件数
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# サンプル法律文書の読み込み（全件）
+# ※ ベクトルストアへの登録は `python -m app.rag.build_index` で行う
 def load_sample_documents():
     documents = []
     print("Loading legal documents with semantic chunking...")
     
-    source_docs_dir = Path(__file__).parent.parent.parent / "source_docs"
-    if not source_docs_dir.exists():
-        print(f"Directory not found: {source_docs_dir}")
+    if not SOURCE_DOCS_DIR.exists():
+        print(f"Directory not found: {SOURCE_DOCS_DIR}")
         return documents
 
-    # 1. XML形式 (01_条文など): 条文単位で分割
-    for xml_path in source_docs_dir.rglob("*.xml"):
-        try:
-            with open(xml_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(content, 'xml')
-            law_title = soup.find('LawTitle').text if soup.find('LawTitle') else xml_path.stem
-            
-            # 本則 (MainProvision) の抽出
-            main_provision = soup.find('MainProvision')
-            if main_provision:
-                articles = main_provision.find_all('Article')
-                for article in articles:
-                    section_name = article.find('ArticleTitle').text if article.find('ArticleTitle') else "不明"
-                    caption = article.find('ArticleCaption')
-                    caption_text = caption.text if caption else ""
-                    article_text = article.get_text(separator="\n", strip=True)
-                    
-                    # ★ ベクトル検索の精度向上: 条文の内容にプレフィックスを付与
-                    # ChromaDBのデフォルトembeddingは日本語法律文の意味区別が困難なため、
-                    # 法律名・条文番号・見出しをコンテンツ先頭に付与してembedding品質を向上させる
-                    enriched_content = f"【{law_title}】{section_name} {caption_text}\n{article_text}"
-                    
-                    law_group = "yakkiho" if "医薬品" in law_title else "kehyoho" if "不当景品" in law_title else "other"
-                    
-                    metadata = {
-                        "title": law_title,
-                        "category": "01_statute",
-                        "law_group": law_group,
-                        "section": section_name,
-                        "caption": caption_text,
-                        "is_main_provision": True,
-                        "source_type": "xml",
-                        "path": str(xml_path.relative_to(source_docs_dir))
-                    }
-                    documents.append({"content": enriched_content, "metadata": metadata})
-
-            # 附則 (SupplProvision) の抽出
-            suppl_provisions = soup.find_all('SupplProvision')
-            for suppl in suppl_provisions:
-                articles = suppl.find_all('Article')
-                for article in articles:
-                    section_name = article.find('ArticleTitle').text if article.find('ArticleTitle') else "不明"
-                    caption = article.find('ArticleCaption')
-                    caption_text = caption.text if caption else ""
-                    article_text = article.get_text(separator="\n", strip=True)
-                    
-                    # 附則にもプレフィックスを付与（ただし「附則」を明記）
-                    enriched_content = f"【{law_title}・附則】{section_name} {caption_text}\n{article_text}"
-                    
-                    law_group = "yakkiho" if "医薬品" in law_title else "kehyoho" if "不当景品" in law_title else "other"
-                    
-                    metadata = {
-                        "title": law_title,
-                        "category": "01_statute",
-                        "law_group": law_group,
-                        "section": section_name,
-                        "caption": caption_text,
-                        "is_main_provision": False,
-                        "source_type": "xml",
-                        "path": str(xml_path.relative_to(source_docs_dir))
-                    }
-                    documents.append({"content": enriched_content, "metadata": metadata})
-        except Exception as e:
-            print(f"Error loading XML {xml_path}: {e}")
-
-    # 2. Markdown形式 (02_OK事例, 03_NG事例, 04_運用基準など): 見出し単位で分割
-    for md_path in source_docs_dir.rglob("*.md"):
-        try:
-            with open(md_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # ディレクトリ名からカテゴリを推測
-            parent_dir = md_path.parent.name
-            category = "unknown"
-            if "02" in parent_dir: category = "02_ok_example"
-            elif "03" in parent_dir: category = "03_ng_example"
-            elif "04" in parent_dir: category = "04_standard"
-
-            # 見出し（#）で分割
-            chunks = re.split(r'\n(?=# )', content)
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip(): continue
-                # 最初の1行を見出し（セクション名）として抽出
-                first_line = chunk.split('\n')[0].replace('#', '').strip()
-                metadata = {
-                    "title": md_path.stem,
-                    "category": category,
-                    "law_group": "other",
-                    "section": first_line if first_line else f"Section {i+1}",
-                    "source_type": "md",
-                    "path": str(md_path.relative_to(source_docs_dir))
-                }
-                documents.append({"content": chunk.strip(), "metadata": metadata})
-        except Exception as e:
-            print(f"Error loading MD {md_path}: {e}")
-
-    # 3. PDF形式: ページ単位または一定文字数で分割（改良案）
-    import pypdf
-    for pdf_path in source_docs_dir.rglob("*.pdf"):
-        try:
-            reader = pypdf.PdfReader(pdf_path)
-            # ディレクトリ名からカテゴリを推測
-            parent_dir = pdf_path.parent.name
-            category = "04_standard" # デフォルト
-            if "02" in parent_dir: category = "02_ok_example"
-            elif "03" in parent_dir: category = "03_ng_example"
-
-            for i, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                if not page_text or len(page_text.strip()) < 50: continue
-                
-                metadata = {
-                    "title": pdf_path.stem,
-                    "category": category,
-                    "law_group": "other",
-                    "section": f"Page {i+1}",
-                    "source_type": "pdf",
-                    "path": str(pdf_path.relative_to(source_docs_dir))
-                }
-                documents.append({"content": page_text.strip(), "metadata": metadata})
-        except Exception as e:
-            print(f"Error loading PDF {pdf_path}: {e}")
+    for _, chunks in iter_loaded_files(iter_source_files(SOURCE_DOCS_DIR), SOURCE_DOCS_DIR):
+        if chunks:
+            documents.extend(chunks)
 
     return documents
 
 
-# 初期化時にサンプルドキュメントをロード
-try:
-    # 既存のカウントに関わらず、再構築が必要な場合はここを調整
-    # 今回は initialize_vector_store 内でリセットを行うようにしたため、
-    # 常に最新の source_docs を反映するように再初期化を実行する設計とする。
-    print("Re-indexing source documents for semantic optimization...")
-    sample_docs = load_sample_documents()
-    if sample_docs:
-        print(f"Total documents to index: {len(sample_docs)}")
-        initialize_vector_store(sample_docs)
-except Exception as e:
-    print(f"Warning: Could not initialize vector store with sample documents: {e}")
-
 async def check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckResponse:
     """
     RAGとLangGraphを使用してコンプライアンスチェックを実行する関数
@@ -168,33 +54,196 @@ async def check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckRe
     start_time = time.time()
     
     input_text = request.content.data
+
+    # 同一（または類似）テキストの結果キャッシュを確認
+    # キーにはインデックスのバージョンを含めるため、インデックス再構築後は自動的に無効になる
+    result_cache = get_result_cache()
+    cache_options = _cache_options(request)
+    index_version = vector_store.get_index_info().get("version")
+    if result_cache is not None:
+        cached = await asyncio.to_thread(result_cache.get, input_text, cache_options, index_version)
+        if cached is not None:
+            cached_response, hit_info = cached
+            return _cached_response(cached_response, hit_info, start_time)
     
-    # LangGraphワークフローを作成
-    workflow = create_workflow()
+    # コンパイル済みのLangGraphワークフローを取得（起動時に1回だけコンパイルされる）
+    pipeline = (request.options.pipeline if request.options else None) or DEFAULT_PIPELINE
+    workflow = get_workflow(pipeline)
+
+    # ワークフローを実行
+    result = await workflow.ainvoke(_initial_state(request))
 
-    # 初期状態を設定
-    initial_state = {
-        "input_text": input_text,
+    response = build_response(result, input_text, pipeline, start_time)
+
+    # 失敗・空の実行結果（final_output が初期値のまま）はキャッシュしない
+    if result_cache is not None and result.get("final_output"):
+        await asyncio.to_thread(result_cache.put, input_text, cache_options, index_version, response)
+
+    return response
+
+
+async def stream_compliance_check(request: ComplianceCheckRequest) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    コンプライアンスチェックを実行し、途中経過を (イベント名, データ) の形で順に返す
+    - prescreen: 表現辞書による事前判定の結果（検出箇所の文字位置を含む）
+    - evidence: 検索結果（根拠文書）。検索が終わった時点で送る
+    - analysis_delta: IRAC分析のLLM出力（JSON）をトークン単位で読み、文字列のフィールドに追加された文字を送る
+      （{"field": "issues[0].reason", "delta": "..."}。同じ field の delta をつなげると値になる）
+    - analysis: 分析の完了時に、整形したIRAC分析 text と検証済みの構造化結果 analysis を1回送る
+    - recommendations_delta: 言い換え提案のLLM出力を analysis_delta と同じ形式で送る
+    - recommendations: 提案の完了時に1回送る（レスポンスの recommendations と同じ形式）
+    - result: 最終結果（check_compliance のレスポンスと同じ形式）
+    結果キャッシュから返す場合も、保存済みの構造化結果から同じ順序でイベントを送る（delta はフィールドごとに1回）。
+    """
+    import time
+    start_time = time.time()
+    input_text = request.content.data
+
+    result_cache = get_result_cache()
+    cache_options = _cache_options(request)
+    index_version = vector_store.get_index_info().get("version")
+    if result_cache is not None:
+        cached = await asyncio.to_thread(result_cache.get, input_text, cache_options, index_version)
+        if cached is not None:
+            for item in _replay_events(_cached_response(*cached, start_time)):
+                yield item
+            return
+
+    pipeline = (request.options.pipeline if request.options else None) or DEFAULT_PIPELINE
+    workflow = get_workflow(pipeline)
+
+    # ノードの出力を順に反映して最終状態を組み立てる
+    result = _initial_state(request)
+    streams: Dict[str, JsonFieldStream] = {}
+    async for event in workflow.astream_events(result, version="v1"):
+        node = event.get("metadata", {}).get("langgraph_node")
+        # 構造化出力の修復呼び出しのトークンは送らない（修復後の結果は完了時のイベントで送る）
+        if event["event"] == "on_chat_model_stream" and node in STREAMED_NODES and REPAIR_TAG not in event.get("tags", []):
+            token = event["data"]["chunk"].content
+            for field, delta in streams.setdefault(node, JsonFieldStream()).feed(token or ""):
+                yield f"{STREAMED_NODES[node]}_delta", {"field": field, "delta": delta}
+            continue
+        if event["event"] != "on_chain_end" or event["name"] != node:
+            continue
+        output = event["data"].get("output")
+        if isinstance(output, dict):
+            result.update(output)
+        if node == "prescreen" and result.get("prescreen_result"):
+            yield "prescreen", result["prescreen_result"]
+        elif node == "retrieve":
+            yield "evidence", {"evidence": build_evidence(result.get("retrieved_docs")),
+                               "retrieval_debug": result.get("debug_info", {})}
+        elif node in ANALYSIS_NODES:
+            yield "analysis", {"text": result["analysis_result"]["irac_analysis"],
+                               "analysis": result["analysis_result"].get("structured")}
+        elif node == "recommend":
+            yield "recommendations", _recommendations_event(build_recommendations(result["final_output"], input_text))
+
+    response = build_response(result, input_text, pipeline, start_time)
+    if result_cache is not None and result.get("final_output"):
+        await asyncio.to_thread(result_cache.put, input_text, cache_options, index_version, response)
+    yield "result", response.model_dump(mode="json")
+
+
+def _replay_events(response: ComplianceCheckResponse):
+    """キャッシュ済みのレスポンスから、ストリーミングと同じ順序・形式のイベントを作る"""
+    analysis_log = response.result["analysis_log"]
+    workflow_path = analysis_log.get("workflow_path", [])
+    violation = response.result["violations"][0] if response.result.get("violations") else None
+    recommendations = response.result["recommendations"]
+    if analysis_log.get("prescreen"):
+        yield "prescreen", analysis_log["prescreen"]
+    yield "evidence", {"evidence": (violation.evidence if violation else None) or [],
+                       "retrieval_debug": analysis_log.get("retrieval_debug", {})}
+    if "analyze" in workflow_path and response.result.get("analysis"):
+        for field, value in iter_string_fields(response.result["analysis"]):
+            yield "analysis_delta", {"field": field, "delta": value}
+    if violation:
+        yield "analysis", {"text": violation.details, "analysis": response.result.get("analysis")}
+    if "recommend" in workflow_path:
+        if not (len(recommendations) == 1 and recommendations[0].revised_text == RECOMMENDATION_PLACEHOLDER):
+            revisions = {"revisions": [r.model_dump(mode="json") for r in recommendations]}
+            for field, value in iter_string_fields(revisions):
+                yield "recommendations_delta", {"field": field, "delta": value}
+        yield "recommendations", _recommendations_event(recommendations)
+    yield "result", response.model_dump(mode="json")
+
+
+def _recommendations_event(recommendations: List[Recommendation]) -> Dict:
+    """言い換え提案のイベントデータ"""
+    return {"recommendations": [r.model_dump(mode="json") for r in recommendations]}
+
+
+def _cache_options(request: ComplianceCheckRequest) -> Dict:
+    """結果キャッシュのキーに含めるオプション"""
+    return {"content_type": request.content.type,
+            **(request.options.model_dump() if request.options else {})}
+
+
+def _initial_state(request: ComplianceCheckRequest) -> Dict:
+    """ワークフローの初期状態"""
+    return {
+        "input_text": request.content.data,
         "retrieved_docs": [],
         "analysis_result": {},
         "final_output": {},
         "current_step": "start",
-        "debug_info": {}
+        "debug_info": {},
+        "workflow_path": [],
+        "query_mode": request.options.query_mode if request.options else None,
+        "prescreen_mode": request.options.prescreen if request.options else None
     }
 
-    # ワークフローを実行
-    result = await workflow.ainvoke(initial_state)
 
+def build_evidence(retrieved_docs) -> List[Dict]:
+    """検索された根拠文書をEvidenceの形式（出典と抜粋）にする"""
+    evidence_list = []
+    if retrieved_docs and 'documents' in retrieved_docs and retrieved_docs['documents']:
+        scores = (retrieved_docs.get('scores') or [[]])[0]
+        for i, doc_text in enumerate(retrieved_docs['documents'][0]):
+            meta = retrieved_docs['metadatas'][0][i]
+            evidence = {
+                "source": f"{meta.get('title')} {meta.get('section')}",
+                "content": doc_text[:200] + "..." # 抜粋
+            }
+            if i < len(scores):
+                evidence["score"] = round(scores[i], 4)
+            # 近似重複をまとめたチャンクは、まとめた出典ファイルも示す
+            if meta.get("duplicate_count"):
+                evidence["sources"] = json.loads(meta.get("sources", "[]"))
+            evidence_list.append(evidence)
+    return evidence_list
+
+
+def build_recommendations(output: Dict, input_text: str) -> List[Recommendation]:
+    """最終出力の言い換え提案をレスポンスの形式にする"""
+    # 構造化された代替表現があれば表現ごとに返す
+    recommendations = [Recommendation(**revision) for revision in output.get("revisions") or []]
+
+    # 代替案も常に含める
+    if not recommendations:
+        recommendations.append(Recommendation(
+            original_text=input_text,
+            revised_text=RECOMMENDATION_PLACEHOLDER,
+            reason=output.get("recommendations", "")
+        ))
+    return recommendations
+
+
+def build_response(result: Dict, input_text: str, pipeline: str, start_time: float) -> ComplianceCheckResponse:
+    """
+    ワークフローの最終状態をAPIのレスポンス形式に変換する
+    """
+    import time
     violations = []
     recommendations = []
     # デフォルトの確信度
     confidence_score = 0.8
 
     # LangGraphの結果を解析してレスポンス形式に変換
-    if "final_output" in result:
+    if result.get("final_output"):
         output = result["final_output"]
         irac_analysis = output.get("analysis_summary", "")
-        recommendation_text = output.get("recommendations", "")
         
         # 結論に基づいて違反オブジェクトを作成
         is_compliant = output.get("compliant", False)
@@ -203,35 +252,25 @@ async def check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckRe
         if "confidence_score" in output:
              confidence_score = output["confidence_score"]
 
+        # 構造化された分析結果があれば、そのリスクを重大度とする
+        analysis = output.get("analysis") or {}
+        risk_level = analysis.get("risk_level")
+        severity = risk_level if risk_level in ("high", "medium", "low") else ("high" if not is_compliant else "low")
+
         # 【修正】適合・不適合に関わらず、AIの分析結果を詳細として返す
         # 検索された根拠文書をEvidenceとして追加
-        evidence_list = []
-        if "retrieved_docs" in result:
-             r_docs = result["retrieved_docs"]
-             if r_docs and 'documents' in r_docs and r_docs['documents']:
-                 for i, doc_text in enumerate(r_docs['documents'][0]):
-                     meta = r_docs['metadatas'][0][i]
-                     evidence_list.append({
-                         "source": f"{meta.get('title')} {meta.get('section')}",
-                         "content": doc_text[:200] + "..." # 抜粋
-                     })
+        evidence_list = build_evidence(result.get("retrieved_docs"))
 
         violation = ViolationDetail(
             law="景品表示法 / 薬機法（分析結果参照）",
             violation_section="AI分析",
-            details=irac_analysis, # ここにGeminiのIRAC分析が常に入る
-            severity="high" if not is_compliant else "low",
+            details=irac_analysis, # ここにIRAC分析が常に入る
+            severity=severity,
             evidence=evidence_list
         )
         violations.append(violation)
 
-        # 代替案も常に含める
-        recommendation = Recommendation(
-            original_text=input_text,
-            revised_text="AIの提案を確認してください",
-            reason=recommendation_text
-        )
-        recommendations.append(recommendation)
+        recommendations = build_recommendations(output, input_text)
 
     else:
         # 結果が取得できなかった場合
@@ -244,6 +283,8 @@ async def check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckRe
     # レスポンスの作成
     response_result = {
         "compliant": is_compliant, # AIの判定をそのまま使用
+        "verdict": result.get("final_output", {}).get("verdict"),
+        "analysis": result.get("final_output", {}).get("analysis"),
         "confidence_score": confidence_score,
         "violations": violations,
         "recommendations": recommendations,
@@ -252,94 +293,115 @@ async def check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckRe
                 {
                     "step": "langgraph_workflow",
                     "input": input_text,
-                    "output": f"Workflow completed in {processing_time_ms/1000:.2f}s",
+                    "output": f"Workflow '{pipeline}' completed in {processing_time_ms/1000:.2f}s",
                     "tool_used": "langgraph"
                 }
             ],
             "retrieval_debug": result.get("debug_info", {}),
+            "prescreen": result.get("prescreen_result", {}),
+            "workflow_path": result.get("workflow_path", []),
             "token_usage": result.get("final_output", {}).get("token_usage", {})
         }
     }
 
-    response = ComplianceCheckResponse(
+    return ComplianceCheckResponse(
         status="success",
         result=response_result,
         processing_time=processing_time_ms, 
         # cost_estimate=0.0
     )
 
-    return response
 
-
-def extract_revised_text(recommendations_text, original_text):
+async def check_compliance_batch(request: BatchComplianceCheckRequest,
+                                 max_concurrency: int = BATCH_MAX_CONCURRENCY) -> BatchComplianceCheckResponse:
     """
-    推奨事項から代替表現を抽出する関数（簡易実装）
+    複数の投稿内容をまとめてチェックする関数
+    - 同一テキスト（正規化後）は1回だけチェックし、結果を共有する
+    - ワークフローは max_concurrency 件まで並行して実行する（検索のembeddingは SearchBatcher でまとめられる）
+    - 個別の失敗は該当する項目のエラーとして返し、他の項目の処理は続ける
     """
-    # 簡単な実装として、元のテキストに含まれる問題語を一般的な表現に置き換える
-    revised = original_text
-    # LangGraphが生成した推奨事項から新しい表現を抽出しようと試みる
-    if "代替表現" in recommendations_text or "提案表現" in recommendations_text:
-        # 簡単な置き換え
-        revised = revised.replace("効果", "働き").replace("効能", "特徴").replace("治療", "ケア")
-
-    return revised
-
-
-def analyze_langgraph_output(langgraph_output, input_text):
-    """
-    LangGraphの出力から違反の有無を解析する関数
-    """
-    analysis_summary = langgraph_output.get("analysis_summary", "")
-
-    # IRAC構造のConclusion部分から違反の有無を判定
-    conclusion_parts = [
-        "結論", "conclusion", "Conclusion", "判定", "judgment", "determination"
-    ]
-
-    # 重要なキーワードで検索
-    violation_indicators = [
-        "違反", "non-compliant", "不適切", "問題", "違法", "appropriate",
-        "inappropriate", "contradicts", "not compliant", "not advisable"
-    ]
-
-    # 無害な表現の例
-    compliant_indicators = [
-        "適切", "compliant", "appropriate", "safe", "acceptable", "no violation",
-        "適法", "問題なし", "no issues"
-    ]
-
-    # 法律的に問題のある表現の検出
-    problematic_expressions = [
-        "医師が推奨", "医師が推奨する", "医師推奨", "癌が治る", "癌を治す", "癌の治療",
-        "病気が治る", "病気を治す", "治療効果", "薬効", "効能", "治癒", "cure", "treat",
-        "prevent disease", "medical claim", "health benefit", "disease"
-    ]
-
-    analysis_lower = analysis_summary.lower()
-
-    # 分析結果に違反を示唆する表現が含まれているか
-    has_violation_indicators = any(indicator.lower() in analysis_lower for indicator in violation_indicators)
-    has_compliant_indicators = any(indicator.lower() in analysis_lower for indicator in compliant_indicators)
-
-    # 入力テキストに問題表現が含まれているか
-    input_has_problematic = any(expr in input_text for expr in problematic_expressions)
-
-    # ヒューリスティックな判断：IRACの結論と入力テキストの問題表現を組み合わせて判断
-    if input_has_problematic:
-        return False, f"テキストに問題表現 '{[expr for expr in problematic_expressions if expr in input_text][0]}' が含まれています"
-
-    if has_violation_indicators and not has_compliant_indicators:
-        return False, "分析結果には違法性を示唆する表現が含まれています"
+    import time
+    start_time = time.time()
 
-    if has_compliant_indicators and not has_violation_indicators:
-        return True, "分析結果では法律遵守とされています"
+    # 重複を除いた処理対象（キー → 最初に出現した位置）
+    first_index: Dict[Any, int] = {}
+    for i, content in enumerate(request.contents):
+        first_index.setdefault((content.type, normalize_text(content.data)), i)
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_one(index: int):
+        async with semaphore:
+            try:
+                response = await check_compliance(
+                    ComplianceCheckRequest(content=request.contents[index], options=request.options)
+                )
+                return BatchItemResult(index=index, status="success", response=response)
+            except Exception as e:
+                print(f"Batch item {index} failed: {e}")
+                return BatchItemResult(index=index, status="error", error=str(e))
+
+    unique_results = await asyncio.gather(*(run_one(i) for i in first_index.values()))
+    by_index = {r.index: r for r in unique_results}
+
+    results = []
+    for i, content in enumerate(request.contents):
+        source = first_index[(content.type, normalize_text(content.data))]
+        if source == i:
+            results.append(by_index[i])
+        else:
+            results.append(by_index[source].model_copy(update={"index": i, "duplicate_of": source}))
+
+    # トークン使用量の合計（キャッシュから返した結果は今回LLMを呼んでいないため除く）
+    token_usage = {"input": 0, "output": 0, "total": 0}
+    cache_hits = 0
+    for r in unique_results:
+        if r.response is None or not r.response.result:
+            continue
+        analysis_log = r.response.result.get("analysis_log", {})
+        if "cache" in analysis_log:
+            cache_hits += 1
+            continue
+        for key in token_usage:
+            token_usage[key] += analysis_log.get("token_usage", {}).get(key, 0)
+
+    failed = sum(1 for r in results if r.status != "success")
+    # 判定ごとの件数（重複した項目も位置ごとに数える）
+    verdicts = {"compliant": 0, "non_compliant": 0, "unclear": 0}
+    for r in results:
+        verdict = r.response.result.get("verdict") if r.response and r.response.result else None
+        if verdict in verdicts:
+            verdicts[verdict] += 1
+    if failed == 0:
+        status = "success"
+    elif failed == len(results):
+        status = "error"
+    else:
+        status = "partial"
+
+    return BatchComplianceCheckResponse(
+        status=status,
+        results=results,
+        summary={
+            "total": len(results),
+            "unique": len(unique_results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "cache_hits": cache_hits,
+            "verdicts": verdicts,
+        },
+        token_usage=token_usage,
+        processing_time=int((time.time() - start_time) * 1000)
+    )
 
-    # IRAC構造から判断（場合分け）
-    if "issue:" in analysis_lower and ("not compliant" in analysis_lower or "violation" in analysis_lower):
-        return False, "IRACのIssueで違反が指摘されています"
 
-    if "conclusion:" in analysis_lower and ("compliant" in analysis_lower or "appropriate" in analysis_lower):
-        return True, "IRACのConclusionで遵守とされています"
+def _cached_response(cached_response: ComplianceCheckResponse, hit_info: Dict, start_time: float) -> ComplianceCheckResponse:
+    """キャッシュ済みのレスポンスを複製し、キャッシュヒットの情報と処理時間を付与する"""
+    import time
+    response = cached_response.model_copy(deep=True)
+    response.processing_time = int((time.time() - start_time) * 1000)
+    analysis_log = response.result.setdefault("analysis_log", {})
+    analysis_log["cache"] = {**hit_info, "original_processing_time": cached_response.processing_time}
+    print(f"Result cache hit ({hit_info['hit']})")
+    return response
 
-    # デフォルトでは、問題があると判断（安全側）
-    return False, "分析結果が明確でないため、違反可能性が高いと判断しました"
\ No newline at end of file
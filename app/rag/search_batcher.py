@@ -0,0 +1,69 @@
+import asyncio
+import os
+from typing import Callable, Dict, List
+
+# 並行する検索リクエストをまとめる待ち時間（ミリ秒）と1回にまとめる最大クエリ数
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "5"))
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "96"))
+
+
+class SearchBatcher:
+    """
+    同時に実行中の複数ワークフローからの検索をまとめて1回の search_documents_batch で処理する。
+    バッチAPIなどで多数のリクエストが並行する場合、クエリのembeddingが1回のencodeにまとまる。
+    単発のリクエストでは待ち時間（window_ms）だけ遅れて、そのまま実行される。
+    """
+
+    def __init__(self,
+                 search_fn: Callable[[List[Dict]], List[Dict]],
+                 window_ms: float = SEARCH_BATCH_WINDOW_MS,
+                 max_queries: int = SEARCH_BATCH_MAX_QUERIES):
+        self._search_fn = search_fn
+        self.window_ms = window_ms
+        self.max_queries = max_queries
+        self._pending: List = []  # [(searches, future), ...]
+        self._pending_queries = 0
+        self._timer = None
+        # 実行中のバッチのタスク（参照を持たないタスクは完了前にGCされることがあるため）
+        self._tasks = set()
+
+    async def search(self, searches: List[Dict]) -> List[Dict]:
+        """search_documents_batch と同じ入出力。他の呼び出しとまとめて実行される"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((searches, future))
+        self._pending_queries += len(searches)
+
+        if self._pending_queries >= self.max_queries or self.window_ms <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_queries = self._pending, [], 0
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List):
+        merged = [s for searches, _ in pending for s in searches]
+        if len(pending) > 1:
+            print(f"Batched {len(merged)} queries from {len(pending)} requests")
+        try:
+            results = await asyncio.to_thread(self._search_fn, merged)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for searches, future in pending:
+            if not future.done():
+                future.set_result(results[offset:offset + len(searches)])
+            offset += len(searches)
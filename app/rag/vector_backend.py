@@ -0,0 +1,437 @@
+import bisect
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence
+
+from app.rag.index_artifact import CHROMA_DIR
+
+# インデックス構築に使うベクトル検索バックエンド（サーバーはインデックスに記録されたバックエンドで開く）
+# - chroma（既定）: ChromaDBのPersistentClient（HNSW）
+# - matrix: プロセス内の行列（numpyのmemmap）による総当たりのコサイン類似度検索。数千チャンク規模なら十分に速く、SQLiteのロックもない。
+#           成果物は読み込み専用でmemmapするため、複数のワーカーでページキャッシュを共有できる
+#           vector_benchmark で手元のインデックスと比較してから VECTOR_BACKEND=matrix で切り替える
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_BACKENDS = ("chroma", "matrix")
+COLLECTION_NAME = "legal_documents"
+
+# matrixバックエンドの成果物（インデックスのバージョンディレクトリ内）と形式バージョン
+MATRIX_DIR = "matrix"
+MATRIX_FORMAT_VERSION = 2
+# ベクトルの保存精度: float32 / float16（float16はサイズが半分になるが、検索時にfloat32へ変換する）
+MATRIX_DTYPE = os.getenv("MATRIX_DTYPE", "float32")
+# 値ごとの整数コードを保存しておくメタデータ列（フィルタを配列の比較で行う）
+MATRIX_FILTER_COLUMNS = ("law_group", "category", "source_type")
+
+
+class VectorBackend:
+    """
+    ベクトル検索バックエンドのインターフェース
+    戻り値の形式は Chroma の collection.query / collection.get に合わせる
+    （query: {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}）
+    """
+    name = ""
+    # 距離の種類（distance_to_similarity に渡す）
+    space = "l2"
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        """ドキュメントを追加する。同じIDがある場合は置き換える"""
+        raise NotImplementedError
+
+    def query(self, query_embeddings: List[List[float]], n_results: int, where: Optional[Dict] = None) -> Dict:
+        """クエリごとに類似度の高い n_results 件を返す。where はメタデータの一致条件"""
+        raise NotImplementedError
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict:
+        """IDまたは範囲を指定してドキュメントを取得する（存在しないIDは結果に含まれない）"""
+        raise NotImplementedError
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """メタデータを置き換える（embeddingは変えない）"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def reset(self):
+        """全ドキュメントを削除する（再インデックス用）"""
+        raise NotImplementedError
+
+    def persist(self):
+        """構築した内容をディスクに書き出す（書き込みのたびに保存されるバックエンドでは何もしない）"""
+
+
+class ChromaBackend(VectorBackend):
+    """ChromaDBのコレクション"""
+    name = "chroma"
+
+    def __init__(self, index_dir: Optional[str] = None, embedding_function=None,
+                 writable: bool = False, collection=None):
+        self.embedding_function = embedding_function
+        self.client = None
+        if collection is not None:
+            self.collection = collection
+        elif writable:
+            self.client, self.collection = self._init_chroma(os.path.join(index_dir, CHROMA_DIR))
+        else:
+            import chromadb
+            self.client = chromadb.PersistentClient(path=os.path.join(index_dir, CHROMA_DIR))
+            self.collection = self.client.get_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+
+    def _init_chroma(self, chroma_db_path: str):
+        """
+        ChromaDBクライアントとコレクションを安全に初期化する（インデックス構築用）
+        スキーマ不整合（バージョンアップ時など）が発生した場合、自動でDBを削除・再作成する
+        """
+        import chromadb
+        try:
+            client = chromadb.PersistentClient(path=chroma_db_path)
+            collection = client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=self.embedding_function
+            )
+            return client, collection
+        except Exception as e:
+            print(f"⚠ ChromaDB初期化エラー（スキーマ不整合の可能性）: {e}")
+            print(f"→ 旧DBを削除して再作成します: {chroma_db_path}")
+            if os.path.exists(chroma_db_path):
+                shutil.rmtree(chroma_db_path, ignore_errors=True)
+            client = chromadb.PersistentClient(path=chroma_db_path)
+            collection = client.create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=self.embedding_function
+            )
+            print("✓ ChromaDB再作成完了")
+            return client, collection
+
+    @property
+    def space(self) -> str:
+        return (getattr(self.collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def get(self, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        if ids is not None:
+            return self.collection.get(ids=ids, include=list(include))
+        return self.collection.get(limit=limit, offset=offset, include=list(include))
+
+    def update_metadatas(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self):
+        return self.collection.count()
+
+    def reset(self):
+        print("Resetting vector store...")
+        try:
+            self.client.delete_collection(name=COLLECTION_NAME)
+            self.collection = self.client.create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=self.embedding_function
+            )
+            print("Vector store reset successful.")
+        except Exception as e:
+            print(f"Error resetting vector store: {e}")
+            self.collection = self.client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                embedding_function=self.embedding_function
+            )
+
+
+class _StringColumn:
+    """
+    memmapしたUTF-8のバイト列と行ごとのオフセット（N+1個）による文字列の列
+    アクセスした行だけをデコードするため、プロセスごとに全行のPythonオブジェクトを持たない
+    """
+
+    def __init__(self, path: str):
+        import numpy as np
+        self.offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        self.blob = np.memmap(f"{path}.bin", dtype=np.uint8, mode="r") if self.offsets[-1] else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return bytes(self.blob[int(self.offsets[row]):int(self.offsets[row + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+
+class _JsonColumn(_StringColumn):
+    """行ごとのJSON（メタデータ）の列。アクセスした行だけをパースする"""
+
+    def __getitem__(self, row: int) -> Dict:
+        return json.loads(super().__getitem__(row))
+
+
+def _write_strings(path: str, values: Sequence[str]):
+    """_StringColumn の形式（<path>.bin と <path>.offsets.npy）で書き出す"""
+    import numpy as np
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(f"{path}.bin", 'wb') as f:
+        f.write(b"".join(encoded))
+    np.save(f"{path}.offsets.npy", offsets)
+
+
+class MatrixBackend(VectorBackend):
+    """
+    プロセス内の行列による総当たり検索
+    成果物（<index_dir>/matrix/）はすべて読み込み専用でmemmapできる形式で、複数のAPIワーカーが同じインデックスを
+    開いてもOSのページキャッシュを共有する（ワーカーごとにコピーを持たない）:
+      format.json    … 形式バージョン・件数・次元・精度と、MATRIX_FILTER_COLUMNS の値の一覧
+      vectors.npy    … L2正規化済みのベクトル（N×次元、MATRIX_DTYPE）
+      ids / documents / metadatas（.bin + .offsets.npy） … 行ごとのID・本文・メタデータ（JSON）のUTF-8バイト列
+      ids_order.npy  … IDの昇順に並べた行番号（IDによる取得は二分探索で行う）
+      column_<名前>.npy … 行ごとのメタデータの値のコード
+    検索はクエリをまとめた行列積で行い、where の一致条件はメタデータ列のコードの比較（ベクトル化）で絞り込む。
+    構築時（writable=True）は全体をメモリ上で更新し、persist で書き出す。
+    """
+    name = "matrix"
+    space = "cosine"
+
+    def __init__(self, index_dir: str, writable: bool = False, dtype: str = MATRIX_DTYPE):
+        import numpy as np
+        self.path = os.path.join(index_dir, MATRIX_DIR)
+        self.writable = writable
+        self.dtype = dtype
+        self.ids: Sequence[str] = []
+        self.documents: Sequence[str] = []
+        self.metadatas: Sequence[Dict] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        # メタデータ列名 → (値 → コード, 行ごとのコード配列)
+        self._columns: Dict[str, tuple] = {}
+        self._order = None
+        self.row_of: Dict[str, int] = {}
+
+        format_path = os.path.join(self.path, "format.json")
+        info = {}
+        if os.path.exists(format_path):
+            with open(format_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        if info.get("format") == MATRIX_FORMAT_VERSION:
+            self._load(info)
+        elif info or os.path.exists(self.path):
+            # 形式の古い成果物: 構築時は空から作り直し（件数の不一致で全件再構築になる）、検索時はエラー
+            if not writable:
+                raise ValueError(f"Unsupported matrix index format in {self.path}. "
+                                 "Rebuild with `python -m app.rag.build_index --full`.")
+            print(f"⚠ 形式の古いmatrixインデックスを破棄します: {self.path}")
+
+    def _load(self, info: Dict):
+        import numpy as np
+        mmap_mode = None if self.writable else "r"
+        ids = _StringColumn(os.path.join(self.path, "ids"))
+        documents = _StringColumn(os.path.join(self.path, "documents"))
+        metadatas = _JsonColumn(os.path.join(self.path, "metadatas"))
+        vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode=mmap_mode)
+        if self.writable:
+            # 差分ビルド: 前回の成果物をメモリ上に読み込んで更新する
+            self.ids, self.documents, self.metadatas = list(ids), list(documents), list(metadatas)
+            self.vectors = np.array(vectors, dtype=np.float32)
+            self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            return
+        self.ids, self.documents, self.metadatas, self.vectors = ids, documents, metadatas, vectors
+        self._order = np.load(os.path.join(self.path, "ids_order.npy"), mmap_mode="r")
+        for name, values in info.get("columns", {}).items():
+            codes = np.load(os.path.join(self.path, f"column_{name}.npy"), mmap_mode="r")
+            self._columns[name] = ({v: i for i, v in enumerate(values)}, codes)
+
+    def _row(self, doc_id: str) -> Optional[int]:
+        """IDの行番号（ない場合はNone）。読み込み専用のときは ids_order の二分探索で引く"""
+        if self._order is None:
+            return self.row_of.get(doc_id)
+        pos = bisect.bisect_left(self._order, doc_id, key=lambda r: self.ids[int(r)])
+        if pos < len(self._order) and self.ids[int(self._order[pos])] == doc_id:
+            return int(self._order[pos])
+        return None
+
+    def _check_writable(self):
+        if not self.writable:
+            raise RuntimeError("Matrix index is opened read-only")
+
+    def _column(self, name: str):
+        """メタデータ列の (値 → コード, 行ごとのコード配列)。保存されていない列は初回に作る"""
+        import numpy as np
+        if name not in self._columns:
+            values: Dict = {}
+            codes = np.fromiter(
+                (values.setdefault(json.dumps(meta.get(name), ensure_ascii=False), len(values))
+                 for meta in self.metadatas),
+                dtype=np.int32, count=len(self.metadatas))
+            self._columns[name] = ({json.loads(v): c for v, c in values.items()}, codes)
+        return self._columns[name]
+
+    def _mask(self, where: Optional[Dict]):
+        """where（{"key": value} または {"$and": [...]}）に一致する行のブール配列。条件がない場合はNone"""
+        import numpy as np
+        if not where:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, value in where.items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self._mask(clause)
+                continue
+            if key.startswith("$") or isinstance(value, dict):
+                raise ValueError(f"Unsupported where clause for matrix backend: {key}")
+            value_codes, codes = self._column(key)
+            code = value_codes.get(value)
+            if code is None:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= np.asarray(codes) == code
+        return mask
+
+    @staticmethod
+    def _normalize(vectors):
+        import numpy as np
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        import numpy as np
+        self._check_writable()
+        vectors = self._normalize(embeddings)
+        if not len(self.ids):
+            self.vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        appended = []
+        for doc_id, vector, text, meta in zip(ids, vectors, documents, metadatas):
+            row = self.row_of.get(doc_id)
+            if row is None:
+                self.row_of[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.documents.append(text)
+                self.metadatas.append(dict(meta or {}))
+                appended.append(vector)
+            else:
+                self.vectors[row] = vector
+                self.documents[row] = text
+                self.metadatas[row] = dict(meta or {})
+        if appended:
+            self.vectors = np.vstack([self.vectors, np.asarray(appended, dtype=np.float32)])
+        self._columns = {}
+
+    def query(self, query_embeddings, n_results, where=None):
+        import numpy as np
+        empty = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        queries = self._normalize(query_embeddings) if len(query_embeddings) else None
+        if queries is None:
+            return empty
+        mask = self._mask(where)
+        rows = np.arange(len(self.ids)) if mask is None else np.flatnonzero(mask)
+        results = {key: [] for key in empty}
+        if not len(rows):
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+            return results
+
+        matrix = self.vectors if mask is None else self.vectors[rows]
+        similarities = queries @ np.asarray(matrix, dtype=np.float32).T
+        k = min(n_results, len(rows))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        for q in range(len(queries)):
+            order = top[q][np.argsort(-similarities[q, top[q]])]
+            selected = [int(r) for r in rows[order]]
+            results["ids"].append([self.ids[r] for r in selected])
+            results["documents"].append([self.documents[r] for r in selected])
+            results["metadatas"].append([self.metadatas[r] for r in selected])
+            # コサイン距離（1 - コサイン類似度）
+            results["distances"].append([float(1.0 - s) for s in similarities[q, order]])
+        return results
+
+    def get(self, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        if ids is not None:
+            rows = [row for row in map(self._row, ids) if row is not None]
+        else:
+            start = offset or 0
+            rows = list(range(start, len(self.ids) if limit is None else min(len(self.ids), start + limit)))
+        result = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[r] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[r] for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [[float(x) for x in self.vectors[r]] for r in rows]
+        return result
+
+    def update_metadatas(self, ids, metadatas):
+        self._check_writable()
+        for doc_id, meta in zip(ids, metadatas):
+            if doc_id in self.row_of:
+                self.metadatas[self.row_of[doc_id]] = dict(meta or {})
+        self._columns = {}
+
+    def delete(self, ids):
+        self._check_writable()
+        remove = {self.row_of[doc_id] for doc_id in ids if doc_id in self.row_of}
+        if not remove:
+            return
+        keep = [r for r in range(len(self.ids)) if r not in remove]
+        self.ids = [self.ids[r] for r in keep]
+        self.documents = [self.documents[r] for r in keep]
+        self.metadatas = [self.metadatas[r] for r in keep]
+        self.vectors = self.vectors[keep]
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._columns = {}
+
+    def count(self):
+        return len(self.ids)
+
+    def reset(self):
+        import numpy as np
+        self._check_writable()
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.row_of = {}
+        self._columns = {}
+
+    def persist(self):
+        """一時ディレクトリに書き出してから置き換える（書き込み途中の成果物を残さないため）"""
+        import numpy as np
+        self._check_writable()
+        tmp_path = f"{self.path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "vectors.npy"), np.asarray(self.vectors, dtype=self.dtype))
+        _write_strings(os.path.join(tmp_path, "ids"), self.ids)
+        _write_strings(os.path.join(tmp_path, "documents"), self.documents)
+        _write_strings(os.path.join(tmp_path, "metadatas"),
+                       [json.dumps(meta, ensure_ascii=False) for meta in self.metadatas])
+        np.save(os.path.join(tmp_path, "ids_order.npy"),
+                np.asarray(sorted(range(len(self.ids)), key=self.ids.__getitem__), dtype=np.int32))
+        columns = {}
+        for name in MATRIX_FILTER_COLUMNS:
+            value_codes, codes = self._column(name)
+            columns[name] = [v for v, _ in sorted(value_codes.items(), key=lambda x: x[1])]
+            np.save(os.path.join(tmp_path, f"column_{name}.npy"), np.asarray(codes, dtype=np.int32))
+        with open(os.path.join(tmp_path, "format.json"), 'w', encoding='utf-8') as f:
+            json.dump({"format": MATRIX_FORMAT_VERSION, "count": len(self.ids),
+                       "dim": int(self.vectors.shape[1]) if len(self.ids) else 0,
+                       "dtype": self.dtype, "columns": columns}, f, ensure_ascii=False)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+
+
+def create_backend(name: str, index_dir: str, embedding_function=None, writable: bool = False) -> VectorBackend:
+    """バックエンド名からインデックスディレクトリのバックエンドを開く"""
+    if name == "chroma":
+        return ChromaBackend(index_dir, embedding_function=embedding_function, writable=writable)
+    if name == "matrix":
+        return MatrixBackend(index_dir, writable=writable)
+    raise ValueError(f"Unknown vector backend: {name}")
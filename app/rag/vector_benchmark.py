@@ -0,0 +1,191 @@
+"""
+ベクトル検索バックエンドの比較ベンチマーク（オフライン実行用）
+
+    python -m app.rag.vector_benchmark                       # 公開中のインデックスで chroma と matrix を比較
+    python -m app.rag.vector_benchmark --queries 500 --top-k 5 --output vector_benchmark.json
+
+公開中のインデックスから全チャンクの本文・メタデータ・embeddingを読み出し、一時ディレクトリに
+バックエンドごとのインデックスを作って、同じクエリで次の値を測る。
+- 構築時間・ディスク上の大きさ
+- 1クエリずつ検索した場合のレイテンシ（p50/p95）と、クエリをまとめて検索した場合のクエリあたりの時間
+- 総当たり（float32の厳密な距離。バックエンドの space に合わせてコサインまたはL2）の上位k件に対する再現率（recall@k）
+クエリはチャンクのembeddingにノイズを加えたもので、検索時のフィルタ（law_group）は本番の検索と同じく
+法令グループを順に使う。embeddingモデルは読み込まない。
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+from app.rag import index_artifact
+from app.rag.vector_backend import VECTOR_BACKENDS, create_backend
+
+# クエリに加えるノイズの大きさ（embeddingのノルムに対する比）
+QUERY_NOISE = 0.3
+# まとめて検索する場合の1回あたりのクエリ数
+BATCH_QUERIES = 8
+
+
+def load_index_documents(index_dir: str, batch_size: int = 1000) -> Dict:
+    """公開中のインデックスから ids・documents・metadatas・embeddings を読み出す"""
+    info = index_artifact.read_index_info(index_dir)
+    source = create_backend(info.get("vector_backend", "chroma"), index_dir)
+    data = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+    for offset in range(0, source.count(), batch_size):
+        batch = source.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+        for key in data:
+            data[key].extend(batch[key])
+    return data
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def make_queries(data: Dict, n: int, seed: int = 0) -> List[Dict]:
+    """ランダムなチャンクのembeddingにノイズを加えたクエリと、フィルタ（law_group）の組を作る"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    groups = sorted({(meta or {}).get("law_group") for meta in data["metadatas"]} - {None})
+    picks = random.Random(seed).choices(range(len(data["ids"])), k=n)
+    queries = []
+    for j, row in enumerate(picks):
+        vector = np.asarray(data["embeddings"][row], dtype=np.float32)
+        noise = rng.normal(size=vector.shape).astype(np.float32)
+        vector = vector + QUERY_NOISE * np.linalg.norm(vector) * noise / (np.linalg.norm(noise) + 1e-12)
+        where = {"law_group": groups[j % len(groups)]} if groups and j % (len(groups) + 1) else None
+        queries.append({"embedding": vector.tolist(), "where": where})
+    return queries
+
+
+def exact_top_k(data: Dict, queries: List[Dict], top_k: int, space: str = "cosine") -> List[List[str]]:
+    """総当たりの厳密な距離による上位k件（再現率の基準）。space はバックエンドと同じ "cosine" / "l2" """
+    import numpy as np
+
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if space == "cosine":
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    groups = np.asarray([(meta or {}).get("law_group") for meta in data["metadatas"]], dtype=object)
+    expected = []
+    for query in queries:
+        q = np.asarray(query["embedding"], dtype=np.float32)
+        if space == "cosine":
+            scores = vectors @ (q / (np.linalg.norm(q) + 1e-12))
+        else:
+            scores = -np.sum((vectors - q) ** 2, axis=1)
+        if query["where"]:
+            scores = np.where(groups == query["where"]["law_group"], scores, -np.inf)
+        order = [int(i) for i in np.argsort(-scores)[:top_k] if np.isfinite(scores[i])]
+        expected.append([data["ids"][i] for i in order])
+    return expected
+
+
+def evaluate(name: str, data: Dict, queries: List[Dict], expected: Dict[str, List[List[str]]],
+             top_k: int, work_dir: str, batch_size: int = 500) -> Dict:
+    """
+    1つのバックエンドにインデックスを作り、構築時間・大きさ・レイテンシ・再現率を測る
+    expected は space ごとの基準（exact_top_k の結果）のキャッシュで、未計算の space はここで求める
+    """
+    index_dir = os.path.join(work_dir, name)
+    os.makedirs(index_dir)
+
+    start_time = time.perf_counter()
+    backend = create_backend(name, index_dir, writable=True)
+    for i in range(0, len(data["ids"]), batch_size):
+        backend.add(ids=data["ids"][i:i + batch_size], embeddings=data["embeddings"][i:i + batch_size],
+                    documents=data["documents"][i:i + batch_size], metadatas=data["metadatas"][i:i + batch_size])
+    backend.persist()
+    build_seconds = time.perf_counter() - start_time
+    # 検索はサーバーと同じく読み込み専用で開き直して測る
+    start_time = time.perf_counter()
+    backend = create_backend(name, index_dir)
+    open_seconds = time.perf_counter() - start_time
+
+    latencies = []
+    found = []
+    for query in queries:
+        start_time = time.perf_counter()
+        result = backend.query(query_embeddings=[query["embedding"]], n_results=top_k, where=query["where"])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        found.append(result["ids"][0])
+
+    # 同じフィルタのクエリをまとめて検索（search_documents_batch と同じ使い方）
+    by_filter: Dict[str, List[Dict]] = {}
+    for query in queries:
+        by_filter.setdefault(json.dumps(query["where"], sort_keys=True), []).append(query)
+    start_time = time.perf_counter()
+    for group in by_filter.values():
+        for i in range(0, len(group), BATCH_QUERIES):
+            batch = group[i:i + BATCH_QUERIES]
+            backend.query(query_embeddings=[q["embedding"] for q in batch], n_results=top_k, where=batch[0]["where"])
+    batch_ms = (time.perf_counter() - start_time) * 1000 / max(len(queries), 1)
+
+    # 基準はバックエンド自身の距離で求める（chromaの既定はL2、matrixはコサイン）
+    if backend.space not in expected:
+        expected[backend.space] = exact_top_k(data, queries, top_k, backend.space)
+    reference = expected[backend.space]
+    recall = sum(len(set(f) & set(e)) / len(e) for f, e in zip(found, reference) if e) / max(sum(1 for e in reference if e), 1)
+    return {
+        "backend": name,
+        "space": backend.space,
+        "chunks": backend.count(),
+        "disk_bytes": _dir_bytes(index_dir),
+        "build_seconds": round(build_seconds, 3),
+        "open_ms": round(open_seconds * 1000, 2),
+        "p50_ms": round(_percentile(latencies, 0.5), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "qps": round(len(latencies) / (sum(latencies) / 1000), 1) if latencies else 0.0,
+        "batched_ms_per_query": round(batch_ms, 3),
+        f"recall_at_{top_k}": round(recall, 4),
+    }
+
+
+def run_benchmark(backends: Sequence[str] = VECTOR_BACKENDS,
+                  index_dir: Optional[str] = None,
+                  n_queries: int = 200,
+                  top_k: int = 5,
+                  seed: int = 0) -> List[Dict]:
+    index_dir = index_dir or index_artifact.current_index_dir()
+    if index_dir is None:
+        raise SystemExit("公開済みのインデックスがありません。`python -m app.rag.build_index` を実行してください。")
+    data = load_index_documents(index_dir)
+    queries = make_queries(data, n_queries, seed)
+    expected: Dict[str, List[List[str]]] = {}
+    print(f"{len(data['ids'])} chunks, {len(queries)} queries (index: {index_dir})")
+    with tempfile.TemporaryDirectory() as work_dir:
+        return [evaluate(name, data, queries, expected, top_k, work_dir) for name in backends]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ベクトル検索バックエンドごとの検索速度・再現率・大きさを比較する")
+    parser.add_argument("--backends", nargs="+", default=list(VECTOR_BACKENDS), choices=VECTOR_BACKENDS)
+    parser.add_argument("--index-dir", help="比較に使うインデックス（既定は公開中のバージョン）")
+    parser.add_argument("--queries", type=int, default=200, help="クエリ数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.backends, args.index_dir, n_queries=args.queries, top_k=args.top_k, seed=args.seed)
+    columns = list(results[0].keys()) if results else []
+    for column in columns:
+        print(f"{column:>22}: " + "  ".join(f"{str(r[column]):>12}" for r in results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,100 @@
-import chromadb
-from chromadb.utils import embedding_functions
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
+import json
 import os
-import shutil
+import threading
 
-# ChromaDBクライアントの初期化
-# スキーマ不整合（バージョンアップ時など）が発生した場合、自動でDBを削除・再作成する
-CHROMA_DB_PATH = "./data/chroma_db"
+from app.rag.embedding import EMBEDDING_MODEL, get_embedding_service
+from app.rag.index_artifact import current_index_dir, read_index_info
+from app.rag.lexical_index import is_article_query, load_lexical_index
+from app.rag.rerank import distance_to_similarity
+from app.rag.vector_backend import VECTOR_BACKEND, create_backend
 
-# ★ 根本修正: 日本語対応の多言語embeddingモデルを使用
+# ハイブリッド検索: ベクトル類似度とBM25（app/rag/lexical_index.py）のスコアを融合する
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# 融合スコアにおけるベクトル類似度の重み（残りがBM25の重み）
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.6"))
+
+# ★ 根本修正: 日本語対応の多言語embeddingモデル (paraphrase-multilingual-MiniLM-L12-v2) を使用
 # ChromaDBデフォルトの all-MiniLM-L6-v2 は英語専用のため日本語法律文を理解できない
-# paraphrase-multilingual-MiniLM-L12-v2 は50言語以上に対応し、日本語のセマンティック検索が可能
-EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name=EMBEDDING_MODEL
-)
-
-def _init_chroma():
-    """ChromaDBクライアントとコレクションを安全に初期化する"""
-    try:
-        _client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        _collection = _client.get_or_create_collection(
-            name="legal_documents",
-            embedding_function=embedding_func
-        )
-        return _client, _collection
-    except Exception as e:
-        print(f"⚠ ChromaDB初期化エラー（スキーマ不整合の可能性）: {e}")
-        print(f"→ 旧DBを削除して再作成します: {CHROMA_DB_PATH}")
-        if os.path.exists(CHROMA_DB_PATH):
-            shutil.rmtree(CHROMA_DB_PATH, ignore_errors=True)
-        _client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        _collection = _client.create_collection(
-            name="legal_documents",
-            embedding_function=embedding_func
-        )
-        print("✓ ChromaDB再作成完了")
-        return _client, _collection
+# バッチサイズ・スレッド数・精度などの設定は app/rag/embedding.py を参照
+embedding_func = get_embedding_service()
+
+def open_for_build(index_dir: str):
+    """
+    ビルド中のインデックスディレクトリを書き込み用に開く（build_index専用）
+    バックエンドは VECTOR_BACKEND（app/rag/vector_backend.py）で選ぶ
+    """
+    global backend, index_info, current_dir, lexical_index, _index_opened
+    backend = create_backend(VECTOR_BACKEND, index_dir, embedding_function=embedding_func, writable=True)
+    _index_opened = True
+    index_info = {}
+    current_dir = index_dir
+    lexical_index = None
+
+def open_current_index():
+    """
+    公開済みのインデックスを検索用に開く。サーバーはインデックスを構築しない。
+    未構築の場合は警告を出し、検索結果は空になる。
+    バックエンドはインデックスの構築時に記録したもの（記録がない古いインデックスはchroma）を使う。
+    """
+    global backend, index_info, current_dir, lexical_index, _index_opened
+    _index_opened = True
+    index_dir = current_index_dir()
+    if index_dir is None:
+        print("⚠ 公開済みのインデックスがありません。`python -m app.rag.build_index` を実行してください。")
+        backend, index_info, current_dir, lexical_index = None, {}, None, None
+        return
+    index_info = read_index_info(index_dir)
+    if index_info.get("embedding_model") not in (None, EMBEDDING_MODEL):
+        print(f"⚠ インデックスのembeddingモデル ({index_info.get('embedding_model')}) が現在の設定 ({EMBEDDING_MODEL}) と異なります。")
+    backend = create_backend(index_info.get("vector_backend", "chroma"), index_dir, embedding_function=embedding_func)
+    current_dir = index_dir
+    # 語彙索引がない（ハイブリッド検索の導入前にビルドした）インデックスはベクトル検索のみで検索する
+    lexical_index = load_lexical_index(index_dir) if HYBRID_SEARCH else None
+    print(f"✓ Index opened: version={index_info.get('version')} backend={backend.name} chunks={backend.count()} "
+          f"lexical={'yes' if lexical_index is not None else 'no'}")
+
+# backend: 開いているインデックスのベクトル検索バックエンド（app/rag/vector_backend.py）
+# current_dir: 開いているインデックスのバージョンディレクトリ（語彙ファイルなどの読み込みに使う）
+# lexical_index: 開いているインデックスの語彙索引（BM25・条文番号）
+# インデックスはimport時には開かず、FastAPIのlifespan（app/main.py）か最初の検索で開く
+backend, index_info, current_dir, lexical_index = None, {}, None, None
+_index_opened = False
+_index_lock = threading.Lock()
+
+def ensure_index_open():
+    """
+    公開済みのインデックスをまだ開いていなければ開く
+    （テストなどで backend を差し替えている場合は何もしない）
+    """
+    if _index_opened or backend is not None:
+        return
+    with _index_lock:
+        if not _index_opened and backend is None:
+            open_current_index()
+
+def get_index_info() -> Dict:
+    """開いているインデックスのメタ情報（未オープンの場合は開く）"""
+    ensure_index_open()
+    return index_info
 
-client, collection = _init_chroma()
+def get_current_dir():
+    """開いているインデックスのバージョンディレクトリ（未オープンの場合は開く）"""
+    ensure_index_open()
+    return current_dir
 
 def reset_vector_store():
     """
-    コレクションを削除して新しく作成し直す（再インデックス用）
+    全ドキュメントを削除する（再インデックス用）
     """
-    global collection
-    print("Resetting vector store...")
-    try:
-        client.delete_collection(name="legal_documents")
-        collection = client.create_collection(
-            name="legal_documents",
-            embedding_function=embedding_func
-        )
-        print("Vector store reset successful.")
-    except Exception as e:
-        print(f"Error resetting vector store: {e}")
-        collection = client.get_or_create_collection(
-            name="legal_documents",
-            embedding_function=embedding_func
-        )
+    backend.reset()
+
+def persist():
+    """
+    構築したインデックスをディスクに書き出す（build_index専用。matrixバックエンドはここで成果物を保存する）
+    """
+    backend.persist()
 
 def initialize_vector_store(documents: List[Dict]):
     """
@@ -74,16 +110,15 @@ def initialize_vector_store(documents: List[Dict]):
     
     for i in range(0, total_docs, batch_size):
         batch = documents[i:i + batch_size]
-        # IDは単純な連番ではなく、ユニークなものにするのがベターだが、
-        # ここでは再構築前提で連番にする（既存データがある場合は重複エラーになる可能性があるため注意）
-        # ただし、retrieval.py側でデータがある場合はこの関数を呼ばない制御をしている。
-        ids = [f"doc_{j}" for j in range(i, i + len(batch))]
+        # IDは path / section から導出した安定ID（loaders.assign_chunk_ids で付与）を使用する
+        ids = [doc["id"] for doc in batch]
         texts = [doc["content"] for doc in batch]
         metadatas = [doc.get("metadata", {}) for doc in batch]
         
         try:
-            collection.add(
+            backend.add(
                 ids=ids,
+                embeddings=embedding_func.encode_documents(texts),
                 documents=texts,
                 metadatas=metadatas
             )
@@ -91,14 +126,54 @@ def initialize_vector_store(documents: List[Dict]):
         except Exception as e:
             print(f"Error adding batch {i}-{i + len(batch)}: {e}")
 
+def upsert_documents(documents: List[Dict], batch_size: int = 100):
+    """
+    安定IDを持つドキュメントを追加または更新する（差分インデックス用）
+    """
+    total_docs = len(documents)
+    print(f"Upserting {total_docs} documents...")
+    for i in range(0, total_docs, batch_size):
+        batch = documents[i:i + batch_size]
+        texts = [doc["content"] for doc in batch]
+        backend.add(
+            ids=[doc["id"] for doc in batch],
+            embeddings=embedding_func.encode_documents(texts),
+            documents=texts,
+            metadatas=[doc.get("metadata", {}) for doc in batch]
+        )
+        print(f"Upserted batch {i // batch_size + 1}/{(total_docs - 1) // batch_size + 1}")
+
+def update_metadatas(updates: Dict[str, Dict], batch_size: int = 500):
+    """
+    指定IDのドキュメントのメタデータに値を追加・上書きする（embeddingは再計算しない）
+    updates: {ID: 追加・上書きするメタデータ}
+    """
+    ids = list(updates)
+    print(f"Updating metadata of {len(ids)} documents...")
+    for i in range(0, len(ids), batch_size):
+        current = backend.get(ids=ids[i:i + batch_size], include=["metadatas"])
+        backend.update_metadatas(
+            ids=current["ids"],
+            metadatas=[{**(meta or {}), **updates[doc_id]} for doc_id, meta in zip(current["ids"], current["metadatas"])]
+        )
+
+def delete_documents(ids: List[str], batch_size: int = 500):
+    """
+    指定IDのドキュメントを削除する（差分インデックス用）
+    """
+    print(f"Deleting {len(ids)} documents...")
+    for i in range(0, len(ids), batch_size):
+        backend.delete(ids=ids[i:i + batch_size])
+
 def search_documents(query: str, top_k: int = 5, where: Dict = None):
     """
     クエリに類似するドキュメントを検索する関数。metadataによるフィルタリングをサポート。
     """
     print(f"Searching for: {query} (top_k={top_k}, where={where})")
+    ensure_index_open()
     try:
-        results = collection.query(
-            query_texts=[query],
+        results = backend.query(
+            query_embeddings=embedding_func.encode([query]),
             n_results=top_k,
             where=where
         )
@@ -117,8 +192,151 @@ def search_documents(query: str, top_k: int = 5, where: Dict = None):
         print(f"Error searching documents: {e}")
         return {"documents": [[]], "metadatas": [[]]}
 
+def search_documents_batch(searches: List[Dict]) -> List[Dict]:
+    """
+    複数クエリをまとめて検索する関数。
+    searches: [{"query": str, "top_k": int, "where": Dict}, ...]
+    全クエリのembeddingを1回のencodeで計算し、同じフィルタのクエリは1回のbackend.queryにまとめる。
+    フィルタごとの問い合わせは並列に実行する。
+    語彙索引がある場合:
+    - 条文番号だけのクエリ（例: "薬機法 第66条"）は条文番号の索引から直接引き、embeddingを計算しない
+    - それ以外のクエリはベクトル検索とBM25の結果を融合する（_fuse_lexical を参照）
+    戻り値は searches と同じ順序の検索結果（search_documents と同じ形式に、類似度 "similarities" を加えたもの）。
+    """
+    if not searches:
+        return []
+    ensure_index_open()
+    empty = {"documents": [[]], "metadatas": [[]]}
+    results: List[Dict] = [empty] * len(searches)
+    lexical = lexical_index
+
+    # 条文番号の直接参照
+    article_hits: Dict[int, List[str]] = {}
+    if lexical is not None:
+        for i, search in enumerate(searches):
+            if is_article_query(search["query"]):
+                ids = lexical.lookup_articles(search["query"], search.get("where"))[:search.get("top_k", 5)]
+                if ids:
+                    article_hits[i] = ids
+    pending = [i for i in range(len(searches)) if i not in article_hits]
+
+    vectors = {}
+    if pending:
+        try:
+            # 同じクエリ文は1回だけembeddingする
+            unique_queries = list(dict.fromkeys(searches[i]["query"] for i in pending))
+            vectors = dict(zip(unique_queries, embedding_func.encode(unique_queries)))
+        except Exception as e:
+            # ベクトル検索だけを省き、語彙索引があればBM25の結果は返す
+            print(f"Error embedding queries: {e}")
+
+    # where（フィルタ）ごとにまとめる（embeddingできたクエリのみ）
+    groups: Dict[str, List[int]] = {}
+    for i in pending:
+        if searches[i]["query"] not in vectors:
+            continue
+        groups.setdefault(json.dumps(searches[i].get("where"), sort_keys=True, ensure_ascii=False), []).append(i)
+
+    space = backend.space if backend is not None else "l2"
+
+    def run_group(indices: List[int]):
+        where = searches[indices[0]].get("where")
+        n_results = max(searches[i].get("top_k", 5) for i in indices)
+        print(f"Searching {len(indices)} queries (top_k={n_results}, where={where})")
+        try:
+            grouped = backend.query(
+                query_embeddings=[vectors[searches[i]["query"]] for i in indices],
+                n_results=n_results,
+                where=where
+            )
+        except Exception as e:
+            print(f"Error searching documents: {e}")
+            return
+        # まとめた結果をクエリごとの結果（top_k件）に分ける
+        for row, i in enumerate(indices):
+            top_k = searches[i].get("top_k", 5)
+            results[i] = {key: [value[row][:top_k]] for key, value in grouped.items()
+                          if isinstance(value, list) and value and isinstance(value[0], list)}
+            if results[i].get("distances"):
+                results[i]["similarities"] = [[distance_to_similarity(d, space) for d in results[i]["distances"][0]]]
+
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(len(groups), 8)) as executor:
+            list(executor.map(run_group, groups.values()))
+
+    if lexical is not None:
+        bm25_hits = {i: lexical.search(searches[i]["query"], searches[i].get("top_k", 5), searches[i].get("where"))
+                     for i in pending}
+        _fuse_lexical(searches, results, article_hits, bm25_hits)
+
+    for search, result in zip(searches, results):
+        print(f"Found {len(result['documents'][0]) if result.get('documents') else 0} documents for where={search.get('where')}.")
+    return results
+
+def _fuse_lexical(searches: List[Dict], results: List[Dict],
+                  article_hits: Dict[int, List[str]], bm25_hits: Dict[int, List]):
+    """
+    語彙索引による検索結果を results に反映する（results はその場で更新する）
+    - 条文番号の直接参照: 一致した条文をそのまま結果にする（類似度 1.0）
+    - ハイブリッド: ベクトル類似度とBM25スコアをそれぞれクエリ内の最大値で割って0〜1にそろえ、
+      HYBRID_VECTOR_WEIGHT で重み付けした和を類似度とする
+    ベクトル検索の結果に含まれない文書の本文は、まとめて1回の backend.get で取得する
+    """
+    fused: Dict[int, List] = {}
+    for i, hits in bm25_hits.items():
+        result = results[i]
+        ids = (result.get("ids") or [[]])[0]
+        similarities = (result.get("similarities") or [[]])[0]
+        max_sim = max(similarities, default=0.0)
+        max_bm25 = max((score for _, score in hits), default=0.0)
+        scores: Dict[str, float] = {}
+        for doc_id, sim in zip(ids, similarities):
+            scores[doc_id] = HYBRID_VECTOR_WEIGHT * (sim / max_sim if max_sim > 0 else 0.0)
+        for doc_id, score in hits:
+            scores[doc_id] = scores.get(doc_id, 0.0) + (1 - HYBRID_VECTOR_WEIGHT) * score / max_bm25
+        top_k = searches[i].get("top_k", 5)
+        fused[i] = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    for i, ids in article_hits.items():
+        fused[i] = [(doc_id, 1.0) for doc_id in ids]
+
+    # 本文・メタデータ: ベクトル検索の結果にあるものはそれを使い、ないものはIDで取得する
+    known: Dict[str, tuple] = {}
+    for i in bm25_hits:
+        result = results[i]
+        for doc_id, text, meta in zip((result.get("ids") or [[]])[0], result["documents"][0], result["metadatas"][0]):
+            known[doc_id] = (text, meta)
+    missing = list(dict.fromkeys(doc_id for ranked in fused.values() for doc_id, _ in ranked if doc_id not in known))
+    if missing:
+        try:
+            fetched = backend.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, meta in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                known[doc_id] = (text, meta or {})
+        except Exception as e:
+            print(f"Error fetching lexical hits: {e}")
+
+    for i, ranked in fused.items():
+        ranked = [(doc_id, score) for doc_id, score in ranked if doc_id in known]
+        results[i] = {
+            "ids": [[doc_id for doc_id, _ in ranked]],
+            "documents": [[known[doc_id][0] for doc_id, _ in ranked]],
+            "metadatas": [[known[doc_id][1] for doc_id, _ in ranked]],
+            "similarities": [[score for _, score in ranked]],
+        }
+
+def iter_all_documents(batch_size: int = 1000):
+    """
+    コレクション内の全ドキュメントを {"id", "content", "metadata"} の形で順に返す（インデックス構築時の集計用）
+    """
+    total = get_collection_count()
+    for offset in range(0, total, batch_size):
+        batch = backend.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        for doc_id, text, meta in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            yield {"id": doc_id, "content": text, "metadata": meta or {}}
+
 def get_collection_count():
     """
     コレクション内のドキュメント数を取得する関数
     """
-    return collection.count()
+    if backend is None:
+        return 0
+    return backend.count()
@@ -0,0 +1,93 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+# インデックス成果物内の語彙ファイル
+VOCABULARY_FILE = "vocabulary.json"
+
+# 漢字・カタカナ・英数字の連続を用語候補とする（ひらがなは助詞・活用語尾として区切りに使う）
+# 法令の接続語（又は・及び・並びに・若しくは）の漢字も区切りとして扱う
+_TERM_PATTERN = re.compile(r"(?:(?![又及並若])[一-龥々〆ヵヶ]){2,12}|[ァ-ヴー]{2,12}|[A-Za-z][A-Za-z0-9.]{1,20}")
+# 語彙に残す最小文書頻度（1回しか出ない語はノイズが多い）
+MIN_DOCUMENT_FREQUENCY = 2
+
+
+def extract_terms(text: str) -> List[str]:
+    """テキストから用語候補を出現順に抽出する（全角英数字はNFKCで半角に揃える）"""
+    return _TERM_PATTERN.findall(unicodedata.normalize("NFKC", text))
+
+
+def build_vocabulary(documents: Iterable[Dict]) -> Dict:
+    """
+    チャンク群から law_group ごとの用語の文書頻度を集計する
+    documents: [{"content": str, "metadata": {"law_group": ...}}, ...]
+    """
+    df: Dict[str, Counter] = {}
+    doc_counts: Counter = Counter()
+    for doc in documents:
+        group = doc.get("metadata", {}).get("law_group", "other")
+        doc_counts[group] += 1
+        df.setdefault(group, Counter()).update(set(extract_terms(doc["content"])))
+
+    return {
+        "doc_counts": dict(doc_counts),
+        "terms": {
+            group: {term: n for term, n in counter.items() if n >= MIN_DOCUMENT_FREQUENCY}
+            for group, counter in df.items()
+        }
+    }
+
+
+def save_vocabulary(vocabulary: Dict, index_dir: str):
+    with open(os.path.join(index_dir, VOCABULARY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+
+
+def load_vocabulary(index_dir: Optional[str]) -> Optional[Dict]:
+    if not index_dir:
+        return None
+    path = os.path.join(index_dir, VOCABULARY_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def match_terms(text: str, vocabulary: Dict, law_group: str, limit: int = 6) -> List[str]:
+    """
+    入力テキスト中の用語のうち、指定した law_group の語彙に含まれるものを
+    IDF（出現文書の少なさ）の高い順に返す。
+    語彙にない長い連続は、語彙に含まれる最長の部分文字列に分解して照合する。
+    """
+    terms = vocabulary.get("terms", {}).get(law_group, {})
+    n_docs = vocabulary.get("doc_counts", {}).get(law_group, 0)
+    if not terms or not n_docs:
+        return []
+
+    found: Dict[str, float] = {}
+    for candidate in extract_terms(text):
+        for term in _split_known(candidate, terms):
+            found[term] = math.log((n_docs + 1) / (terms[term] + 1)) + 1.0
+    ranked = sorted(found, key=lambda t: (-found[t], -len(t)))
+    return ranked[:limit]
+
+
+def _split_known(candidate: str, terms: Dict[str, int]) -> List[str]:
+    """語彙にある最長一致で左から分割する"""
+    if candidate in terms:
+        return [candidate]
+    result = []
+    i = 0
+    while i < len(candidate) - 1:
+        for j in range(len(candidate), i + 1, -1):
+            if candidate[i:j] in terms:
+                result.append(candidate[i:j])
+                i = j
+                break
+        else:
+            i += 1
+    return result
@@ -0,0 +1,134 @@
+import re
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+# 号・細分の階層（インデントの深さに使用）
+_ITEM_TAGS = ("Item",) + tuple(f"Subitem{i}" for i in range(1, 11))
+_WHITESPACE_NEWLINE = re.compile(r"\s*\n\s*")
+
+
+def law_group_for(law_title: str) -> str:
+    """法令名から検索スロット (yakkiho / kehyoho / other) を判定する"""
+    return "yakkiho" if "医薬品" in law_title else "kehyoho" if "不当景品" in law_title else "other"
+
+
+def _text(elem) -> str:
+    return _WHITESPACE_NEWLINE.sub("", "".join(elem.itertext())).strip()
+
+
+def _line_prefix(owner) -> str:
+    """号・細分の文であれば「一」「イ」などの見出しとインデントを付与する"""
+    block = owner.getparent()
+    if block is None or block.tag not in _ITEM_TAGS:
+        return ""
+    title = block.find(f"{block.tag}Title")
+    depth = 1 + _ITEM_TAGS.index(block.tag)
+    title_text = _text(title) if title is not None else ""
+    return "  " * depth + (f"{title_text} " if title_text else "")
+
+
+def paragraph_text(paragraph) -> str:
+    """
+    Paragraph要素の本文を、項の文・号・細分ごとに1行として組み立てる
+    表形式の号（Column）は全角スペースで連結する
+    """
+    lines = []
+    owner = None
+    last_parent = None
+    for sentence in paragraph.iter("Sentence"):
+        parent = sentence.getparent()
+        line_owner = parent.getparent() if parent.tag == "Column" else parent
+        text = _text(sentence)
+        if line_owner is owner and lines:
+            sep = "　" if parent.tag == "Column" and parent is not last_parent else ""
+            lines[-1] += sep + text
+        else:
+            owner = line_owner
+            lines.append(_line_prefix(line_owner) + text)
+        last_parent = parent
+    return "\n".join(lines)
+
+
+def _free(elem):
+    """処理済みの要素と、それ以前の兄弟要素を解放してメモリ使用量を一定に保つ"""
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def iter_law_paragraphs(xml_path: Path, default_title: Optional[str] = None) -> Iterator[Dict]:
+    """
+    e-Gov法令XMLをiterparseでストリーム処理し、項 (Paragraph) 単位のレコードを返す。
+    処理済みの要素は逐次解放するため、薬機法のような大きなXMLでもメモリ使用量が一定になる。
+    改正規定（AmendProvision）内に引用された条・項は、外側の項の本文として扱う。
+    """
+    from lxml import etree
+
+    law_title = default_title or Path(xml_path).stem
+    law_abbrev = ""
+    provision = None  # "main" / "suppl" / None（目次など）
+    suppl_label = ""
+    amend_law_num = ""
+    article = None
+    article_depth = 0
+    paragraph_depth = 0
+
+    context = etree.iterparse(str(xml_path), events=("start", "end"), huge_tree=True)
+    for event, elem in context:
+        tag = elem.tag
+        if event == "start":
+            if tag == "MainProvision":
+                provision = "main"
+            elif tag == "SupplProvision":
+                provision = "suppl"
+                suppl_label = ""
+                amend_law_num = elem.get("AmendLawNum", "")
+            elif tag == "Article":
+                article_depth += 1
+                if article_depth == 1:
+                    article = {"title": "", "caption": ""}
+            elif tag == "Paragraph":
+                paragraph_depth += 1
+            continue
+
+        if tag == "LawTitle":
+            law_title = _text(elem) or law_title
+            law_abbrev = elem.get("Abbrev", "")
+        elif tag == "SupplProvisionLabel" and article_depth == 0:
+            suppl_label = _text(elem)
+        elif tag == "ArticleTitle" and article_depth == 1 and paragraph_depth == 0:
+            article["title"] = _text(elem)
+        elif tag == "ArticleCaption" and article_depth == 1 and paragraph_depth == 0:
+            article["caption"] = _text(elem)
+        elif tag == "Paragraph":
+            paragraph_depth -= 1
+            if paragraph_depth == 0 and provision is not None:
+                para_num = elem.findtext("ParagraphNum") or ""
+                caption = elem.findtext("ParagraphCaption") or ""
+                yield {
+                    "law_title": law_title,
+                    "law_abbrev": law_abbrev,
+                    "law_group": law_group_for(law_title),
+                    "is_main_provision": provision == "main",
+                    "suppl_label": suppl_label,
+                    "amend_law_num": amend_law_num,
+                    "article_title": article["title"] if article else "",
+                    "article_caption": article["caption"] if article else caption.strip(),
+                    "paragraph_num": elem.get("Num", ""),
+                    # 第1項は項番号が空のため、第2項以降のみ「第n項」と表記する
+                    "paragraph_label": f"第{elem.get('Num')}項" if para_num.strip() and elem.get("Num") else "",
+                    "text": paragraph_text(elem),
+                }
+                _free(elem)
+        elif tag == "Article":
+            article_depth -= 1
+            if article_depth == 0:
+                article = None
+                _free(elem)
+        elif tag in ("MainProvision", "SupplProvision"):
+            provision = None
+            _free(elem)
+        elif tag == "TOC":
+            _free(elem)
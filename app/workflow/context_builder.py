@@ -0,0 +1,140 @@
+import math
+import os
+import re
+import unicodedata
+from typing import Dict, List, Set, Tuple
+
+# 分析プロンプトに載せる根拠文書の合計トークン数の上限
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# 1文書あたりのトークン数の上限（超える場合はクエリとの関連が高い文だけを残す）
+CONTEXT_DOC_TOKEN_LIMIT = int(os.getenv("CONTEXT_DOC_TOKEN_LIMIT", "600"))
+
+# 文の区切り（句点・感嘆符・疑問符・改行）
+_SENTENCE_END = re.compile(r"(?<=[。！？!?\n])")
+# 漢字・かな・カタカナ・全角記号（1文字およそ1トークンとして数える）
+_CJK = re.compile(r"[　-ヿ㐀-鿿豈-﫿＀-￯]")
+_WHITESPACE = re.compile(r"\s+")
+# 句点のない長い文（PDFの表や箇条書きなど）はこの文字数ごとに区切って扱う
+MAX_SENTENCE_CHARS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算（トークナイザを読み込まずに数える）
+    日本語の文字は1文字1トークン、それ以外はおよそ4文字1トークンとする
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _bigrams(text: str) -> Set[str]:
+    """文字bigramの集合（形態素解析なしで日本語の語の重なりを測る）"""
+    t = _WHITESPACE.sub("", unicodedata.normalize("NFKC", text))
+    return {t[i:i + 2] for i in range(len(t) - 1)}
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in _SENTENCE_END.split(text):
+        part = part.strip()
+        for start in range(0, len(part), MAX_SENTENCE_CHARS):
+            sentences.append(part[start:start + MAX_SENTENCE_CHARS])
+    return sentences
+
+
+def select_passages(text: str, query_grams: Set[str], max_tokens: int, seen: Set[str]) -> Tuple[str, int]:
+    """
+    文書から、クエリとの関連が高い文を max_tokens に収まるだけ選び、元の順序で返す
+    - 他の文書で既に採用した文（seen）や文書内で繰り返される文は重複として除く
+    - 先頭の文は条文の見出しであることが多いため、収まる限り残す
+    戻り値: (選んだ文の連結, その推定トークン数)
+    """
+    sentences = []
+    keys = set()
+    for i, sentence in enumerate(split_sentences(text)):
+        key = _WHITESPACE.sub("", unicodedata.normalize("NFKC", sentence))
+        if key in seen or key in keys:
+            continue
+        keys.add(key)
+        grams = _bigrams(sentence)
+        relevance = len(grams & query_grams) / math.sqrt(len(grams) + 1)
+        sentences.append((i, sentence, key, estimate_tokens(sentence), relevance))
+    if not sentences:
+        return "", 0
+
+    total = sum(s[3] for s in sentences)
+    if total <= max_tokens:
+        chosen = sentences
+    else:
+        # 先頭の文 → 関連度の高い順に、上限に収まる文を選ぶ
+        ranked = [sentences[0]] + sorted(sentences[1:], key=lambda s: s[4], reverse=True)
+        chosen, used = [], 0
+        for s in ranked:
+            if used + s[3] <= max_tokens:
+                chosen.append(s)
+                used += s[3]
+        chosen.sort(key=lambda s: s[0])
+
+    for s in chosen:
+        seen.add(s[2])
+    passage = "".join(s[1] if s[1].endswith(("。", "！", "？", "!", "?")) else s[1] + "\n" for s in chosen).strip()
+    return passage, sum(s[3] for s in chosen)
+
+
+def build_context(retrieved_docs: Dict, queries: List[str],
+                  token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  doc_token_limit: int = CONTEXT_DOC_TOKEN_LIMIT) -> Tuple[str, Dict]:
+    """
+    検索結果から分析プロンプト用の根拠文書のテキストを組み立てる
+    - スコアの高い文書から順に、文書ごとにクエリと関連の高い文だけを残す
+    - 文書間で重複する文は1回だけ載せる
+    - 合計が token_budget を超える文書は、残りの予算に収まるよう削るか除外する
+    戻り値: (テキスト, 統計 {"original_tokens", "context_tokens", "saved_tokens", "documents_used", "documents_dropped"})
+    """
+    if not retrieved_docs or not retrieved_docs.get("documents"):
+        return "", {"original_tokens": 0, "context_tokens": 0, "saved_tokens": 0,
+                    "documents_used": 0, "documents_dropped": 0}
+
+    documents = retrieved_docs["documents"][0]
+    metadatas = retrieved_docs["metadatas"][0]
+    scores = (retrieved_docs.get("scores") or [[]])[0]
+    order = sorted(range(len(documents)), key=lambda i: scores[i] if i < len(scores) else 0.0, reverse=True)
+
+    query_grams: Set[str] = set()
+    for q in queries:
+        if q:
+            query_grams |= _bigrams(q)
+
+    seen: Set[str] = set()
+    original_tokens = 0
+    used_tokens = 0
+    selected: List[Tuple[int, str]] = []
+    for i in order:
+        # 削る前（全文をそのまま載せた場合）のトークン数
+        meta = metadatas[i]
+        original_tokens += estimate_tokens(
+            f"Document {i + 1} ({meta.get('title', 'Unknown Law')} {meta.get('section', '')}):\n{documents[i]}\n\n"
+        )
+        remaining = token_budget - used_tokens
+        if remaining <= 0:
+            continue
+        passage, tokens = select_passages(documents[i], query_grams, min(doc_token_limit, remaining), seen)
+        if passage:
+            selected.append((i, passage))
+            used_tokens += tokens
+
+    context = ""
+    for n, (i, passage) in enumerate(selected, 1):
+        meta = metadatas[i]
+        context += f"Document {n} ({meta.get('title', 'Unknown Law')} {meta.get('section', '')}):\n{passage}\n\n"
+
+    context_tokens = estimate_tokens(context)
+    return context, {
+        "original_tokens": original_tokens,
+        "context_tokens": context_tokens,
+        "saved_tokens": max(0, original_tokens - context_tokens),
+        "documents_used": len(selected),
+        "documents_dropped": len(documents) - len(selected),
+    }
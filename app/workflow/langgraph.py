@@ -1,33 +1,165 @@
 from typing import Dict, Any, TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
-from app.rag.vector_store import search_documents
+from app.rag.rerank import RERANK_MIN_SCORE, apply_boosts, get_reranker, load_boost_rules
+from app.rag.vector_store import search_documents_batch
+from app.rag.search_batcher import SearchBatcher
+from app.workflow.query_generation import (
+    DEFAULT_QUERY_MODE,
+    build_query_generation_prompt,
+    fallback_queries,
+    generate_local_queries,
+    get_query_cache,
+)
+from app.workflow.context_builder import build_context
+from app.workflow.prescreen import DEFAULT_PRESCREEN_MODE, format_findings, get_prescreener
+from app.workflow.structured_output import (
+    ANALYSIS_FORMAT,
+    RECOMMENDATION_FORMAT,
+    REPAIR_TAG,
+    extract_json,
+    locate_issues,
+    parse_structured,
+    prescreen_to_analysis,
+    render_irac,
+    render_recommendations,
+    schema_summary,
+)
+from app.models.response import ComplianceAnalysis, RecommendationSet
+import asyncio
 import os
 import json
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain_openai import ChatOpenAI
-from google.api_core.exceptions import ResourceExhausted
 import time
 
-# 環境変数からAPIキーを読み込む
-google_api_key = os.getenv("GOOGLE_API_KEY")
-openai_api_key = os.getenv("OPENAI_API_KEY")
+GEMINI_MODEL = "gemini-2.5-flash"
+OPENAI_MODEL = "gpt-4o"
 
-if not google_api_key:
-    raise ValueError("GOOGLE_API_KEY environment variable is not set")
+# LLMクライアント（import時には作らず、FastAPIのlifespanか最初のLLM呼び出しで init_llms が作る）
+llm_gemini = None
+llm_openai = None
+_llm_lock = threading.Lock()
 
-# LLMの初期化
-llm_gemini = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0, google_api_key=google_api_key)
+def init_llms():
+    """
+    環境変数のAPIキーからLLMクライアントを初期化する（初期化済み・テストで差し替え済みの場合は何もしない）
+    GOOGLE_API_KEY がない場合は ValueError。OpenAIはAPIキーがある場合のみフォールバックとして使う。
+    """
+    global llm_gemini, llm_openai
+    if llm_gemini is not None:
+        return
+    with _llm_lock:
+        if llm_gemini is not None:
+            return
+        google_api_key = os.getenv("GOOGLE_API_KEY")
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not google_api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable is not set")
+
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        if openai_api_key and llm_openai is None:
+            from langchain_openai import ChatOpenAI
+            llm_openai = ChatOpenAI(model=OPENAI_MODEL, temperature=0, openai_api_key=openai_api_key)
+        llm_gemini = ChatGoogleGenerativeAI(model=GEMINI_MODEL, temperature=0, google_api_key=google_api_key)
+
+# プロバイダごとの同時リクエスト数の上限（レート制限・1ワーカー内の過負荷を防ぐ）
+LLM_MAX_CONCURRENCY = {
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+}
+
+# イベントループごとのセマフォとSearchBatcher（asyncioのオブジェクトは作成したループでしか使えないため、
+# asyncio.run を繰り返すテストやループを作り直す場合でも、実行中のループごとに作る）
+# 閉じたループの分は、新しいループの分を作るときに捨てる
+_loop_state: Dict[asyncio.AbstractEventLoop, Dict[str, Any]] = {}
+_loop_state_lock = threading.Lock()
+
+
+def _get_loop_state() -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is not None:
+        return state
+    with _loop_state_lock:
+        for closed in [other for other in _loop_state if other.is_closed()]:
+            del _loop_state[closed]
+        state = _loop_state.get(loop)
+        if state is None:
+            state = {
+                "llm_semaphores": {provider: asyncio.Semaphore(limit) for provider, limit in LLM_MAX_CONCURRENCY.items()},
+                # 並行するワークフローの検索を1回のembedding・Chroma問い合わせにまとめる
+                # （テストで search_documents_batch を差し替えられるよう、呼び出し時に参照する）
+                "search_batcher": SearchBatcher(lambda searches: search_documents_batch(searches)),
+            }
+            _loop_state[loop] = state
+    return state
+
+# 検索結果のスコアに掛けるブースト規則
+_boost_rules = load_boost_rules()
+# 各スロットからLLMに渡す文書数（リランキングする場合は精度が上がる分だけ減らす）
+RETRIEVAL_DOCS_PER_SLOT = int(os.getenv("RETRIEVAL_DOCS_PER_SLOT", "4"))
+RERANK_DOCS_PER_SLOT = int(os.getenv("RERANK_DOCS_PER_SLOT", "3"))
+
+async def _ainvoke_llm(provider: str, runnable, payload, config=None):
+    """
+    LLM呼び出しを非同期で実行する。プロバイダごとのセマフォで同時実行数を制限する。
+    """
+    async with _get_loop_state()["llm_semaphores"][provider]:
+        return await runnable.ainvoke(payload, config=config)
 
-# OpenAIの初期化（APIキーがある場合のみ）
-llm_openai = None
-if openai_api_key:
-    llm_openai = ChatOpenAI(model="gpt-4o", temperature=0, openai_api_key=openai_api_key)
+_repair_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You fix malformed JSON. Return ONLY a JSON object that conforms to the given JSON Schema, keeping the original content."),
+    ("user", """
+[JSON Schema]
+{schema}
 
+[Invalid Output]
+{output}
+
+[Validation Error]
+{error}
+""")
+])
+
+async def _ainvoke_structured(step: str, prompt: ChatPromptTemplate, payload: dict, model):
+    """
+    Gemini（失敗時はOpenAI）で生成し、出力をPydanticモデルとして検証する。
+    形式が不正な場合は、生成をやり直さずに同じプロバイダへ1回だけ修復を依頼する。
+    戻り値: (生の出力, 検証済みのモデルまたはNone, 使用量のリスト)
+    """
+    init_llms()
+    try:
+        provider, llm = "gemini", llm_gemini
+        result = await _ainvoke_llm(provider, prompt | llm, payload)
+    except Exception as e:
+        print(f"Gemini API Error in {step}: {e}")
+        if not llm_openai:
+            raise e
+        print(f"Switching to OpenAI for {step}...")
+        provider, llm = "openai", llm_openai
+        result = await _ainvoke_llm(provider, prompt | llm, payload)
+    usages = [getattr(result, 'usage_metadata', {})]
+
+    parsed, error = parse_structured(result.content, model)
+    if parsed is None:
+        print(f"Invalid structured output in {step}, requesting repair: {error[:200]}")
+        try:
+            repaired = await _ainvoke_llm(
+                provider, _repair_prompt | llm,
+                {"schema": schema_summary(model), "output": result.content, "error": error},
+                config={"tags": [REPAIR_TAG]}
+            )
+            usages.append(getattr(repaired, 'usage_metadata', {}))
+            parsed, error = parse_structured(repaired.content, model)
+        except Exception as e:
+            print(f"Structured output repair failed in {step}: {e}")
+        if parsed is None:
+            print(f"Falling back to free-text output in {step}")
+    return result.content, parsed, usages
 
 
 class WorkflowState(TypedDict):
@@ -38,135 +170,163 @@ class WorkflowState(TypedDict):
     current_step: str
     usage_metadata: list # 各ステップのトークン使用量を格納
     debug_info: dict
+    query_mode: str # 検索クエリの生成方法: "llm" / "local"
+    prescreen_mode: str # 事前判定の扱い: "off" / "annotate" / "short_circuit"
+    prescreen_result: dict # 事前判定の結果（判定と検出箇所）。ノード名と同じキーはLangGraphで使えないため別名にする
+    search_queries: dict # 検索に使ったスロットごとのクエリ
+    workflow_path: list # 実行したノード名（条件分岐でどの経路を通ったかの記録）
+
+def _path(state: WorkflowState, node: str) -> list:
+    return (state.get("workflow_path") or []) + [node]
 
 # ノード関数の定義
-def retrieve_documents(state: WorkflowState):
+async def prescreen_text(state: WorkflowState):
+    """
+    表現辞書による事前判定を行うノード（LLMは呼ばない）
+    """
+    mode = state.get("prescreen_mode") or DEFAULT_PRESCREEN_MODE
+    prescreener = get_prescreener() if mode != "off" else None
+    if prescreener is None:
+        return {"prescreen_result": {}, "workflow_path": _path(state, "prescreen")}
+
+    result = prescreener.scan(state["input_text"])
+    result["mode"] = mode
+    print(f"Prescreen verdict: {result['verdict']} ({len(result['matches'])} matches, {result['elapsed_us']}us)")
+    return {"prescreen_result": result, "workflow_path": _path(state, "prescreen")}
+
+def _short_circuit_verdict(state: WorkflowState):
+    """short_circuitモードの事前判定結果（それ以外のモードではNone）"""
+    prescreen = state.get("prescreen_result") or {}
+    if prescreen.get("mode") != "short_circuit":
+        return None
+    return prescreen.get("verdict")
+
+def route_after_retrieve(state: WorkflowState) -> str:
+    """明白な違反はLLMによる分析を省略し、事前判定の結果から最終出力を作る"""
+    return "conclude" if _short_circuit_verdict(state) == "ng" else "analyze"
+
+def route_after_analyze(state: WorkflowState) -> str:
+    """分析の結論が適合の場合は言い換え提案のLLM呼び出しを省略する（判定が不明確な場合は安全側で提案を作る）"""
+    return "summarize" if state["analysis_result"].get("verdict") == "compliant" else "recommend"
+
+async def retrieve_documents(state: WorkflowState):
     """
     関連するsource_docsを検索するノード
-    薬機法・景表法・ガイドラインの3方向で独立検索し、本法を優先するブースティングを適用する。
+    薬機法・景表法・ガイドラインの3方向で独立検索し、ベクトル類似度（またはリランキングのスコア）に
+    本法を優先するブースティングを適用する。
     """
     input_text = state["input_text"]
     
-    # LLMを使用して3つの検索クエリを生成
-    query_generation_prompt = f"""
-    You are a legal search expert.
-    Based on the following input text, generate THREE distinct search queries to retrieve relevant legal provisions.
-    
-    1. Yakkiho Query: Focus on the Pharmaceutical and Medical Device Act (薬機法). Use specific terms like "第66条" or "誇大広告".
-    2. Kehyoho Query: Focus on the Act against Unjustifiable Premiums and Misleading Representations (景表法). Use specific terms like "第5条" or "優良誤認".
-    3. Guideline Query: Focus on administrative guidelines, Q&A, and practical standards.
-
-    Input Text:
-    "{input_text}"
-
-    Instructions:
-    1. Identify specific claims in the text that might violate the law.
-    2. **CRITICAL: Generate queries PRIMARILY IN JAPANESE.**
-    3. Return the result in the following JSON format ONLY:
-       {{
-           "yakkiho_query": "...",
-           "kehyoho_query": "...",
-           "guideline_query": "..."
-       }}
-    """
-    
-    queries = {"yakkiho_query": "", "kehyoho_query": "", "guideline_query": ""}
-
-    try:
-        response = llm_gemini.invoke(query_generation_prompt)
-        response_content = response.content.strip()
-        usage = getattr(response, 'usage_metadata', {})
-        
-        if "```json" in response_content:
-            response_content = response_content.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_content:
-             response_content = response_content.split("```")[1].split("```")[0].strip()
-        queries = json.loads(response_content)
-    except Exception as e:
-        print(f"Query generation error: {e}")
-        usage = {}
-        # フォールバック
-        queries = {
-            "yakkiho_query": f"薬機法 {input_text[:50]}",
-            "kehyoho_query": f"景表法 {input_text[:50]}",
-            "guideline_query": f"ガイドライン {input_text[:50]}"
-        }
+    query_mode = state.get("query_mode")
+    if not query_mode and _short_circuit_verdict(state) == "ng":
+        # 事前判定で結論が出ている（ng）場合は、検索クエリの生成にLLMを使わない
+        query_mode = "local"
+    query_mode = query_mode or DEFAULT_QUERY_MODE
+    query_cache = None
+    usage = {}
+
+    if query_mode == "local":
+        # LLMを呼ばず、法令コーパスの語彙との照合で検索クエリを生成
+        queries = await asyncio.to_thread(generate_local_queries, input_text)
+        query_source = "local"
+    else:
+        # LLMを使用して3つの検索クエリを生成（同じ入力・プロンプトの結果はキャッシュを再利用）
+        query_cache = get_query_cache()
+        queries = await asyncio.to_thread(query_cache.get, input_text, GEMINI_MODEL) if query_cache else None
+        query_source = "cache"
+
+    if queries is None:
+        try:
+            init_llms()
+            response = await _ainvoke_llm("gemini", llm_gemini, build_query_generation_prompt(input_text))
+            usage = getattr(response, 'usage_metadata', {})
+            queries = json.loads(extract_json(response.content))
+            if not isinstance(queries, dict) or not all(
+                    isinstance(queries.get(k), str) for k in ("yakkiho_query", "kehyoho_query", "guideline_query")):
+                raise ValueError(f"Invalid query generation output: {response.content[:200]}")
+            query_source = "llm"
+            if query_cache:
+                await asyncio.to_thread(query_cache.put, input_text, GEMINI_MODEL, queries)
+        except Exception as e:
+            print(f"Query generation error: {e}")
+            usage = {}
+            # フォールバック
+            queries = fallback_queries(input_text)
+            query_source = "fallback"
 
     # 各スロットの検索実行
-    top_k_per_slot = 7 # 少し多めに取ってからブースト・ソート・選択
+    top_k_per_slot = 7 # 少し多めに取ってからリランキング・ブースト・ソート・選択
 
+    # 3スロット（薬機法・景表法・ガイドライン）のクエリを1回のembeddingでまとめて検索
     print(f"Searching Yakkiho: {queries.get('yakkiho_query')}")
-    docs_yakkiho = search_documents(
-        queries.get('yakkiho_query', ""), 
-        top_k=top_k_per_slot, 
-        where={"law_group": "yakkiho"}
-    )
-    
     print(f"Searching Kehyoho: {queries.get('kehyoho_query')}")
-    docs_kehyoho = search_documents(
-        queries.get('kehyoho_query', ""), 
-        top_k=top_k_per_slot, 
-        where={"law_group": "kehyoho"}
-    )
-    
-    # 3. ガイドライン
     print(f"Searching Guidelines: {queries.get('guideline_query')}")
-    docs_guideline = search_documents(
-        queries.get('guideline_query', ""), 
-        top_k=top_k_per_slot, 
-        where={"law_group": "other"}
-    )
+    # embedding・Chroma検索はスレッドで実行し、同時に実行中の他のリクエストの検索ともまとめる
+    docs_yakkiho, docs_kehyoho, docs_guideline = await _get_loop_state()["search_batcher"].search([
+        {"query": queries.get('yakkiho_query', ""), "top_k": top_k_per_slot, "where": {"law_group": "yakkiho"}},
+        {"query": queries.get('kehyoho_query', ""), "top_k": top_k_per_slot, "where": {"law_group": "kehyoho"}},
+        {"query": queries.get('guideline_query', ""), "top_k": top_k_per_slot, "where": {"law_group": "other"}},
+    ])
 
-    merged_documents = []
-    merged_metadatas = []
     seen_contents = set()
 
-    def process_and_boost(raw_docs, query_text):
+    def collect_candidates(raw_docs, query_text):
+        """検索結果を候補にする（他スロットと重複する文書は除く）。スコアはベクトル類似度"""
         if not raw_docs or 'documents' not in raw_docs or not raw_docs['documents']:
             return []
-        
-        results = []
+
+        similarities = (raw_docs.get('similarities') or [[]])[0]
+        candidates = []
         for i, doc_content in enumerate(raw_docs['documents'][0]):
             if doc_content in seen_contents: continue
-            
-            metadata = raw_docs['metadatas'][0][i]
-            # ChromaDBの距離スコアが利用できない場合は順位スコア
-            base_score = 1.0 - (i * 0.1) 
-            
-            # 【ブースティング】
-            # A. 本法ブースト: タイトルに「施行令」「施行規則」「府令」が含まれない場合
-            is_main_act = not any(k in metadata.get('title', '') for k in ["施行令", "施行規則", "内閣府令", "府令"])
-            if is_main_act and metadata.get('category') == "01_statute":
-                base_score *= 1.5
-                print(f"  Boosting Main Act: {metadata.get('title')}")
-
-            # B. 条文番号一致ブースト
-            section = metadata.get('section', '')
-            if section in query_text and len(section) > 1:
-                base_score *= 1.3
-                print(f"  Boosting Section Match: {section}")
-
-            results.append({
+            candidates.append({
                 "content": doc_content,
-                "metadata": metadata,
-                "score": base_score
+                "metadata": raw_docs['metadatas'][0][i],
+                "query": query_text,
+                # 距離が返らない検索（テスト用のスタブなど）の場合は順位スコア
+                "similarity": similarities[i] if i < len(similarities) else 1.0 - (i * 0.1)
             })
             seen_contents.add(doc_content)
-        
+        return candidates
+
+    slots = [
+        collect_candidates(docs_yakkiho, queries.get('yakkiho_query', "")),
+        collect_candidates(docs_kehyoho, queries.get('kehyoho_query', "")),
+        collect_candidates(docs_guideline, queries.get('guideline_query', "")),
+    ]
+
+    # 【リランキング】3スロットの候補をまとめて1回で採点する
+    reranker = get_reranker()
+    rerank_scores = None
+    if reranker is not None:
+        pairs = [(c["query"], c["content"]) for slot in slots for c in slot]
+        rerank_scores = iter(await asyncio.to_thread(reranker.score, pairs))
+
+    docs_per_slot = RERANK_DOCS_PER_SLOT if reranker is not None else RETRIEVAL_DOCS_PER_SLOT
+    selected_slots = []
+    for slot in slots:
+        results = []
+        for c in slot:
+            base_score = c["similarity"]
+            if rerank_scores is not None:
+                c["rerank_score"] = next(rerank_scores)
+                base_score = c["rerank_score"]
+                if base_score < RERANK_MIN_SCORE:
+                    continue
+            # 【ブースティング】本法・条文番号一致など（規則は app/rag/rerank.py で設定）
+            c["score"], c["boosts"] = apply_boosts(base_score, c["metadata"], c["query"], _boost_rules)
+            results.append(c)
         results.sort(key=lambda x: x['score'], reverse=True)
-        return results
-
-    # 各枠から4件ずつ抽出
-    slot_yakkiho = process_and_boost(docs_yakkiho, queries.get('yakkiho_query', ""))[:4]
-    slot_kehyoho = process_and_boost(docs_kehyoho, queries.get('kehyoho_query', ""))[:4]
-    slot_guideline = process_and_boost(docs_guideline, queries.get('guideline_query', ""))[:4]
+        selected_slots.append(results[:docs_per_slot])
+    slot_yakkiho, slot_kehyoho, slot_guideline = selected_slots
 
     # 全て統合
     final_combined = slot_yakkiho + slot_kehyoho + slot_guideline
     
     final_docs = {
         "documents": [[d["content"] for d in final_combined]],
-        "metadatas": [[d["metadata"] for d in final_combined]]
+        "metadatas": [[d["metadata"] for d in final_combined]],
+        "scores": [[d["score"] for d in final_combined]]
     }
     
     print(f"Final merged docs count: {len(final_combined)} (Yakki:{len(slot_yakkiho)}, Kehyo:{len(slot_kehyoho)}, Guide:{len(slot_guideline)})")
@@ -174,30 +334,40 @@ def retrieve_documents(state: WorkflowState):
     return {
         "retrieved_docs": final_docs,
         "usage_metadata": [usage],
+        "search_queries": queries,
+        "workflow_path": _path(state, "retrieve"),
         "debug_info": {
+            "query_source": query_source,
             "generated_query": f"Y:{queries.get('yakkiho_query')} | K:{queries.get('kehyoho_query')} | G:{queries.get('guideline_query')}",
             "retrieved_doc_count": len(final_combined),
-            "retrieved_doc_titles": [f"{m.get('title', 'Unknown')} - {m.get('section', '')}" for m in final_docs["metadatas"][0]]
+            "retrieved_doc_titles": [f"{m.get('title', 'Unknown')} - {m.get('section', '')}" for m in final_docs["metadatas"][0]],
+            "retrieved_doc_scores": [
+                {"score": round(d["score"], 4), "similarity": round(d["similarity"], 4),
+                 "rerank_score": round(d["rerank_score"], 4) if "rerank_score" in d else None,
+                 "boosts": d["boosts"]}
+                for d in final_combined
+            ],
+            "reranker": reranker.model_name if reranker is not None else None
         }
     }
 
-def analyze_compliance(state: WorkflowState): # Changed AgentState to WorkflowState
+async def analyze_compliance(state: WorkflowState): # Changed AgentState to WorkflowState
     """
     検索された文書に基づいてコンプライアンス分析を行うノード
     """
     input_text = state["input_text"]
     retrieved_docs = state["retrieved_docs"]
     
-    # Retrieve documents content
-    docs_context = ""
-    if retrieved_docs and 'documents' in retrieved_docs and retrieved_docs['documents']:
-        for i, doc in enumerate(retrieved_docs['documents'][0]):
-            meta = retrieved_docs['metadatas'][0][i]
-            title = meta.get('title', 'Unknown Law')
-            section = meta.get('section', '')
-            
-            # 制限撤廃: 条文全体を含める
-            docs_context += f"Document {i+1} ({title} {section}):\n{doc}\n\n"
+    # 根拠文書はスコアの高い順に、クエリと関連の高い文だけをトークン予算内で載せる
+    prescreen = state.get("prescreen_result") or {}
+    queries = [input_text, *(state.get("search_queries") or {}).values(),
+               *(m["text"] for m in prescreen.get("matches", []))]
+    docs_context, context_stats = build_context(retrieved_docs, queries)
+    print(f"Context: {context_stats['context_tokens']} tokens "
+          f"({context_stats['saved_tokens']} saved, {context_stats['documents_used']} docs)")
+
+    # 事前判定で検出された表現を論点の候補として渡す
+    prescreen_findings = format_findings(prescreen) or "(none)"
             
     # LLM instruction for analysis
     analysis_prompt = ChatPromptTemplate.from_messages([
@@ -210,12 +380,10 @@ Prohibitions:
 - Do not make judgments based on knowledge outside the provided legal documents. Always cite the article (or guideline) as the basis for your argument.
 
 Output Format:
-Please structure your response in IRAC format (Issue, Rule, Application, Conclusion) in Japanese.
+Follow the IRAC method (Issue, Rule, Application, Conclusion) and return ONLY a JSON object in the following format (text values in Japanese).
+List every problematic expression as a separate issue, quoting it verbatim from the input text. Return an empty "issues" list if the text is compliant.
 
-1. **Issue (論点)**: Which part of the text is problematic?
-2. **Rule (法的事項)**: Which specific article of the law or guideline applies? (Cite the content from provided documents)
-3. **Application (あてはめ)**: How does the input text conflict with the rule?
-4. **Conclusion (結論)**: Final judgment (Compliant/Non-compliant) and risk level.
+{analysis_format}
 """),
         ("user", """
 [Input Text]
@@ -224,33 +392,40 @@ Please structure your response in IRAC format (Issue, Rule, Application, Conclus
 [Related Legal Documents]
 {docs_context}
 
+[Pre-screen Findings]
+Expressions flagged by a rule-based dictionary check (candidates only; confirm or dismiss them based on the documents):
+{prescreen_findings}
+
 Analyze the compliance:
 """)
     ])
 
-    try:
-        chain = analysis_prompt | llm_gemini
-        result = chain.invoke({"input_text": input_text, "docs_context": docs_context})
-        usage = getattr(result, 'usage_metadata', {})
-    except Exception as e:
-        print(f"Gemini API Error in analyze_compliance: {e}")
-        if llm_openai:
-            print("Switching to OpenAI for compliance analysis...")
-            chain = analysis_prompt | llm_openai
-            result = chain.invoke({"input_text": input_text, "docs_context": docs_context})
-            usage = getattr(result, 'usage_metadata', {})
-        else:
-            raise e
+    raw_output, analysis, usages = await _ainvoke_structured(
+        "analyze_compliance", analysis_prompt,
+        {"input_text": input_text, "docs_context": docs_context,
+         "prescreen_findings": prescreen_findings, "analysis_format": ANALYSIS_FORMAT},
+        ComplianceAnalysis
+    )
+
+    if analysis is not None:
+        locate_issues(analysis, input_text)
+        analysis_result = {"irac_analysis": render_irac(analysis), "verdict": analysis.verdict,
+                           "structured": analysis.model_dump()}
+    else:
+        # 構造化出力を得られなかった場合は、文章の結論部分から判定する
+        analysis_result = {"irac_analysis": raw_output, "verdict": extract_verdict(raw_output), "structured": None}
+    analysis_result["context"] = context_stats
 
     updated_state = state.copy()
-    updated_state["usage_metadata"] = state.get("usage_metadata", []) + [usage]
-    updated_state["analysis_result"] = {"irac_analysis": result.content}
+    updated_state["usage_metadata"] = state.get("usage_metadata", []) + usages
+    updated_state["analysis_result"] = analysis_result
     updated_state["current_step"] = "analyze"
+    updated_state["workflow_path"] = _path(state, "analyze")
 
     print("Compliance analysis completed using IRAC framework")
     return updated_state
 
-def generate_recommendations(state: WorkflowState) -> WorkflowState:
+async def generate_recommendations(state: WorkflowState) -> WorkflowState:
     """言い換え案を生成するノード"""
     input_text = state["input_text"]
     analysis_result = state["analysis_result"]
@@ -265,33 +440,103 @@ def generate_recommendations(state: WorkflowState) -> WorkflowState:
 上記の分析結果を踏まえ、法律に抵触しない代替表現を3つ提案してください。
 各提案には、なぜその表現が安全であるかの理由も含めてください。
 
-出力形式:
-1. 提案表現1: [表現] - [理由]
-2. 提案表現2: [表現] - [理由]
-3. 提案表現3: [表現] - [理由]
-
-出力は日本語でお願いします。
+出力形式（JSONのみを出力してください。値は日本語でお願いします）:
+{recommendation_format}
         """)
     ])
 
-    chain = recommendation_prompt | llm_gemini
-    
-    try:
-         result = chain.invoke({"input_text": input_text, "analysis_result": analysis_result["irac_analysis"]})
-         usage = getattr(result, 'usage_metadata', {})
-    except Exception as e:
-         print(f"Gemini API Error in generate_recommendations: {e}")
-         if llm_openai:
-              print("Switching to OpenAI for recommendations...")
-              chain = recommendation_prompt | llm_openai
-              result = chain.invoke({"input_text": input_text, "analysis_result": analysis_result["irac_analysis"]})
-              usage = getattr(result, 'usage_metadata', {})
-         else:
-              raise e
+    raw_output, recommendations, usages = await _ainvoke_structured(
+        "generate_recommendations", recommendation_prompt,
+        {"input_text": input_text, "analysis_result": analysis_result["irac_analysis"],
+         "recommendation_format": RECOMMENDATION_FORMAT},
+        RecommendationSet
+    )
 
     updated_state = state.copy()
-    usage_list = state.get("usage_metadata", []) + [usage]
+    usage_list = state.get("usage_metadata", []) + usages
     
+    updated_state["final_output"] = {
+        "compliant": analysis_result.get("verdict") == "compliant",
+        "verdict": analysis_result.get("verdict"),
+        "analysis": analysis_result.get("structured"),
+        "recommendations": render_recommendations(recommendations) if recommendations is not None else raw_output,
+        "revisions": [r.model_dump() for r in recommendations.revisions] if recommendations is not None else [],
+        "analysis_summary": analysis_result["irac_analysis"],
+        "token_usage": summarize_token_usage(usage_list, analysis_result.get("context"))
+    }
+    updated_state["usage_metadata"] = usage_list
+    updated_state["current_step"] = "recommend"
+    updated_state["workflow_path"] = _path(state, "recommend")
+
+    print("Recommendations generated")
+    return updated_state
+
+async def summarize_analysis(state: WorkflowState) -> WorkflowState:
+    """
+    言い換え案を生成せずに分析結果のみで最終出力を作るノード
+    （簡易スクリーニング、および標準ワークフローで適合と判定された場合）
+    """
+    analysis = state["analysis_result"]["irac_analysis"]
+    verdict = state["analysis_result"].get("verdict") or extract_verdict(analysis)
+    usage_list = state.get("usage_metadata", [])
+
+    updated_state = state.copy()
+    updated_state["final_output"] = {
+        "compliant": verdict == "compliant",
+        "verdict": verdict,
+        "analysis": state["analysis_result"].get("structured"),
+        "recommendations": "",
+        "revisions": [],
+        "analysis_summary": analysis,
+        "token_usage": summarize_token_usage(usage_list, state["analysis_result"].get("context"))
+    }
+    updated_state["current_step"] = "summarize"
+    updated_state["workflow_path"] = _path(state, "summarize")
+    return updated_state
+
+async def conclude_from_prescreen(state: WorkflowState) -> WorkflowState:
+    """
+    事前判定で明白な違反と判定されたテキストについて、LLMを呼ばずに最終出力を作るノード
+    """
+    analysis = prescreen_to_analysis(state["prescreen_result"])
+    irac_analysis = render_irac(analysis)
+    usage_list = state.get("usage_metadata", [])
+
+    updated_state = state.copy()
+    updated_state["analysis_result"] = {"irac_analysis": irac_analysis, "verdict": analysis.verdict,
+                                        "structured": analysis.model_dump()}
+    updated_state["final_output"] = {
+        "compliant": False,
+        "verdict": analysis.verdict,
+        "analysis": analysis.model_dump(),
+        "recommendations": "",
+        "revisions": [],
+        "analysis_summary": irac_analysis,
+        "token_usage": summarize_token_usage(usage_list)
+    }
+    updated_state["current_step"] = "conclude"
+    updated_state["workflow_path"] = _path(state, "conclude")
+    return updated_state
+
+def extract_verdict(irac_analysis: str) -> str:
+    """
+    IRAC分析のConclusion（結論）部分から判定を取り出す（構造化出力を得られなかった場合のフォールバック）
+    戻り値: compliant / non_compliant / unclear（結論が見つからない・判断できない場合）
+    """
+    text = irac_analysis or ""
+    # 最後に現れた見出し以降を結論とみなす（見出しがなければ全文）
+    positions = [text.rfind(marker) for marker in ("Conclusion", "結論")]
+    conclusion = text[max(positions):] if max(positions) >= 0 else text
+    lowered = conclusion.lower()
+
+    if "不適合" in conclusion or "違反" in conclusion or "non-compliant" in lowered or "not compliant" in lowered:
+        return "non_compliant"
+    if "適合" in conclusion or "適法" in conclusion or "問題なし" in conclusion or "compliant" in lowered:
+        return "compliant"
+    return "unclear"
+
+def summarize_token_usage(usage_list: list, context_stats: dict = None) -> dict:
+    """各ステップのトークン使用量を合計する（context_stats: 根拠文書の削減量）"""
     # トークンの合計計算 (詳細なログから再計算)
     total_input = 0
     total_output = 0
@@ -307,43 +552,68 @@ def generate_recommendations(state: WorkflowState) -> WorkflowState:
             total_output += u.output_tokens
             clean_usage_list.append({"input_tokens": u.input_tokens, "output_tokens": u.output_tokens})
     
-    updated_state["final_output"] = {
-        "compliant": "適合" in result.content,
-        "recommendations": result.content,
-        "analysis_summary": analysis_result["irac_analysis"],
-        "token_usage": {
-            "input": total_input,
-            "output": total_output,
-            "total": total_input + total_output,
-            "details": usage_list
-        }
+    return {
+        "input": total_input,
+        "output": total_output,
+        "total": total_input + total_output,
+        "context_tokens_saved": (context_stats or {}).get("saved_tokens", 0),
+        "context": context_stats or {},
+        "details": usage_list
     }
-    updated_state["usage_metadata"] = usage_list
-    updated_state["current_step"] = "recommend"
-
-    print("Recommendations generated")
-    return updated_state
 
-# ワークフローの作成
-def create_workflow():
+# ワークフローグラフの定義
+def build_full_graph() -> StateGraph:
     """
-    LangGraphを使用した法律チェックワークフローを作成
+    事前判定 → 検索 → IRAC分析 → 言い換え提案 の標準ワークフロー
+    事前判定で明白な違反とされた場合は、検索後にLLMを呼ばずに結論を出す
+    分析の結論が適合の場合は、言い換え提案を作らずに分析結果のみで終える
     """
     workflow = StateGraph(WorkflowState)
 
     # ノードの追加
+    workflow.add_node("prescreen", prescreen_text)
     workflow.add_node("retrieve", retrieve_documents)
     workflow.add_node("analyze", analyze_compliance)
     workflow.add_node("recommend", generate_recommendations)
+    workflow.add_node("summarize", summarize_analysis)
+    workflow.add_node("conclude", conclude_from_prescreen)
 
     # エントリポイントの設定
-    workflow.set_entry_point("retrieve")
+    workflow.set_entry_point("prescreen")
 
     # エッジの追加（フローの定義）
-    workflow.add_edge("retrieve", "analyze")
-    workflow.add_edge("analyze", "recommend")
+    workflow.add_edge("prescreen", "retrieve")
+    workflow.add_conditional_edges("retrieve", route_after_retrieve, {"analyze": "analyze", "conclude": "conclude"})
+    workflow.add_edge("conclude", END)
+    workflow.add_conditional_edges("analyze", route_after_analyze, {"recommend": "recommend", "summarize": "summarize"})
     workflow.add_edge("recommend", END)
+    workflow.add_edge("summarize", END)
+    return workflow
+
+def build_quick_graph() -> StateGraph:
+    """
+    事前判定 → 検索 → IRAC分析 のみの簡易スクリーニング（言い換え提案のLLM呼び出しを省略）
+    """
+    workflow = StateGraph(WorkflowState)
+    workflow.add_node("prescreen", prescreen_text)
+    workflow.add_node("retrieve", retrieve_documents)
+    workflow.add_node("analyze", analyze_compliance)
+    workflow.add_node("summarize", summarize_analysis)
+    workflow.add_node("conclude", conclude_from_prescreen)
+    workflow.set_entry_point("prescreen")
+    workflow.add_edge("prescreen", "retrieve")
+    workflow.add_conditional_edges("retrieve", route_after_retrieve, {"analyze": "analyze", "conclude": "conclude"})
+    workflow.add_edge("conclude", END)
+    workflow.add_edge("analyze", "summarize")
+    workflow.add_edge("summarize", END)
+    return workflow
 
+# ワークフローの作成
+def create_workflow():
+    """
+    LangGraphを使用した法律チェックワークフローを作成
+    ※ リクエストごとに呼ばず、app.workflow.registry.get_workflow() でコンパイル済みのものを使うこと
+    """
     # ワークフローのコンパイル
-    app = workflow.compile()
-    return app
\ No newline at end of file
+    app = build_full_graph().compile()
+    return app
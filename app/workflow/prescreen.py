@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# LLM呼び出し前の事前判定に使う表現辞書
+PRESCREEN_RULES_PATH = os.getenv("PRESCREEN_RULES_PATH", "./data/prescreen_rules.json")
+
+# 事前判定の扱い:
+# - off: 事前判定を行わない
+# - annotate: 検出結果をレスポンスと分析プロンプトに付与するだけで、LLMの呼び出しは変えない（既定）
+# - short_circuit: 明白な違反（ng）はLLMによる分析・提案を省略する（該当なし・要確認は通常どおりLLMで分析する）
+DEFAULT_PRESCREEN_MODE = os.getenv("PRESCREEN_MODE", "annotate")
+PRESCREEN_MODES = ("off", "annotate", "short_circuit")
+
+# 判定結果: ng（否定されていない重大度highの表現を含む）/ review（それ以外の該当表現のみ）/ clear（該当なし）
+SEVERITY_ORDER = {"high": 2, "medium": 1, "low": 0}
+
+# 該当表現の直後、同じ文の NEGATION_WINDOW 文字以内に否定の語がある場合は否定文とみなす（例: 「治療効果はありません」）
+# 否定文の表現は ng の根拠にせず、LLMによる分析に委ねる
+NEGATION_WINDOW = 12
+_NEGATION = re.compile(
+    r"[^。．.！!？?\n]{0,%d}?(?:ありません|ございません|ではない|じゃない|ことはない|わけではない|はない|しません|できません|ません|ない)"
+    % NEGATION_WINDOW
+)
+
+
+class PrescreenRule:
+    """辞書の1ルール。完全一致の語と正規表現を1つの正規表現にまとめてコンパイルする"""
+
+    def __init__(self, rule: Dict):
+        self.id = rule["id"]
+        self.category = rule.get("category", "")
+        self.law = rule.get("law", "")
+        self.severity = rule.get("severity", "medium")
+        # 長い語を先に置き、短い語が部分一致で先に当たらないようにする
+        terms = sorted({unicodedata.normalize("NFKC", t) for t in rule.get("terms", [])}, key=len, reverse=True)
+        alternatives = [re.escape(t) for t in terms] + list(rule.get("patterns", []))
+        if not alternatives:
+            raise ValueError(f"Prescreen rule has no terms or patterns: {self.id}")
+        self.regex = re.compile("|".join(f"(?:{a})" for a in alternatives), re.IGNORECASE)
+
+
+class Prescreener:
+    """
+    表現辞書による事前判定エンジン
+    入力テキストをNFKC正規化してから照合し、検出箇所は元のテキスト上の文字位置で返す。
+    """
+
+    def __init__(self, rules: List[Dict], version: Optional[str] = None):
+        self.rules = [PrescreenRule(r) for r in rules]
+        self.version = version
+
+    @classmethod
+    def from_file(cls, path: str = PRESCREEN_RULES_PATH) -> "Prescreener":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("rules", []), version=str(data.get("version", "")))
+
+    def scan(self, text: str) -> Dict:
+        """
+        テキスト中の該当表現を検出する
+        戻り値: {"verdict": "ng" / "review" / "clear", "matches": [...], "elapsed_us": int}
+        """
+        start = time.perf_counter()
+        normalized, offsets = _normalize_with_offsets(text)
+        matches = []
+        for rule in self.rules:
+            for m in rule.regex.finditer(normalized):
+                if m.start() == m.end():
+                    continue
+                begin, end = offsets[m.start()], offsets[m.end()]
+                matches.append({
+                    "rule_id": rule.id,
+                    "category": rule.category,
+                    "law": rule.law,
+                    "severity": rule.severity,
+                    "text": text[begin:end],
+                    "start": begin,
+                    "end": end,
+                    "negated": bool(_NEGATION.match(normalized, m.end())),
+                })
+        matches.sort(key=lambda m: (m["start"], -SEVERITY_ORDER.get(m["severity"], 0)))
+
+        if any(m["severity"] == "high" and not m["negated"] for m in matches):
+            verdict = "ng"
+        elif matches:
+            verdict = "review"
+        else:
+            verdict = "clear"
+        return {
+            "verdict": verdict,
+            "matches": matches,
+            "rules_version": self.version,
+            "elapsed_us": int((time.perf_counter() - start) * 1_000_000),
+        }
+
+
+def _normalize_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """
+    1文字ずつNFKC正規化し、正規化後の各位置に対応する元のテキストの位置を返す
+    （「㍻」→「平成」のように長さが変わる文字があっても検出箇所を元のテキスト上で示せるようにする）
+    offsets は正規化後のテキストより1つ長く、末尾は len(text) になる
+    """
+    parts = []
+    offsets = []
+    for i, ch in enumerate(text):
+        normalized = unicodedata.normalize("NFKC", ch)
+        parts.append(normalized)
+        offsets.extend([i] * len(normalized))
+    offsets.append(len(text))
+    return "".join(parts), offsets
+
+
+def format_findings(result: Dict) -> str:
+    """検出結果を分析プロンプトに載せる箇条書きにする"""
+    lines = []
+    for m in result.get("matches", []):
+        negated = " / 否定文" if m.get("negated") else ""
+        lines.append(f"- 「{m['text']}」（{m['category']} / {m['law']} / 重大度: {m['severity']}{negated}）")
+    return "\n".join(lines)
+
+
+_default_prescreener: Optional[Prescreener] = None
+_lock = threading.Lock()
+
+
+def get_prescreener() -> Optional[Prescreener]:
+    """プロセス内で共有する事前判定エンジンを返す。辞書ファイルがない場合は無効"""
+    global _default_prescreener
+    if _default_prescreener is None:
+        with _lock:
+            if _default_prescreener is None:
+                if not PRESCREEN_RULES_PATH or not os.path.exists(PRESCREEN_RULES_PATH):
+                    return None
+                _default_prescreener = Prescreener.from_file(PRESCREEN_RULES_PATH)
+    return _default_prescreener
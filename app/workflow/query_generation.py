@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from app.rag.vocabulary import load_vocabulary, match_terms
+
+# プロンプトを変更した場合はバージョンを上げる（キャッシュのキーに含まれる）
+QUERY_PROMPT_VERSION = "v1"
+
+# 検索クエリ生成のモード: llm（Geminiで生成、結果はキャッシュ）/ local（語彙照合のみ、LLMを呼ばない）
+DEFAULT_QUERY_MODE = os.getenv("QUERY_MODE", "llm")
+QUERY_MODES = ("llm", "local")
+
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "./data/query_cache.sqlite3")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "50000"))
+
+# ローカル生成時に各スロットのクエリへ付与する基本語
+_SLOT_ANCHORS = {
+    "yakkiho_query": ("yakkiho", "薬機法 第66条 誇大広告"),
+    "kehyoho_query": ("kehyoho", "景表法 第5条 優良誤認 有利誤認"),
+    "guideline_query": ("other", "広告 表示 ガイドライン 事例"),
+}
+
+
+def build_query_generation_prompt(input_text: str) -> str:
+    return f"""
+    You are a legal search expert.
+    Based on the following input text, generate THREE distinct search queries to retrieve relevant legal provisions.
+
+    1. Yakkiho Query: Focus on the Pharmaceutical and Medical Device Act (薬機法). Use specific terms like "第66条" or "誇大広告".
+    2. Kehyoho Query: Focus on the Act against Unjustifiable Premiums and Misleading Representations (景表法). Use specific terms like "第5条" or "優良誤認".
+    3. Guideline Query: Focus on administrative guidelines, Q&A, and practical standards.
+
+    Input Text:
+    "{input_text}"
+
+    Instructions:
+    1. Identify specific claims in the text that might violate the law.
+    2. **CRITICAL: Generate queries PRIMARILY IN JAPANESE.**
+    3. Return the result in the following JSON format ONLY:
+       {{
+           "yakkiho_query": "...",
+           "kehyoho_query": "...",
+           "guideline_query": "..."
+       }}
+    """
+
+
+def fallback_queries(input_text: str) -> Dict[str, str]:
+    """LLMでの生成に失敗した場合のクエリ"""
+    return {
+        "yakkiho_query": f"薬機法 {input_text[:50]}",
+        "kehyoho_query": f"景表法 {input_text[:50]}",
+        "guideline_query": f"ガイドライン {input_text[:50]}"
+    }
+
+
+def generate_local_queries(input_text: str, vocabulary: Optional[Dict] = None) -> Dict[str, str]:
+    """
+    LLMを使わずに3スロットの検索クエリを生成する。
+    入力テキストから法令コーパスの語彙に含まれる用語を抽出し、スロットごとの基本語と組み合わせる。
+    語彙が未構築の場合は fallback_queries と同じ形式になる。
+    """
+    if vocabulary is None:
+        from app.rag import vector_store
+        vocabulary = load_vocabulary(vector_store.get_current_dir())
+    if not vocabulary:
+        return fallback_queries(input_text)
+
+    queries = {}
+    for slot, (law_group, anchor) in _SLOT_ANCHORS.items():
+        terms = match_terms(input_text, vocabulary, law_group)
+        queries[slot] = " ".join([anchor, *terms]) if terms else f"{anchor} {input_text[:50]}"
+    return queries
+
+
+class QueryCache:
+    """
+    LLMで生成した検索クエリの永続キャッシュ（SQLite）
+    キーは (プロンプトバージョン, モデル名, 入力テキスト) のハッシュ。上限を超えると古いものから削除する。
+    """
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS generated_queries (
+                key TEXT PRIMARY KEY,
+                queries TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_queries_last_used ON generated_queries (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(input_text: str, model_name: str) -> str:
+        raw = f"{QUERY_PROMPT_VERSION}\x00{model_name}\x00{input_text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, input_text: str, model_name: str) -> Optional[Dict[str, str]]:
+        key = self.make_key(input_text, model_name)
+        with self._lock:
+            row = self._conn.execute("SELECT queries FROM generated_queries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE generated_queries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, input_text: str, model_name: str, queries: Dict[str, str]):
+        key = self.make_key(input_text, model_name)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generated_queries (key, queries, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(queries, ensure_ascii=False), time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM generated_queries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM generated_queries WHERE key IN "
+                    "(SELECT key FROM generated_queries ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+
+_default_cache: Optional[QueryCache] = None
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """プロセス内で共有するクエリキャッシュを返す。QUERY_CACHE_PATHが空の場合は無効"""
+    global _default_cache
+    if not QUERY_CACHE_PATH:
+        return None
+    if _default_cache is None:
+        _default_cache = QueryCache()
+    return _default_cache
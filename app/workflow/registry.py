@@ -0,0 +1,56 @@
+import threading
+from typing import Callable, Dict, List
+
+from langgraph.graph import StateGraph
+
+from app.workflow.langgraph import build_full_graph, build_quick_graph
+
+# パイプライン名 → グラフ定義
+_builders: Dict[str, Callable[[], StateGraph]] = {}
+# コンパイル済みグラフ（プロセス内で1回だけコンパイルし、全リクエストで共有する）
+_compiled: Dict[str, object] = {}
+_lock = threading.Lock()
+
+DEFAULT_PIPELINE = "full"
+
+
+def register_pipeline(name: str, builder: Callable[[], StateGraph]):
+    """パイプラインを登録する。同名の登録は上書きし、コンパイル済みのグラフも破棄する"""
+    with _lock:
+        _builders[name] = builder
+        _compiled.pop(name, None)
+
+
+def available_pipelines() -> List[str]:
+    return sorted(_builders)
+
+
+def get_workflow(name: str = DEFAULT_PIPELINE):
+    """
+    コンパイル済みのワークフローを返す。
+    コンパイル済みグラフは状態を持たないため、並行リクエストから同時にainvokeしてよい。
+    """
+    workflow = _compiled.get(name)
+    if workflow is not None:
+        return workflow
+    with _lock:
+        if name not in _compiled:
+            if name not in _builders:
+                raise ValueError(f"Unknown pipeline: {name} (available: {', '.join(sorted(_builders))})")
+            _compiled[name] = _builders[name]().compile()
+        return _compiled[name]
+
+
+def compile_all() -> List[str]:
+    """
+    登録済みの全パイプラインをコンパイルする（起動時チェック用）。
+    グラフ定義に誤りがあればここで例外になり、サーバーは起動しない。
+    """
+    names = available_pipelines()
+    for name in names:
+        get_workflow(name)
+    return names
+
+
+register_pipeline("full", build_full_graph)
+register_pipeline("quick", build_quick_graph)
@@ -0,0 +1,232 @@
+import json
+from typing import Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from app.models.response import ComplianceAnalysis, ComplianceIssue, RecommendationSet
+
+T = TypeVar("T", bound=BaseModel)
+
+# 構造化出力の修復呼び出しに付けるタグ（ストリーミングでこの呼び出しのトークンを送らないようにする）
+REPAIR_TAG = "structured_repair"
+
+# プロンプトに埋め込む出力形式（ChatPromptTemplateの変数として渡すため、波括弧はエスケープ不要）
+ANALYSIS_FORMAT = """{
+  "verdict": "compliant" | "non_compliant" | "unclear",
+  "risk_level": "high" | "medium" | "low" | "none",
+  "issues": [
+    {
+      "expression": "<problematic expression quoted verbatim from the input text>",
+      "law": "<law name, e.g. 薬機法 / 景品表示法>",
+      "cited_articles": ["<article or guideline cited from the provided documents, e.g. 薬機法 第66条第1項>"],
+      "risk_level": "high" | "medium" | "low",
+      "reason": "<Application: how the expression conflicts with the rule, in Japanese>"
+    }
+  ],
+  "rule": "<Rule: summary of the applicable provisions, in Japanese>",
+  "application": "<Application: overall reasoning, in Japanese>",
+  "conclusion": "<Conclusion: final judgment and risk level, in Japanese>"
+}"""
+
+RECOMMENDATION_FORMAT = """{
+  "revisions": [
+    {
+      "original_text": "<problematic expression from the input text>",
+      "revised_text": "<revised expression>",
+      "reason": "<why the revised expression is safe, in Japanese>"
+    }
+  ]
+}"""
+
+
+def extract_json(content: str) -> str:
+    """LLMの出力からJSON部分を取り出す（コードブロックで囲まれている場合に対応）"""
+    content = content.strip()
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    return content
+
+
+def parse_structured(content: str, model: Type[T]) -> Tuple[Optional[T], Optional[str]]:
+    """
+    LLMの出力をPydanticモデルとして検証する
+    戻り値: (モデル, None) または 失敗した場合は (None, エラー内容)
+    """
+    try:
+        return model.model_validate_json(extract_json(content)), None
+    except ValidationError as e:
+        return None, str(e)
+
+
+def locate_issues(analysis: ComplianceAnalysis, input_text: str) -> ComplianceAnalysis:
+    """各論点の表現を入力テキスト上で探し、文字位置を付与する（LLMの返す位置は当てにならないため）"""
+    for issue in analysis.issues:
+        begin = input_text.find(issue.expression) if issue.expression else -1
+        if begin >= 0:
+            issue.start, issue.end = begin, begin + len(issue.expression)
+    return analysis
+
+
+def render_irac(analysis: ComplianceAnalysis) -> str:
+    """構造化された分析結果をIRAC形式の文章にする（レスポンスのdetails・言い換え提案のプロンプト用）"""
+    issue_lines = [
+        f"- 「{i.expression}」（{i.law} / {', '.join(i.cited_articles) or '根拠未特定'} / リスク: {i.risk_level}）"
+        for i in analysis.issues
+    ] or ["- 問題となる表現は見つかりませんでした。"]
+    reason_lines = [f"- 「{i.expression}」: {i.reason}" for i in analysis.issues if i.reason]
+    return "\n".join([
+        "### 1. Issue (論点)",
+        *issue_lines,
+        "",
+        "### 2. Rule (法的事項)",
+        analysis.rule,
+        "",
+        "### 3. Application (あてはめ)",
+        *reason_lines,
+        analysis.application,
+        "",
+        "### 4. Conclusion (結論)",
+        analysis.conclusion,
+    ])
+
+
+def render_recommendations(recommendations: RecommendationSet) -> str:
+    """代替表現の提案を番号付きの文章にする"""
+    return "\n".join(
+        f"{n}. {r.original_text} → {r.revised_text} - {r.reason}"
+        for n, r in enumerate(recommendations.revisions, 1)
+    )
+
+
+def schema_summary(model: Type[BaseModel]) -> str:
+    """修復依頼のプロンプトに渡すJSON Schema"""
+    return json.dumps(model.model_json_schema(), ensure_ascii=False)
+
+
+def prescreen_to_analysis(prescreen: Dict) -> ComplianceAnalysis:
+    """事前判定で明白な違反とされた場合に、検出結果からLLMを使わずに分析結果を作る"""
+    # 否定文の表現（「治療効果はありません」など）は違反の根拠にしない
+    matches = [m for m in prescreen["matches"] if not m.get("negated")]
+    high = [m for m in matches if m["severity"] == "high"]
+    return ComplianceAnalysis(
+        verdict="non_compliant",
+        risk_level="high",
+        issues=[
+            ComplianceIssue(
+                expression=m["text"],
+                start=m["start"],
+                end=m["end"],
+                law=m["law"],
+                cited_articles=[m["law"]],
+                risk_level=m["severity"] if m["severity"] in ("high", "medium", "low") else "medium",
+                reason=f"{m['category']}に該当する表現です。",
+            )
+            for m in matches
+        ],
+        rule="\n".join(f"- {law}" for law in sorted({m["law"] for m in high})),
+        application="検出された表現は、上記の規定で禁止される表現類型に該当します。",
+        conclusion="不適合（違反の可能性が高い）。広告表現辞書による事前判定の結果のため、LLMによる詳細な分析は省略しています。",
+    )
+
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldStream:
+    """
+    LLMがストリーミングで返すJSONを少しずつ読み、文字列の値に追加された文字を
+    (フィールドのパス, 追加された文字列) として返す（例: ("issues[0].reason", "効能")）
+    最初の "{" より前（コードブロックの開始など）と、最上位のオブジェクトが閉じた後は読み飛ばす。
+    数値・真偽値や不正な形式は無視する（検証は完了後の parse_structured で行う）。
+    """
+
+    def __init__(self):
+        # 開いているオブジェクト・配列: [種類, パス, 次が値のキーか / 要素番号]
+        self._stack: List[list] = []
+        self._done = False
+        self._in_string = False
+        self._string_is_key = False
+        self._escape: Optional[str] = None
+        self._key = ""
+        self._value_path = ""
+
+    def _child_path(self) -> str:
+        kind, path, state = self._stack[-1]
+        if kind == "array":
+            return f"{path}[{state}]"
+        return f"{path}.{self._key}" if path else self._key
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        deltas: List[Tuple[str, str]] = []
+
+        def emit(text: str):
+            if self._string_is_key:
+                self._key += text
+            elif deltas and deltas[-1][0] == self._value_path:
+                deltas[-1] = (self._value_path, deltas[-1][1] + text)
+            else:
+                deltas.append((self._value_path, text))
+
+        for ch in chunk:
+            if self._done:
+                break
+            if self._in_string:
+                if self._escape is not None:
+                    if self._escape == "" and ch != "u":
+                        emit(_ESCAPES.get(ch, ch))
+                        self._escape = None
+                    else:
+                        # \uXXXX は4桁そろってから1文字にする
+                        self._escape += ch
+                        if len(self._escape) == 5:
+                            try:
+                                emit(chr(int(self._escape[1:], 16)))
+                            except ValueError:
+                                pass
+                            self._escape = None
+                elif ch == "\\":
+                    self._escape = ""
+                elif ch == '"':
+                    self._in_string = False
+                else:
+                    emit(ch)
+                continue
+            if not self._stack:
+                if ch == "{":
+                    self._stack.append(["object", "", True])
+                continue
+            top = self._stack[-1]
+            if ch == '"':
+                self._in_string = True
+                self._string_is_key = top[0] == "object" and top[2] is True
+                if self._string_is_key:
+                    self._key = ""
+                else:
+                    self._value_path = self._child_path()
+            elif ch in "{[":
+                self._stack.append(["object" if ch == "{" else "array", self._child_path(), True if ch == "{" else 0])
+            elif ch in "}]":
+                self._stack.pop()
+                self._done = not self._stack
+            elif ch == ":" and top[0] == "object":
+                top[2] = False
+            elif ch == ",":
+                if top[0] == "object":
+                    top[2] = True
+                else:
+                    top[2] += 1
+        return deltas
+
+
+def iter_string_fields(value, path: str = ""):
+    """構造化された結果の文字列の値を (フィールドのパス, 値) として順に返す（JsonFieldStream と同じパス表記）"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_string_fields(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from iter_string_fields(item, f"{path}[{i}]")
+    elif isinstance(value, str) and value:
+        yield path, value
@@ -2,9 +2,12 @@ import sys
 import os
 sys.path.append(os.getcwd())
 
-# これをインポートすることで、app/rag/retrieval.py のトップレベルにある初期化コードが走り、データがロードされる
+# インデックス構築コマンド (python -m app.rag.build_index) と同じ処理を実行する
 try:
-    from app.rag.retrieval import sample_docs
-    print(f"データロード完了: {len(sample_docs)} 件のsource_docsをベクトルストアに保存しました。")
+    from app.rag.build_index import build_index
+    info = build_index(full=os.getenv("FORCE_REINDEX", "").lower() == "true")
+    stats = info["stats"]
+    print(f"データロード完了: {info['chunk_count']} 件のチャンクをインデックス (version {info['version']}) に保存しました"
+          f"（更新 {stats['chunks_upserted']} 件 / 削除 {stats['chunks_deleted']} 件）。")
 except Exception as e:
-    print(f"エラーが発生しました: {e}")
\ No newline at end of file
+    print(f"エラーが発生しました: {e}")
@@ -1,84 +1,65 @@
-import xml.etree.ElementTree as ET
 import json
 import os
 import sys
 
+sys.path.append(os.getcwd())
+
+from app.rag.xml_chunker import iter_law_paragraphs
+
+# law_group → 出力JSONの law_category
+LAW_CATEGORIES = {
+    "yakkiho": "pharmaceutical_affairs_act",
+    "kehyoho": "premiums_and_representations_act",
+    "other": "other",
+}
+
 def parse_law_xml(file_path):
     print(f"Parsing {file_path}...")
     
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
         articles_data = []
-        
-        # 本則 (MainProvision) の抽出
-        main_provision = root.find(".//MainProvision")
-        if main_provision is not None:
-            articles_data.extend(extract_articles_from_element(main_provision, is_main=True))
-            
-        # 附則 (SupplProvision) は抽出しない（ノイズ削減のため）
-        # suppl_provisions = root.findall(".//SupplProvision")
-        # for suppl in suppl_provisions:
-        #     articles_data.extend(extract_articles_from_element(suppl, is_main=False))
-            
+        for para in iter_law_paragraphs(file_path):
+            # 附則 (SupplProvision) は抽出しない（ノイズ削減のため）
+            if not para["is_main_provision"]:
+                continue
+            articles_data.append(paragraph_to_record(para))
         return articles_data
 
     except Exception as e:
         print(f"Error parsing XML: {e}")
         return []
 
-def extract_articles_from_element(element, is_main):
-    """特定の要素配下のArticleを抽出する共通関数"""
-    articles = []
-    for article in element.findall(".//Article"):
-        title = article.find("ArticleTitle")
-        caption = article.find("ArticleCaption")
-        
-        title_text = title.text if title is not None else "不明な条文"
-        caption_text = caption.text if caption is not None else ""
-        
-        content_text = ""
-        for paragraph in article.findall("Paragraph"):
-            para_num = paragraph.find("ParagraphNum")
-            para_num_text = para_num.text if para_num is not None else ""
-            
-            para_sentence = paragraph.find("ParagraphSentence")
-            if para_sentence is not None:
-                for sentence in para_sentence.findall("Sentence"):
-                    if sentence.text:
-                        content_text += f"{para_num_text} {sentence.text}\n"
-            
-            for item in paragraph.findall("Item"):
-                item_title = item.find("ItemTitle")
-                item_title_text = item_title.text if item_title is not None else ""
-                item_sentence = item.find("ItemSentence")
-                if item_sentence is not None:
-                    for sentence in item_sentence.findall(".//Sentence"):
-                        if sentence.text:
-                            content_text += f"  {item_title_text} {sentence.text}\n"
+def paragraph_to_record(para):
+    """xml_chunkerの項レコードをRAGロード用のJSON形式に変換する"""
+    law_title = para["law_title"]
+    title_text = para["article_title"] or "不明な条文"
+    caption_text = para["article_caption"]
+    # 略称（例: 景表法,景品表示法）があれば最後のものをタグに使う
+    law_tag = para["law_abbrev"].split(",")[-1] if para["law_abbrev"] else law_title
 
-        articles.append({
-            "title": f"不当景品類及び不当表示防止法 {title_text} {caption_text}",
-            "law_category": "premiums_and_representations_act",
-            "section": title_text,
-            "tags": ["景品表示法", caption_text] if caption_text else ["景品表示法"],
-            "content": content_text.strip(),
-            "metadata": {
-                "is_main_provision": is_main # ここで本則か附則かを区別
-            }
-        })
-    return articles
+    return {
+        "title": f"{law_title} {title_text}{para['paragraph_label']} {caption_text}".strip(),
+        "law_category": LAW_CATEGORIES[para["law_group"]],
+        "section": title_text,
+        "paragraph": para["paragraph_num"],
+        "tags": [law_tag, caption_text] if caption_text else [law_tag],
+        "content": para["text"],
+        "metadata": {
+            "is_main_provision": para["is_main_provision"] # ここで本則か附則かを区別
+        }
+    }
 
 def main():
-    xml_path = "不当景品類及び不当表示防止法（昭和三十七年法律第百三十四号）.xml"
+    xml_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        "source_docs", "01_条文", "不当景品類及び不当表示防止法（昭和三十七年法律第百三十四号）.xml"
+    )
     
     if not os.path.exists(xml_path):
         print(f"File not found: {xml_path}")
         return
 
     articles = parse_law_xml(xml_path)
-    print(f"\n抽出された条文数: {len(articles)}")
+    print(f"\n抽出された項数: {len(articles)}")
     
     if articles:
         print("\n--- 抽出サンプル (最初の3件) ---")
@@ -87,7 +68,7 @@ def main():
             print(f"内容: {article['content'][:100]}...")
             
         # JSONファイルとして保存（RAGロード用）
-        output_path = "data/legal_documents/full_premiums_act.json"
+        output_path = sys.argv[2] if len(sys.argv) > 2 else "data/legal_documents/full_premiums_act.json"
         
         # 既存のJSONファイルを上書きしないようにリスト形式で保存する形に変換するか、
         # あるいは1つのファイルにまとめるか。
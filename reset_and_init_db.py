@@ -4,7 +4,7 @@ import sys
 import subprocess
 
 def reset_db():
-    db_path = "./data/chroma_db"
+    db_path = "./data/index"
     if os.path.exists(db_path):
         print(f"Deleting existing database at {db_path}...")
         shutil.rmtree(db_path)
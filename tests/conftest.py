@@ -0,0 +1,14 @@
+import os
+import shutil
+import tempfile
+
+# テスト中に作られるSQLite（クエリ・embeddingのキャッシュ、ジョブ）を ./data ではなく一時ディレクトリに置く
+# 各モジュールは読み込み時に環境変数を読むため、app を読み込む前（conftestの読み込み時）に設定する
+_TMP_DIR = tempfile.mkdtemp(prefix="compliance-tests-")
+os.environ["QUERY_CACHE_PATH"] = os.path.join(_TMP_DIR, "query_cache.sqlite3")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_TMP_DIR, "embedding_cache.sqlite3")
+os.environ["JOB_DB_PATH"] = os.path.join(_TMP_DIR, "jobs.sqlite3")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP_DIR, ignore_errors=True)
@@ -0,0 +1,171 @@
+import asyncio
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from app.models.request import BatchComplianceCheckRequest, ContentData
+from app.models.response import ComplianceCheckResponse
+from app.rag import retrieval, vector_store
+from app.rag.lexical_index import build_lexical_index
+from app.rag.search_batcher import SearchBatcher
+from app.rag.vector_backend import ChromaBackend
+
+
+def test_search_batcher_merges_concurrent_searches():
+    """並行する検索が1回の検索関数呼び出しにまとめられ、呼び出し元ごとに結果が分配される"""
+    calls = []
+
+    def fake_search(searches):
+        calls.append([s["query"] for s in searches])
+        return [{"query": s["query"]} for s in searches]
+
+    batcher = SearchBatcher(fake_search, window_ms=20)
+
+    async def run_all():
+        return await asyncio.gather(
+            batcher.search([{"query": "a1"}, {"query": "a2"}]),
+            batcher.search([{"query": "b1"}]),
+        )
+
+    first, second = asyncio.run(run_all())
+    assert calls == [["a1", "a2", "b1"]]
+    assert first == [{"query": "a1"}, {"query": "a2"}]
+    assert second == [{"query": "b1"}]
+
+
+def test_search_documents_batch_groups_queries_by_filter(monkeypatch):
+    """同じフィルタのクエリは1回のbackend.queryにまとめられる"""
+    queries = []
+
+    class FakeCollection:
+        metadata = {"hnsw:space": "l2"}
+
+        def query(self, query_embeddings, n_results, where):
+            queries.append((len(query_embeddings), n_results, where["law_group"]))
+            rows = range(len(query_embeddings))
+            return {
+                "ids": [[f"{where['law_group']}-{r}-{k}" for k in range(n_results)] for r in rows],
+                "documents": [[f"doc{k}" for k in range(n_results)] for _ in rows],
+                "metadatas": [[{} for _ in range(n_results)] for _ in rows],
+                "distances": [[0.1 * k for k in range(n_results)] for _ in rows],
+                "embeddings": None,
+                "included": ["documents", "metadatas", "distances"],
+            }
+
+    monkeypatch.setattr(vector_store, "backend", ChromaBackend(collection=FakeCollection()))
+    monkeypatch.setattr(vector_store.embedding_func, "encode", lambda texts: [[float(len(t))] for t in texts])
+
+    results = vector_store.search_documents_batch([
+        {"query": "q1", "top_k": 3, "where": {"law_group": "yakkiho"}},
+        {"query": "q2", "top_k": 2, "where": {"law_group": "kehyoho"}},
+        {"query": "q3", "top_k": 2, "where": {"law_group": "yakkiho"}},
+    ])
+
+    assert sorted(queries) == [(1, 2, "kehyoho"), (2, 3, "yakkiho")]
+    assert results[0]["ids"] == [["yakkiho-0-0", "yakkiho-0-1", "yakkiho-0-2"]]
+    assert results[2]["ids"] == [["yakkiho-1-0", "yakkiho-1-1"]]
+    assert results[1]["distances"] == [[0.0, 0.1]]
+
+
+def test_search_documents_batch_fuses_bm25_and_article_lookup(monkeypatch):
+    """語彙索引がある場合、BM25のみの一致も結果に入り、条文番号だけのクエリはembeddingを計算しない"""
+    docs = {
+        "a": ("何人も、医薬品の効能に関して虚偽又は誇大な記事を広告してはならない。",
+              {"law_group": "yakkiho", "category": "01_statute", "section": "第六十六条"}),
+        "b": ("商品の品質について著しく優良であると示す表示（優良誤認）",
+              {"law_group": "kehyoho", "category": "01_statute", "section": "第五条"}),
+    }
+    encoded = []
+
+    class FakeCollection:
+        metadata = {"hnsw:space": "cosine"}
+
+        def query(self, query_embeddings, n_results, where):
+            # ベクトル検索では優良誤認の条文が見つからない
+            return {"ids": [[] for _ in query_embeddings], "documents": [[] for _ in query_embeddings],
+                    "metadatas": [[] for _ in query_embeddings], "distances": [[] for _ in query_embeddings]}
+
+        def get(self, ids, include):
+            return {"ids": ids, "documents": [docs[i][0] for i in ids], "metadatas": [docs[i][1] for i in ids]}
+
+    def fake_encode(texts):
+        encoded.extend(texts)
+        return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(vector_store, "backend", ChromaBackend(collection=FakeCollection()))
+    monkeypatch.setattr(vector_store, "lexical_index", build_lexical_index(
+        [{"id": k, "content": text, "metadata": meta} for k, (text, meta) in docs.items()]))
+    monkeypatch.setattr(vector_store.embedding_func, "encode", fake_encode)
+
+    article, fused = vector_store.search_documents_batch([
+        {"query": "薬機法 第66条", "top_k": 3, "where": {"law_group": "yakkiho"}},
+        {"query": "優良誤認", "top_k": 3, "where": {"law_group": "kehyoho"}},
+    ])
+
+    assert encoded == ["優良誤認"]
+    assert article["ids"] == [["a"]] and article["similarities"] == [[1.0]]
+    assert fused["ids"] == [["b"]]
+    assert fused["documents"][0][0].startswith("商品の品質")
+
+
+def test_search_documents_batch_keeps_bm25_when_embedding_fails(monkeypatch):
+    """embeddingに失敗してもベクトル検索だけを省き、BM25の結果は返す"""
+    docs = {
+        "b": ("商品の品質について著しく優良であると示す表示（優良誤認）",
+              {"law_group": "kehyoho", "category": "01_statute", "section": "第五条"}),
+    }
+    queried = []
+
+    class FakeCollection:
+        metadata = {"hnsw:space": "cosine"}
+
+        def query(self, query_embeddings, n_results, where):
+            queried.append(len(query_embeddings))
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+        def get(self, ids, include):
+            return {"ids": ids, "documents": [docs[i][0] for i in ids], "metadatas": [docs[i][1] for i in ids]}
+
+    def failing_encode(texts):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(vector_store, "backend", ChromaBackend(collection=FakeCollection()))
+    monkeypatch.setattr(vector_store, "lexical_index", build_lexical_index(
+        [{"id": k, "content": text, "metadata": meta} for k, (text, meta) in docs.items()]))
+    monkeypatch.setattr(vector_store.embedding_func, "encode", failing_encode)
+
+    [result] = vector_store.search_documents_batch([{"query": "優良誤認", "top_k": 3, "where": {"law_group": "kehyoho"}}])
+
+    assert queried == []
+    assert result["ids"] == [["b"]]
+
+
+def test_batch_dedupes_texts_and_reports_partial_failures(monkeypatch):
+    checked = []
+
+    async def fake_check(request):
+        checked.append(request.content.data)
+        if "失敗" in request.content.data:
+            raise RuntimeError("LLM error")
+        return ComplianceCheckResponse(status="success", result={
+            "compliant": True,
+            "analysis_log": {"token_usage": {"input": 10, "output": 5, "total": 15}},
+        })
+
+    monkeypatch.setattr(retrieval, "check_compliance", fake_check)
+    request = BatchComplianceCheckRequest(contents=[
+        ContentData(type="text", data="シミが消える"),
+        ContentData(type="text", data="失敗する投稿"),
+        ContentData(type="text", data=" シミが消える\n"),
+    ])
+
+    response = asyncio.run(retrieval.check_compliance_batch(request, max_concurrency=2))
+
+    assert sorted(checked) == ["シミが消える", "失敗する投稿"]
+    assert response.status == "partial"
+    assert [r.status for r in response.results] == ["success", "error", "success"]
+    assert response.results[2].duplicate_of == 0
+    assert response.results[1].error == "LLM error"
+    assert response.summary == {"total": 3, "unique": 2, "succeeded": 2, "failed": 1, "cache_hits": 0,
+                                "verdicts": {"compliant": 0, "non_compliant": 0, "unclear": 0}}
+    assert response.token_usage == {"input": 10, "output": 5, "total": 15}
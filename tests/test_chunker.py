@@ -0,0 +1,49 @@
+from app.rag.chunker import chunk_text, pack_sentences, split_sections
+
+PDF_PAGES = [
+    (1, "医薬品等適正広告基準の解説\n第1 目的\nこの基準は、医薬品等の広告が虚偽、誇大にわたらないようにするとと\n"
+        "もに、その適正を図ることを目的とする。\n\nQ1 ウェブサイトで商品名を表示するだけでも広告に該当しま\nすか。\n"
+        "A. 次の3要件を満たす場合は広告に該当します。\n・顧客を誘引する意図が明確であること\n"),
+    (2, "・特定医薬品等の商品名が明らかにされていること\n・一般人が認知できる状態であること\n"
+        "Q2 承認前の医薬品を広告してもよいですか。\nA. 承認前の医薬品の名称等の広告は禁止されています。"),
+]
+
+
+def test_pdf_line_wraps_are_joined_and_qa_kept_together():
+    """折り返しはつながり、質問と回答・箇条書きは1つのチャンクにまとまる（ページをまたいでもよい）"""
+    chunks = chunk_text(PDF_PAGES, join_lines=True, min_chars=10)
+
+    assert chunks[0]["text"].endswith("その適正を図ることを目的とする。")
+    qa = chunks[1]
+    assert qa["heading"].startswith("Q1 ウェブサイトで商品名を表示するだけでも")
+    assert qa["text"].startswith("Q1 ウェブサイトで商品名を表示するだけでも広告に該当しますか。\nA. ")
+    assert "\n・一般人が認知できる状態であること" in qa["text"]
+    assert (qa["page_start"], qa["page_end"]) == (1, 2)
+    assert chunks[2]["heading"].startswith("Q2") and chunks[2]["page_start"] == 2
+
+
+def test_article_captions_become_headings_in_markdown():
+    """条の見出しの前の短い行は見出しに含まれ、Markdownは1行を1段落として扱う"""
+    sections = split_sections([(None, "目的\n第1条\nこの規約は表示を定める。\n（定義）\n第2条\n"
+                                      "2\nこの規約で「表示」とは広告をいう。\n")], join_lines=False)
+
+    assert [s["heading"] for s in sections] == ["目的 第1条", "（定義） 第2条"]
+    assert [text for text, _, _ in sections[1]["sentences"]] == ["2", "この規約で「表示」とは広告をいう。"]
+
+
+def test_pack_sentences_respects_target_and_overlap():
+    sentences = [(f"{n}番目の文です。" + "あ" * 40, 1, n == 0) for n in range(6)]
+
+    chunks = pack_sentences(sentences, target_chars=120, max_chars=200, overlap_chars=60, min_chars=10)
+
+    assert len(chunks) > 1
+    assert all(len(c["text"]) <= 200 for c in chunks)
+    # 前のチャンクの末尾の文が次のチャンクの先頭に重なる
+    assert chunks[1]["text"].startswith(chunks[0]["text"][-48:])
+
+
+def test_long_sentences_are_split_at_max_chars():
+    chunks = pack_sentences([("長" * 1000 + "。", None, True)], target_chars=300, max_chars=400,
+                            overlap_chars=0, min_chars=10)
+
+    assert [len(c["text"]) for c in chunks] == [400, 400, 201]
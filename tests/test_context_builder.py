@@ -0,0 +1,36 @@
+from app.workflow.context_builder import build_context, estimate_tokens
+
+
+def _docs(contents, scores):
+    return {
+        "documents": [contents],
+        "metadatas": [[{"title": f"文書{i}", "section": ""} for i in range(len(contents))]],
+        "scores": [scores],
+    }
+
+
+def test_long_documents_are_trimmed_to_relevant_sentences():
+    """上限を超える文書は、クエリと関連の高い文と先頭の文だけを元の順序で残す"""
+    filler = "".join(f"この条は手続{i}に関する定めである。" for i in range(40))
+    document = "第六十六条（誇大広告等）" + filler + "医薬品の効能又は効果に関して虚偽又は誇大な記事を広告してはならない。" + filler
+
+    context, stats = build_context(_docs([document], [1.0]), ["効能 効果 誇大な広告"], doc_token_limit=80)
+
+    assert "第六十六条" in context
+    assert "虚偽又は誇大な記事を広告してはならない" in context
+    assert stats["context_tokens"] < estimate_tokens(document) // 5
+    assert stats["saved_tokens"] > 0
+
+
+def test_budget_keeps_higher_scored_documents_and_dedupes_sentences():
+    """スコアの高い文書から予算内で載せ、文書間で重複する文は1回だけ載せる"""
+    shared = "何人も誇大な広告をしてはならない。"
+    docs = _docs([shared + "低スコアの文書。" * 30, shared + "高スコアの文書。"], [0.2, 0.9])
+
+    context, stats = build_context(docs, ["誇大な広告"], token_budget=40)
+
+    assert context.startswith("Document 1 (文書1 ):\n" + shared)
+    assert context.count(shared) == 1
+    assert context.count("低スコアの文書。") == 1
+    assert stats["documents_used"] == 2
+    assert stats["saved_tokens"] > 0
@@ -0,0 +1,114 @@
+import json
+import sys
+import types
+
+import app.rag
+from app.rag.dedup import encode_signature, estimate_jaccard, find_duplicates, minhash
+from app.rag.indexer import sync_index
+
+GUIDELINE = (
+    "景品類とは、顧客を誘引するための手段として、その方法が直接的であるか間接的であるかを問わず、"
+    "くじの方法によるかどうかを問わず、事業者が自己の供給する商品又は役務の取引に附随して"
+    "相手方に提供する物品、金銭その他の経済上の利益であつて、内閣総理大臣が指定するものをいう。"
+)
+
+
+def test_minhash_ignores_whitespace_and_separates_different_text():
+    """改行位置だけが違う文は同一、別の文は類似度が低い"""
+    same = estimate_jaccard(minhash(GUIDELINE), minhash(GUIDELINE.replace("、", "、\n")))
+    different = estimate_jaccard(minhash(GUIDELINE), minhash("比較広告は、競争事業者の商品との比較を行う広告をいう。" * 3))
+
+    assert same == 1.0
+    assert different < 0.2
+
+
+def test_find_duplicates_keeps_first_occurrence():
+    signatures = [
+        ("a", encode_signature(minhash(GUIDELINE))),
+        ("b", encode_signature(minhash("比較広告は、競争事業者の商品との比較を行う広告をいう。" * 3))),
+        ("c", encode_signature(minhash(" " + GUIDELINE))),
+    ]
+    assert find_duplicates(signatures) == {"c": "a"}
+
+
+class FakeVectorStore(types.ModuleType):
+    """sync_index が使う vector_store の関数をメモリ上で実装したもの"""
+    EMBEDDING_MODEL = "fake-model"
+
+    def __init__(self):
+        super().__init__("app.rag.vector_store")
+        self.docs = {}
+
+    def get_collection_count(self):
+        return len(self.docs)
+
+    def reset_vector_store(self):
+        self.docs.clear()
+
+    def upsert_documents(self, documents):
+        for doc in documents:
+            self.docs[doc["id"]] = {"content": doc["content"], "metadata": dict(doc["metadata"])}
+
+    def update_metadatas(self, updates):
+        for doc_id, update in updates.items():
+            self.docs[doc_id]["metadata"].update(update)
+
+    def delete_documents(self, ids):
+        for doc_id in ids:
+            self.docs.pop(doc_id, None)
+
+
+def test_sync_index_collapses_duplicates_across_files(tmp_path, monkeypatch):
+    """別ファイルの重複チャンクは1つにまとめて出典を残し、まとめ先が消えた場合は重複側を残す"""
+    store = FakeVectorStore()
+    monkeypatch.setitem(sys.modules, "app.rag.vector_store", store)
+    monkeypatch.setattr(app.rag, "vector_store", store, raising=False)
+    docs_dir = tmp_path / "04_運用基準"
+    docs_dir.mkdir()
+    (docs_dir / "a.md").write_text(f"# 運用基準\n{GUIDELINE}\n", encoding="utf-8")
+    (docs_dir / "a[.md").write_text(f"# 運用基準\n{GUIDELINE}\n", encoding="utf-8")
+    (docs_dir / "c.md").write_text("# 比較広告\n" + "比較広告は、競争事業者の商品との比較を行う広告をいう。" * 3,
+                                   encoding="utf-8")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    stats = sync_index(manifest_path, source_docs_dir=tmp_path)
+
+    assert stats["chunks_collapsed"] == 1
+    assert stats["chunks_total"] == store.get_collection_count() == 2
+    kept = next(d for d in store.docs.values() if "景品類" in d["content"])
+    assert json.loads(kept["metadata"]["sources"]) == ["04_運用基準/a.md", "04_運用基準/a[.md"]
+    assert kept["metadata"]["duplicate_count"] == 1
+
+    (docs_dir / "a.md").unlink()
+    stats = sync_index(manifest_path, source_docs_dir=tmp_path)
+
+    assert stats["chunks_collapsed"] == 0
+    assert store.get_collection_count() == 2
+    kept = next(d for d in store.docs.values() if "景品類" in d["content"])
+    assert kept["metadata"]["path"] == "04_運用基準/a[.md"
+    assert json.loads(kept["metadata"]["sources"]) == ["04_運用基準/a[.md"]
+
+
+def test_sync_index_removes_duplicates_upserted_while_parsing(tmp_path, monkeypatch):
+    """パース中にupsertした重複チャンクは判定後に削除され、残す側の出典だけが更新される"""
+    store = FakeVectorStore()
+    upserted = []
+    upsert = store.upsert_documents
+    store.upsert_documents = lambda documents: (upserted.extend(d["id"] for d in documents), upsert(documents))
+    monkeypatch.setitem(sys.modules, "app.rag.vector_store", store)
+    monkeypatch.setattr(app.rag, "vector_store", store, raising=False)
+    docs_dir = tmp_path / "04_運用基準"
+    docs_dir.mkdir()
+    (docs_dir / "a.md").write_text(f"# 運用基準\n{GUIDELINE}\n", encoding="utf-8")
+    manifest_path = str(tmp_path / "manifest.json")
+    sync_index(manifest_path, source_docs_dir=tmp_path)
+    kept_id = next(iter(store.docs))
+
+    (docs_dir / "b.md").write_text(f"# 運用基準\n{GUIDELINE}\n", encoding="utf-8")
+    upserted.clear()
+    stats = sync_index(manifest_path, source_docs_dir=tmp_path)
+
+    assert len(upserted) == 1 and upserted[0] != kept_id
+    assert list(store.docs) == [kept_id]
+    assert (stats["chunks_upserted"], stats["chunks_deleted"], stats["chunks_collapsed"]) == (0, 1, 1)
+    assert json.loads(store.docs[kept_id]["metadata"]["sources"]) == ["04_運用基準/a.md", "04_運用基準/b.md"]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from app.rag.embedding import EmbeddingService
+
+
+class FakeModel:
+    max_seq_length = 512
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.calls.append((list(texts), batch_size))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype="float64")
+
+
+def test_encode_uses_configured_batch_size_and_reports_rate():
+    """設定したバッチサイズでencodeし、処理件数を集計する"""
+    model = FakeModel()
+    service = EmbeddingService(batch_size=8, model=model)
+
+    vectors = service(["あ", "いい", "ううう"])
+
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert model.calls == [(["あ", "いい", "ううう"], 8)]
+    assert service.report()["docs"] == 3
+    assert service.encode([]) == []
@@ -0,0 +1,29 @@
+from app.rag.embedding import EmbeddingService
+from app.rag.embedding_cache import EmbeddingCache
+from tests.test_embedding import FakeModel
+
+
+def test_encode_documents_only_embeds_cache_misses(tmp_path):
+    """キャッシュにないチャンクだけがモデルに渡される"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    model = FakeModel()
+    service = EmbeddingService(model=model)
+
+    first = service.encode_documents(["条文A", "条文BB"], cache=cache)
+    second = service.encode_documents(["条文BB", "条文CCC", "条文A"], cache=cache)
+
+    assert [texts for texts, _ in model.calls] == [["条文A", "条文BB"], ["条文CCC"]]
+    assert second == [first[1], [5.0, 1.0], first[0]]
+    assert service.stats["cache_hits"] == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """上限を超えると最終利用時刻の古いエントリから削除される"""
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    cache.put_many("m", [(f"h{i}", [float(i)]) for i in range(10)])
+    cache.get_many("m", ["h0"])
+    cache.put_many("m", [("h10", [10.0])])
+
+    assert cache.count() == 9
+    assert "h0" in cache.get_many("m", ["h0"])
+    assert cache.get_many("m", ["h1"]) == {}
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# `from app.main import app` にかける時間の上限（秒）。重いリソースはlifespanか初回利用時に初期化する
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "5.0"))
+
+# import時に読み込んではいけないモジュール（モデル・DB・LLMクライアント）
+HEAVY_MODULES = ["sentence_transformers", "torch", "chromadb", "langchain_google_genai", "langchain_openai"]
+
+# 新しいプロセスで、ネットワークへの接続を禁止してからimportする
+_SCRIPT = """
+import json, socket, sys, time
+
+def _blocked(*args, **kwargs):
+    raise RuntimeError("network access during import")
+
+socket.socket.connect = _blocked
+socket.create_connection = _blocked
+socket.getaddrinfo = _blocked
+
+start = time.perf_counter()
+from app.main import app
+elapsed = time.perf_counter() - start
+heavy = [m for m in json.loads(sys.argv[1]) if m in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy": heavy}))
+"""
+
+
+def test_app_import_is_fast_and_offline():
+    """GOOGLE_API_KEY なし・ネットワークなしでも app.main をimportでき、モデル・DB・LLMクライアントを読み込まない"""
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "OPENAI_API_KEY")}
+    result = subprocess.run(
+        [sys.executable, "-c", _SCRIPT, json.dumps(HEAVY_MODULES)],
+        cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["heavy"] == []
+    assert report["seconds"] < IMPORT_TIME_BUDGET_SECONDS
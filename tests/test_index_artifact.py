@@ -0,0 +1,21 @@
+from app.rag import index_artifact
+
+
+def test_publish_switches_current_and_prunes_old(tmp_path):
+    """新バージョンの公開でCURRENTが切り替わり、古いバージョンは上限を超えると削除される"""
+    root = str(tmp_path)
+    assert index_artifact.current_version(root) is None
+
+    versions = []
+    for i in range(4):
+        base = index_artifact.current_version(root)
+        version = index_artifact.prepare_version(root, base_version=base)
+        index_artifact.publish_version(version, {"version": version, "n": i}, root)
+        versions.append(version)
+
+    assert index_artifact.current_version(root) == versions[-1]
+    assert index_artifact.read_index_info(index_artifact.current_index_dir(root))["n"] == 3
+
+    removed = index_artifact.prune_versions(root, keep=2)
+    assert removed == versions[:1]
+    assert index_artifact.list_versions(root) == versions[1:]
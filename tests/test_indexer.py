@@ -0,0 +1,44 @@
+from app.rag.indexer import diff_chunks
+from app.rag.loaders import assign_chunk_ids, content_sha256
+
+
+def _chunk(path, section, content, is_main=True):
+    return {
+        "content": content,
+        "metadata": {"path": path, "section": section, "is_main_provision": is_main},
+    }
+
+
+def test_chunk_ids_are_stable_and_unique():
+    """同じ path / section からは常に同じIDが生成され、重複セクションも区別される"""
+    chunks = [
+        _chunk("01_条文/a.xml", "第一条", "本則"),
+        _chunk("01_条文/a.xml", "第一条", "附則1", is_main=False),
+        _chunk("01_条文/a.xml", "第一条", "附則2", is_main=False),
+    ]
+    ids = [c["id"] for c in assign_chunk_ids(chunks)]
+    assert len(set(ids)) == 3
+
+    again = assign_chunk_ids([_chunk("01_条文/a.xml", "第一条", "内容が変わっても同じID")])
+    assert again[0]["id"] == ids[0]
+
+
+def test_diff_chunks_only_returns_changed():
+    """内容が変わったチャンクのみupsert対象、消えたチャンクは削除対象になる"""
+    chunks = assign_chunk_ids([
+        _chunk("a.md", "見出し1", "変更なし"),
+        _chunk("a.md", "見出し2", "変更後"),
+        _chunk("a.md", "見出し3", "新規"),
+    ])
+    for c in chunks:
+        c["content_hash"] = content_sha256(c["content"])
+
+    old = {
+        chunks[0]["id"]: content_sha256("変更なし"),
+        chunks[1]["id"]: content_sha256("変更前"),
+        "chunk_removed": content_sha256("削除済み"),
+    }
+    to_upsert, to_delete = diff_chunks(old, chunks)
+
+    assert [c["id"] for c in to_upsert] == [chunks[1]["id"], chunks[2]["id"]]
+    assert to_delete == ["chunk_removed"]
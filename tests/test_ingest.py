@@ -0,0 +1,28 @@
+import shutil
+
+from app.rag import ingest
+from app.rag.loaders import SOURCE_DOCS_DIR
+
+
+def test_parallel_ingest_matches_sequential(tmp_path, monkeypatch):
+    """ページ分割・並列取り込みの結果が逐次取り込みと一致する"""
+    pdf_src = SOURCE_DOCS_DIR / "比較広告に関する景品表示法上の考え方.pdf"
+    (tmp_path / "04_運用基準").mkdir()
+    pdf_path = tmp_path / "04_運用基準" / pdf_src.name
+    shutil.copy(pdf_src, pdf_path)
+    md_path = tmp_path / "04_運用基準" / "sample.md"
+    md_path.write_text("# 見出し1\n本文1\n# 見出し2\n本文2\n", encoding="utf-8")
+
+    monkeypatch.setattr(ingest, "PDF_PAGES_PER_TASK", 2)
+    paths = [md_path, pdf_path]
+
+    def collect(max_workers):
+        return {
+            path: [(c["id"], c["content"]) for c in chunks]
+            for path, chunks in ingest.iter_loaded_files(paths, tmp_path, max_workers=max_workers)
+        }
+
+    sequential = collect(1)
+    parallel = collect(2)
+    assert len(sequential[pdf_path]) > 2
+    assert parallel == sequential
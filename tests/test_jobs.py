@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from app.jobs.runner import JobRunner
+from app.jobs.store import JobStore
+from app.models.response import ComplianceCheckResponse
+from app.rag import retrieval
+
+
+def _contents(n):
+    return [{"type": "text", "data": f"投稿{i}"} for i in range(n)]
+
+
+def test_claim_respects_lease(tmp_path):
+    """実行中のジョブは、リースが切れるまで他のワーカーに取得されない"""
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=60)
+    job_id = store.create_job(_contents(2))
+
+    assert store.claim_next_job() == job_id
+    assert store.claim_next_job() is None
+
+    expired = JobStore(str(tmp_path / "jobs.sqlite3"), lease_seconds=-1)
+    assert expired.claim_next_job() == job_id
+
+
+def test_job_resumes_from_pending_items_after_restart(tmp_path, monkeypatch):
+    checked = []
+
+    async def fake_check(request):
+        checked.append(request.content.data)
+        if request.content.data == "投稿3":
+            raise RuntimeError("LLM error")
+        return ComplianceCheckResponse(status="success", result={"compliant": True})
+
+    monkeypatch.setattr(retrieval, "check_compliance", fake_check)
+    path = str(tmp_path / "jobs.sqlite3")
+
+    # 再起動前: 先頭2件まで処理済み
+    store = JobStore(path)
+    job_id = store.create_job(_contents(5), {"pipeline": "quick"})
+    store.save_results(job_id, [{"index": i, "status": "success", "result": {"status": "success"}} for i in range(2)])
+
+    # 再起動後: 別のストアインスタンスから再開する
+    runner = JobRunner(store=JobStore(path), chunk_size=2)
+    asyncio.run(runner.run_job(job_id))
+
+    assert checked == ["投稿2", "投稿3", "投稿4"]
+    job = store.get_job(job_id)
+    assert (job["status"], job["completed"], job["succeeded"], job["failed"]) == ("completed", 5, 4, 1)
+
+    page = store.get_results(job_id, offset=2, limit=2)
+    assert [r["index"] for r in page] == [2, 3]
+    assert page[1]["status"] == "error" and page[1]["error"] == "LLM error"
+
+
+def test_claim_is_exclusive_across_stores_and_lost_lease_stops_runner(tmp_path, monkeypatch):
+    """別プロセスのストアが取得済みのジョブは取得できず、引き継がれたワーカーは結果を保存せずに止まる"""
+    checked = []
+
+    async def fake_check(request):
+        checked.append(request.content.data)
+        return ComplianceCheckResponse(status="success", result={"compliant": True})
+
+    monkeypatch.setattr(retrieval, "check_compliance", fake_check)
+    path = str(tmp_path / "jobs.sqlite3")
+    first = JobStore(path, lease_seconds=60)
+    second = JobStore(path, lease_seconds=60)
+    job_id = first.create_job(_contents(3))
+
+    assert first.claim_next_job() == job_id
+    assert second.claim_next_job() is None
+    assert first.renew_lease(job_id)
+
+    # リースが切れて別のワーカーに引き継がれた後は、元のワーカーは延長も保存もできない
+    takeover = JobStore(path, lease_seconds=-1)
+    assert takeover.claim_next_job() == job_id
+    assert not first.renew_lease(job_id)
+    assert not first.save_results(job_id, [{"index": 0, "status": "success", "result": {}}])
+
+    asyncio.run(JobRunner(store=first, chunk_size=2).run_job(job_id))
+    job = first.get_job(job_id)
+    assert (job["status"], job["completed"]) == ("running", 0)
+
+    asyncio.run(JobRunner(store=takeover, chunk_size=2).run_job(job_id))
+    job = first.get_job(job_id)
+    assert (job["status"], job["completed"]) == ("completed", 3)
+    assert checked.count("投稿0") == 2
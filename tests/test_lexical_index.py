@@ -0,0 +1,76 @@
+from app.rag.lexical_index import (
+    article_keys,
+    build_lexical_index,
+    is_article_query,
+    load_lexical_index,
+    save_lexical_index,
+    tokenize,
+)
+
+DOCS = [
+    {"id": "yakkiho-66", "content": "何人も、医薬品の効能に関して虚偽又は誇大な記事を広告してはならない。",
+     "metadata": {"law_group": "yakkiho", "category": "01_statute", "section": "第六十六条",
+                  "title": "医薬品医療機器等法"}},
+    {"id": "kehyoho-5", "content": "商品の品質について著しく優良であると示す表示（優良誤認）をしてはならない。",
+     "metadata": {"law_group": "kehyoho", "category": "01_statute", "section": "第五条", "title": "景品表示法"}},
+    {"id": "kehyoho-26-2", "content": "事業者が講ずべき景品類の提供及び表示の管理上の措置",
+     "metadata": {"law_group": "kehyoho", "category": "01_statute", "section": "第二十六条の二",
+                  "title": "景品表示法"}},
+    {"id": "guide-1", "content": "No.1表示に関する実態調査報告書。優良誤認のおそれがある表示の例。",
+     "metadata": {"law_group": "other", "category": "04_standard", "section": "Page 1", "title": "No.1表示"}},
+]
+
+
+def test_tokenize_uses_words_and_bigrams():
+    """英数字は語単位（全角は半角にそろえる）、日本語は文字bigramになる"""
+    assert tokenize("優良誤認 ＮＯ．１") == ["優良", "良誤", "誤認", "no", "1"]
+
+
+def test_article_keys_normalize_kanji_and_branch_numbers():
+    assert article_keys("第六十六条、第26条の2、第百二十条") == ["66", "26-2", "120"]
+
+
+def test_is_article_query():
+    assert is_article_query("薬機法 第66条")
+    assert is_article_query("第二十六条の二")
+    assert not is_article_query("第66条 誇大広告")
+    assert not is_article_query("優良誤認")
+
+
+def test_bm25_ranks_exact_terms_and_respects_filter():
+    index = build_lexical_index(DOCS)
+
+    hits = index.search("優良誤認", top_k=5)
+    assert {doc_id for doc_id, _ in hits} == {"kehyoho-5", "guide-1"}
+    assert index.search("優良誤認", where={"law_group": "kehyoho"})[0][0] == "kehyoho-5"
+    # 漢数字の条文見出しにアラビア数字のクエリで一致する
+    assert index.search("第66条")[0][0] == "yakkiho-66"
+
+
+def test_lookup_articles_filters_by_law_mentioned_in_query():
+    index = build_lexical_index(DOCS)
+
+    assert index.lookup_articles("薬機法 第66条") == ["yakkiho-66"]
+    assert index.lookup_articles("景表法 第66条") == []
+    assert index.lookup_articles("第26条の2") == ["kehyoho-26-2"]
+
+
+def test_lookup_articles_ignores_supplementary_provisions():
+    """改正法の附則の条文番号は本則の条文番号として引かない"""
+    suppl = {"id": "kehyoho-suppl-5", "content": "この法律は、公布の日から起算して一年を経過した日から施行する。",
+             "metadata": {"law_group": "kehyoho", "category": "01_statute", "section": "第五条",
+                          "title": "景品表示法", "is_main_provision": False}}
+    index = build_lexical_index([suppl, *DOCS])
+
+    assert index.lookup_articles("景表法 第5条") == ["kehyoho-5"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_lexical_index(DOCS)
+    save_lexical_index(index, str(tmp_path))
+    loaded = load_lexical_index(str(tmp_path))
+
+    assert loaded.ids == index.ids
+    assert loaded.search("優良誤認") == index.search("優良誤認")
+    assert loaded.lookup_articles("第五条") == ["kehyoho-5"]
+    assert load_lexical_index(str(tmp_path / "missing")) is None
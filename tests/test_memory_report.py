@@ -0,0 +1,45 @@
+import sys
+
+import numpy as np
+import pytest
+
+from app.rag import memory_report
+from app.rag.vector_backend import MatrixBackend
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="/proc/self/smaps is Linux only")
+@pytest.mark.parametrize("dirname", ["index", "index dir"])
+def test_memory_usage_counts_mapped_index_pages(tmp_path, dirname):
+    """インデックスの成果物をmemmapしたページは mapped として集計され、共有可能なページとして扱われる（パスに空白があっても）"""
+    tmp_path = tmp_path / dirname
+    tmp_path.mkdir()
+    backend = MatrixBackend(str(tmp_path), writable=True)
+    vectors = np.random.default_rng(0).normal(size=(2000, 64))
+    backend.add(ids=[f"d{i}" for i in range(2000)], embeddings=vectors.tolist(),
+                documents=["doc"] * 2000, metadatas=[{"law_group": "yakkiho"}] * 2000)
+    backend.persist()
+
+    reader = MatrixBackend(str(tmp_path))
+    reader.query(query_embeddings=[vectors[0].tolist()], n_results=1)
+    usage = memory_report.memory_usage(str(tmp_path))
+    assert usage["rss"] > 0 and usage["private"] > 0
+    assert usage["mapped"] >= reader.vectors.nbytes
+    assert 0 < usage["mapped_rss"] <= usage["mapped"]
+
+
+def test_startup_report_computes_growth_per_stage(monkeypatch):
+    usages = iter([
+        {"rss": 100, "pss": 90, "private": 80, "shared": 20, "mapped": None, "mapped_rss": None},
+        {"rss": 150, "pss": 120, "private": 95, "shared": 55, "mapped": 40, "mapped_rss": 30},
+    ])
+    monkeypatch.setattr(memory_report, "MEMORY_REPORT", True)
+    monkeypatch.setattr(memory_report, "memory_usage", lambda mapped_prefix=None: next(usages))
+
+    report = memory_report.StartupMemoryReport()
+    report.mark("start")
+    report.mark("ready", mapped_prefix="index")
+    result = report.report()
+
+    assert [s["stage"] for s in result["stages"]] == ["start", "ready"]
+    assert result["stages"][1]["private_growth"] == 15
+    assert result["total"] == {"rss_growth": 50, "private_growth": 15}
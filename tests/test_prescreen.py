@@ -0,0 +1,43 @@
+from app.workflow.prescreen import PRESCREEN_RULES_PATH, Prescreener
+
+
+def test_bundled_rules_detect_clear_violations():
+    """同梱の表現辞書で薬機法の効能効果・No.1表示・打消し表示を検出する"""
+    prescreener = Prescreener.from_file(PRESCREEN_RULES_PATH)
+
+    result = prescreener.scan("医師も推奨！シミが消える美容液。満足度No.1 ※個人の感想です")
+    rule_ids = {m["rule_id"] for m in result["matches"]}
+
+    assert result["verdict"] == "ng"
+    assert {"yakki_expert_endorsement", "yakki_body_function", "no1_claim", "disclaimer"} <= rule_ids
+    assert prescreener.scan("毎日のスキンケアに。うるおいを与える化粧水")["verdict"] == "clear"
+    assert prescreener.scan("業界最安値でお届けします")["verdict"] == "review"
+
+
+def test_spans_refer_to_original_text():
+    """全角英数字などはNFKC正規化して照合し、検出箇所は元のテキスト上の位置で返す"""
+    prescreener = Prescreener([
+        {"id": "no1", "category": "No.1表示", "law": "景表法", "severity": "medium", "patterns": ["No\\.1"]},
+        {"id": "era", "category": "テスト", "law": "テスト", "severity": "high", "terms": ["平成"]},
+    ])
+    text = "㍻から続く満足度ＮＯ．１"
+
+    result = prescreener.scan(text)
+    spans = {m["rule_id"]: (m["start"], m["end"], m["text"]) for m in result["matches"]}
+
+    assert spans["era"] == (0, 1, "㍻")
+    assert spans["no1"] == (8, 12, "ＮＯ．１")
+    assert result["verdict"] == "ng"
+
+
+def test_negated_expressions_do_not_make_ng():
+    """否定文の表現は検出するが negated を付け、ng の根拠にしない"""
+    prescreener = Prescreener.from_file(PRESCREEN_RULES_PATH)
+
+    result = prescreener.scan("この美容液に治療効果はありません。")
+    assert [m["negated"] for m in result["matches"]] == [True]
+    assert result["verdict"] == "review"
+
+    result = prescreener.scan("治療効果はありませんが、シミが消える。")
+    assert [m["negated"] for m in result["matches"]] == [True, False]
+    assert result["verdict"] == "ng"
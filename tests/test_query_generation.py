@@ -0,0 +1,58 @@
+from app.rag.vocabulary import build_vocabulary, match_terms
+from app.workflow.query_generation import QueryCache, generate_local_queries
+
+
+def _documents():
+    yakkiho = [
+        "何人も、医薬品の効能、効果又は性能に関して、虚偽又は誇大な記事を広告してはならない。",
+        "医薬品の効能又は効果について、医師が保証したものと誤解されるおそれがある記事を広告してはならない。",
+        "医薬品の名称、製造方法、効能、効果又は性能に関する広告",
+    ]
+    kehyoho = [
+        "商品の品質について、実際のものよりも著しく優良であると示す表示",
+        "商品の価格その他の取引条件について、著しく有利であると誤認される表示",
+        "品質、規格その他の内容について一般消費者に誤認される表示",
+    ]
+    docs = [{"content": t, "metadata": {"law_group": "yakkiho"}} for t in yakkiho]
+    docs += [{"content": t, "metadata": {"law_group": "kehyoho"}} for t in kehyoho]
+    return docs
+
+
+def test_match_terms_uses_law_group_vocabulary():
+    """入力中の語のうち、各law_groupのコーパスに出現する語だけが抽出される"""
+    vocabulary = build_vocabulary(_documents())
+
+    yakkiho_terms = match_terms("この医薬品を飲めば効果が必ず出ます。品質も最高", vocabulary, "yakkiho")
+    kehyoho_terms = match_terms("この医薬品を飲めば効果が必ず出ます。品質も最高", vocabulary, "kehyoho")
+
+    assert set(yakkiho_terms) == {"医薬品", "効果"}
+    assert kehyoho_terms == ["品質"]
+
+
+def test_generate_local_queries_without_vocabulary_falls_back():
+    queries = generate_local_queries("シミが消える美容液", vocabulary={})
+    assert queries["yakkiho_query"].startswith("薬機法 ")
+    assert set(queries) == {"yakkiho_query", "kehyoho_query", "guideline_query"}
+
+
+def test_generate_local_queries_combines_anchor_and_terms():
+    queries = generate_local_queries("医薬品の効果を保証", vocabulary=build_vocabulary(_documents()))
+    assert queries["yakkiho_query"].startswith("薬機法 第66条 誇大広告 ")
+    assert "医薬品" in queries["yakkiho_query"]
+
+
+def test_query_cache_is_keyed_by_model_and_bounded(tmp_path):
+    cache = QueryCache(str(tmp_path / "queries.sqlite3"), max_entries=2)
+    queries = {"yakkiho_query": "薬機法 第66条", "kehyoho_query": "景表法", "guideline_query": "ガイドライン"}
+
+    cache.put("入力A", "gemini-2.5-flash", queries)
+    assert cache.get("入力A", "gemini-2.5-flash") == queries
+    assert cache.get("入力A", "other-model") is None
+
+    cache.put("入力B", "gemini-2.5-flash", queries)
+    cache.put("入力C", "gemini-2.5-flash", queries)
+    assert cache._conn.execute("SELECT COUNT(*) FROM generated_queries").fetchone()[0] == 2
+
+    # 永続化されていること（別インスタンスから読める）
+    reopened = QueryCache(str(tmp_path / "queries.sqlite3"))
+    assert reopened.get("入力C", "gemini-2.5-flash") == queries
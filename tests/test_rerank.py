@@ -0,0 +1,36 @@
+from app.rag.rerank import DEFAULT_BOOST_RULES, CrossEncoderReranker, apply_boosts, distance_to_similarity
+
+
+def test_distance_to_similarity_is_monotonic():
+    """距離が小さいほど類似度が大きく、cosineは 1 - 距離 になる"""
+    assert distance_to_similarity(0.0) == 1.0
+    assert distance_to_similarity(0.5) > distance_to_similarity(2.0)
+    assert distance_to_similarity(0.25, "cosine") == 0.75
+
+
+def test_default_boost_rules():
+    """本法（施行令・規則以外の条文）と、クエリ中の条文番号に一致する文書のスコアを上げる"""
+    main_act = {"title": "医薬品医療機器等法", "section": "第六十六条", "category": "01_statute"}
+    regulation = {"title": "景品表示法施行令", "section": "第一条", "category": "01_statute"}
+
+    score, applied = apply_boosts(0.5, main_act, "薬機法 第六十六条 誇大広告", DEFAULT_BOOST_RULES)
+    assert applied == ["main_act", "section_match"]
+    assert abs(score - 0.5 * 1.5 * 1.3) < 1e-9
+
+    assert apply_boosts(0.5, regulation, "景表法 第5条", DEFAULT_BOOST_RULES) == (0.5, [])
+
+
+def test_cross_encoder_scores_all_pairs_in_one_batch():
+    """候補はまとめて1回のpredictで採点される"""
+    calls = []
+
+    class FakeCrossEncoder:
+        def predict(self, pairs, batch_size, show_progress_bar):
+            calls.append(len(pairs))
+            return [0.9 if "誇大" in doc else 0.1 for _, doc in pairs]
+
+    reranker = CrossEncoderReranker(model=FakeCrossEncoder())
+    scores = reranker.score([("広告", "誇大な広告の禁止"), ("広告", "施行期日"), ("表示", "誇大表示")])
+
+    assert scores == [0.9, 0.1, 0.9]
+    assert calls == [3]
@@ -0,0 +1,70 @@
+import time
+
+from app.rag.result_cache import ResultCache, normalize_text
+
+
+def test_exact_hit_ignores_width_and_whitespace_differences():
+    """NFKC正規化により全角・半角や空白の違いは同一テキストとして扱う"""
+    cache = ResultCache()
+    cache.put("ＮＯ．１の　美容液\n", {"pipeline": "full"}, "v1", "result")
+
+    assert normalize_text("ＮＯ．１の　美容液\n") == "NO.1の 美容液"
+    assert cache.get("NO.1の 美容液", {"pipeline": "full"}, "v1") == ("result", {"hit": "exact"})
+    assert cache.get("NO.1の 美容液", {"pipeline": "quick"}, "v1") is None
+
+
+def test_index_version_change_invalidates_entries():
+    """インデックスのバージョンが変わると既存のエントリは破棄される"""
+    cache = ResultCache()
+    cache.put("テキスト", None, "v1", "old")
+    assert cache.get("テキスト", None, "v2") is None
+    assert len(cache) == 0
+
+
+def test_lru_and_ttl_eviction():
+    """上限超過時は最も使われていないエントリ、期限切れのエントリは参照時に削除される"""
+    cache = ResultCache(max_entries=2)
+    cache.put("a", None, "v1", 1)
+    cache.put("b", None, "v1", 2)
+    cache.get("a", None, "v1")
+    cache.put("c", None, "v1", 3)
+    assert cache.get("b", None, "v1") is None
+    assert cache.get("a", None, "v1") is not None
+
+    expiring = ResultCache(ttl_seconds=0.01)
+    expiring.put("a", None, "v1", 1)
+    time.sleep(0.02)
+    assert expiring.get("a", None, "v1") is None
+
+
+def test_semantic_hit_uses_similarity_threshold():
+    """類似一致は同じオプションのエントリのうち閾値以上の類似度のものだけがヒットする"""
+    vectors = {"飲むだけで痩せる": [1.0, 0.0], "飲むだけで痩せます": [0.99, 0.14], "無関係な文": [0.0, 1.0]}
+    cache = ResultCache(semantic_threshold=0.95, embed_fn=lambda texts: [vectors[t] for t in texts])
+    cache.put("飲むだけで痩せる", None, "v1", "result")
+
+    value, info = cache.get("飲むだけで痩せます", None, "v1")
+    assert value == "result" and info["hit"] == "semantic"
+    assert cache.get("無関係な文", None, "v1") is None
+
+
+def test_check_compliance_does_not_cache_empty_results(monkeypatch):
+    """final_output が空のまま終わった実行結果はキャッシュしない"""
+    import asyncio
+
+    from app.models.request import ComplianceCheckRequest, ContentData
+    from app.rag import retrieval
+
+    class EmptyWorkflow:
+        async def ainvoke(self, state):
+            return state
+
+    cache = ResultCache()
+    monkeypatch.setattr(retrieval, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(retrieval, "get_workflow", lambda pipeline: EmptyWorkflow())
+    request = ComplianceCheckRequest(content=ContentData(type="text", data="飲むだけで痩せる"))
+
+    response = asyncio.run(retrieval.check_compliance(request))
+
+    assert response.result["violations"] == [] and response.result["confidence_score"] == 0.0
+    assert len(cache) == 0
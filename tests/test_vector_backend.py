@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.rag.vector_backend import MatrixBackend
+
+
+def _add_docs(backend):
+    backend.add(
+        ids=["a", "b", "c"],
+        embeddings=[[1.0, 0.0], [0.8, 0.6], [0.0, 2.0]],
+        documents=["doc a", "doc b", "doc c"],
+        metadatas=[{"law_group": "yakkiho"}, {"law_group": "kehyoho"}, {"law_group": "yakkiho"}],
+    )
+
+
+def test_matrix_backend_queries_by_cosine_similarity_with_filter(tmp_path):
+    """コサイン類似度の高い順に返し、where の一致条件で絞り込む"""
+    backend = MatrixBackend(str(tmp_path), writable=True)
+    _add_docs(backend)
+
+    results = backend.query(query_embeddings=[[1.0, 0.1], [0.0, 1.0]], n_results=2)
+    assert results["ids"] == [["a", "b"], ["c", "b"]]
+    assert results["distances"][1][0] < 1e-6
+
+    filtered = backend.query(query_embeddings=[[1.0, 0.1]], n_results=5, where={"law_group": "yakkiho"})
+    assert filtered["ids"] == [["a", "c"]]
+    assert filtered["metadatas"][0][0] == {"law_group": "yakkiho"}
+    assert backend.query(query_embeddings=[[1.0, 0.0]], n_results=2, where={"law_group": "other"})["ids"] == [[]]
+
+
+def test_matrix_backend_upsert_delete_and_reopen_read_only(tmp_path):
+    """同じIDの追加は置き換えになり、persist した成果物をmemmapで読み込み専用に開ける"""
+    backend = MatrixBackend(str(tmp_path), writable=True)
+    _add_docs(backend)
+    backend.add(ids=["a"], embeddings=[[0.0, 1.0]], documents=["doc a2"], metadatas=[{"law_group": "kehyoho"}])
+    backend.delete(["c"])
+    backend.update_metadatas(["b"], [{"law_group": "yakkiho", "section": "第五条"}])
+    assert backend.count() == 2
+    backend.persist()
+
+    reopened = MatrixBackend(str(tmp_path))
+    assert isinstance(reopened.vectors, np.memmap)
+    assert not isinstance(reopened.metadatas, list)
+    assert reopened.get(ids=["b", "a", "missing"])["documents"] == ["doc b", "doc a2"]
+    assert reopened.get(limit=1, offset=1)["ids"] == ["b"]
+    result = reopened.query(query_embeddings=[[0.0, 1.0]], n_results=1, where={"law_group": "kehyoho"})
+    assert result["ids"] == [["a"]]
+    assert reopened.query(query_embeddings=[[1.0, 0.0]], n_results=1,
+                          where={"$and": [{"law_group": "yakkiho"}, {"section": "第五条"}]})["ids"] == [["b"]]
+
+    with pytest.raises(RuntimeError):
+        reopened.add(ids=["d"], embeddings=[[1.0, 0.0]], documents=["doc d"], metadatas=[{}])
+
+    # 差分ビルドでは前回の成果物を読み込んで更新する
+    rebuilt = MatrixBackend(str(tmp_path), writable=True)
+    assert rebuilt.get(ids=["a"])["documents"] == ["doc a2"]
+    rebuilt.reset()
+    assert rebuilt.count() == 0
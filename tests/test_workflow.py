@@ -0,0 +1,285 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.workflow import langgraph as wf
+
+QUERY_JSON = '{"yakkiho_query": "薬機法 第66条", "kehyoho_query": "景表法 第5条", "guideline_query": "ガイドライン"}'
+ANALYSIS_NG_JSON = (
+    '{"verdict": "non_compliant", "risk_level": "high", "issues": [{"expression": "シミが消える", "law": "薬機法",'
+    ' "cited_articles": ["薬機法 第66条第1項"], "risk_level": "high", "reason": "効能効果の誇大な表示"}],'
+    ' "rule": "薬機法第66条", "application": "誇大広告に該当", "conclusion": "不適合"}'
+)
+ANALYSIS_OK_JSON = '{"verdict": "compliant", "risk_level": "none", "issues": [], "conclusion": "適合"}'
+RECOMMEND_JSON = '{"revisions": [{"original_text": "シミが消える", "revised_text": "肌を整える", "reason": "提案"}]}'
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """応答に一定の待ち時間がかかるLLMのスタブ"""
+    delay: float = 0.2
+
+    async def _agenerate(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return await super()._agenerate(*args, **kwargs)
+
+
+def _fake_search(searches):
+    return [
+        {
+            "documents": [[f"{s['where']['law_group']} の条文"]],
+            "metadatas": [[{"title": "テスト法", "section": "第一条", "category": "01_statute"}]],
+        }
+        for s in searches
+    ]
+
+
+def test_concurrent_checks_do_not_block_each_other(monkeypatch):
+    """LLM呼び出しが非同期のため、複数リクエストが並行して処理される"""
+    n = 5
+    # 並行実行では各ワークフローの同じ段階のLLM呼び出しが先にそろうため、応答も段階ごとに並べる
+    monkeypatch.setattr(wf, "llm_gemini", SlowFakeChatModel(responses=[QUERY_JSON] * n + [ANALYSIS_NG_JSON] * n + [RECOMMEND_JSON] * n))
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    monkeypatch.setattr(wf, "get_query_cache", lambda: None)
+    workflow = wf.create_workflow()
+
+    async def run_all():
+        states = [{"input_text": f"テスト{i}", "retrieved_docs": [], "analysis_result": {},
+                   "final_output": {}, "current_step": "start", "debug_info": {}, "prescreen_mode": "off"}
+                  for i in range(n)]
+        return await asyncio.gather(*(workflow.ainvoke(s) for s in states))
+
+    start = time.time()
+    results = asyncio.run(run_all())
+    elapsed = time.time() - start
+
+    assert all(r["final_output"]["recommendations"] for r in results)
+    # 逐次実行なら 5件 × 3回 × 0.2秒 = 3秒かかる
+    assert elapsed < 1.5
+
+
+def test_semaphores_and_search_batcher_are_created_per_event_loop(monkeypatch):
+    """セマフォとSearchBatcherは実行中のイベントループごとに作られ、ループを作り直しても使える"""
+    monkeypatch.setattr(wf, "LLM_MAX_CONCURRENCY", {"gemini": 1, "openai": 1})
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    monkeypatch.setattr(wf, "get_query_cache", lambda: None)
+    workflow = wf.create_workflow()
+
+    async def run_pair():
+        states = [{"input_text": f"テスト{i}", "retrieved_docs": [], "analysis_result": {},
+                   "final_output": {}, "current_step": "start", "debug_info": {}, "prescreen_mode": "off"}
+                  for i in range(2)]
+        results = await asyncio.gather(*(workflow.ainvoke(s) for s in states))
+        assert wf._get_loop_state() is wf._get_loop_state()
+        return wf._get_loop_state(), results
+
+    batchers = []
+    for _ in range(2):
+        # 上限1のセマフォで待ちが発生しても、前のループに結び付いたオブジェクトは使われない
+        monkeypatch.setattr(wf, "llm_gemini", SlowFakeChatModel(delay=0.01, responses=[QUERY_JSON] * 2 + [ANALYSIS_NG_JSON] * 2 + [RECOMMEND_JSON] * 2))
+        state, results = asyncio.run(run_pair())
+        assert all(r["final_output"]["recommendations"] for r in results)
+        batchers.append(state["search_batcher"])
+    assert batchers[0] is not batchers[1]
+    # 閉じたループの分は次のループの分を作るときに捨てられる
+    assert len(wf._loop_state) == 1
+
+
+def test_registry_compiles_each_pipeline_once():
+    """コンパイル済みのワークフローは使い回され、未登録の名前はエラーになる"""
+    from app.workflow import registry
+
+    assert set(registry.compile_all()) >= {"full", "quick"}
+    assert registry.get_workflow("full") is registry.get_workflow("full")
+    assert registry.get_workflow("quick") is not registry.get_workflow("full")
+
+    with pytest.raises(ValueError):
+        registry.get_workflow("unknown")
+
+
+def test_local_query_mode_skips_llm_query_generation(monkeypatch):
+    """query_mode=local の場合、検索クエリ生成でLLMを呼ばない"""
+    monkeypatch.setattr(wf, "llm_gemini", FakeListChatModel(responses=[ANALYSIS_NG_JSON, RECOMMEND_JSON]))
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    workflow = wf.create_workflow()
+
+    state = {"input_text": "シミが消える美容液", "retrieved_docs": [], "analysis_result": {},
+             "final_output": {}, "current_step": "start", "debug_info": {}, "query_mode": "local",
+             "prescreen_mode": "off"}
+    result = asyncio.run(workflow.ainvoke(state))
+
+    assert result["final_output"]["revisions"][0]["revised_text"] == "肌を整える"
+
+
+def _collapse(names):
+    """連続する同じイベント名を1つにまとめる"""
+    return [n for i, n in enumerate(names) if i == 0 or names[i - 1] != n]
+
+
+def test_stream_sends_field_deltas_then_validated_result_and_replays_on_cache_hit(monkeypatch):
+    """
+    ストリーミングでは検索結果 → 分析のフィールドごとの差分（トークン単位）→ 検証済みの分析 → 提案の差分 → 提案 → 最終結果
+    の順にイベントが届き、結果キャッシュから返す場合も同じ値のイベントが同じ順序で届く
+    """
+    import json
+
+    from app.models.request import ComplianceCheckRequest, ContentData, RequestOptions
+    from app.rag import retrieval
+    from app.rag.result_cache import ResultCache
+    from app.workflow.structured_output import iter_string_fields
+
+    monkeypatch.setattr(wf, "llm_gemini", FakeListChatModel(responses=[QUERY_JSON, ANALYSIS_NG_JSON, RECOMMEND_JSON]))
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    monkeypatch.setattr(wf, "get_query_cache", lambda: None)
+    cache = ResultCache()
+    monkeypatch.setattr(retrieval, "get_result_cache", lambda: cache)
+
+    async def collect():
+        request = ComplianceCheckRequest(content=ContentData(type="text", data="シミが消える"),
+                                         options=RequestOptions(prescreen="off"))
+        return [item async for item in retrieval.stream_compliance_check(request)]
+
+    def fields(events, name):
+        values = {}
+        for event, data in events:
+            if event == name:
+                values[data["field"]] = values.get(data["field"], "") + data["delta"]
+        return values
+
+    def without_deltas(events):
+        return [(name, data) for name, data in events if not name.endswith("_delta")]
+
+    events = asyncio.run(collect())
+    names = [name for name, _ in without_deltas(events)]
+    order = [name for name, _ in events]
+
+    assert names == ["evidence", "analysis", "recommendations", "result"]
+    assert len(events[0][1]["evidence"]) == 3
+    # 分析の差分はLLMの出力の途中から届き、完了時の analysis より前に終わる
+    assert order.count("analysis_delta") > len(fields(events, "analysis_delta"))
+    assert order.index("evidence") < order.index("analysis_delta") < order.index("analysis")
+    assert max(i for i, n in enumerate(order) if n == "analysis_delta") < order.index("analysis")
+    assert fields(events, "analysis_delta") == dict(iter_string_fields(json.loads(ANALYSIS_NG_JSON)))
+    assert fields(events, "recommendations_delta") == dict(iter_string_fields(json.loads(RECOMMEND_JSON)))
+
+    result = events[-1][1]["result"]
+    analysis = next(data for name, data in events if name == "analysis")
+    assert analysis["text"] == result["violations"][0]["details"]
+    assert analysis["analysis"]["verdict"] == "non_compliant"
+    assert next(data for name, data in events if name == "recommendations") == {"recommendations": result["recommendations"]}
+
+    # 2回目はキャッシュから返し、LLMを呼ばずに同じ値のイベントを送る
+    cached_events = asyncio.run(collect())
+    assert "cache" in cached_events[-1][1]["result"]["analysis_log"]
+    assert without_deltas(cached_events)[:-1] == without_deltas(events)[:-1]
+    assert _collapse([n for n, _ in cached_events]) == _collapse(order)
+    for name in ("analysis_delta", "recommendations_delta"):
+        assert fields(cached_events, name) == fields(events, name)
+
+
+def test_prescreen_ng_skips_llm_stages(monkeypatch):
+    """事前判定で明白な違反とされたテキストはLLMを一度も呼ばずに不適合と判定される"""
+    llm = FakeListChatModel(responses=[])
+    monkeypatch.setattr(wf, "llm_gemini", llm)
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    workflow = wf.create_workflow()
+
+    state = {"input_text": "医師が推奨！飲むだけで痩せるサプリ", "retrieved_docs": [], "analysis_result": {},
+             "final_output": {}, "current_step": "start", "debug_info": {}, "prescreen_mode": "short_circuit"}
+    result = asyncio.run(workflow.ainvoke(state))
+
+    assert result["prescreen_result"]["verdict"] == "ng"
+    assert result["debug_info"]["query_source"] == "local"
+    assert result["final_output"]["compliant"] is False
+    assert "医師が推奨" in result["final_output"]["analysis_summary"]
+    assert result["current_step"] == "conclude"
+
+
+def test_short_circuit_analyzes_negated_and_clear_texts_with_llm(monkeypatch):
+    """否定文の違反表現（「治療効果はありません」）や該当なし（clear）は、short_circuitでもLLMで分析する"""
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    monkeypatch.setattr(wf, "get_query_cache", lambda: None)
+    workflow = wf.create_workflow()
+
+    for text in ("この美容液に治療効果はありません", "うるおいを与える化粧水"):
+        monkeypatch.setattr(wf, "llm_gemini", FakeListChatModel(responses=[QUERY_JSON, ANALYSIS_OK_JSON]))
+        state = {"input_text": text, "retrieved_docs": [], "analysis_result": {}, "final_output": {},
+                 "current_step": "start", "debug_info": {}, "prescreen_mode": "short_circuit"}
+        result = asyncio.run(workflow.ainvoke(state))
+
+        assert result["prescreen_result"]["verdict"] != "ng"
+        assert result["debug_info"]["query_source"] == "llm"
+        assert result["workflow_path"] == ["prescreen", "retrieve", "analyze", "summarize"]
+
+
+def test_compliant_analysis_skips_recommendations(monkeypatch):
+    """分析の結論が適合の場合は言い換え提案を作らず、通った経路を記録する"""
+    monkeypatch.setattr(wf, "llm_gemini", FakeListChatModel(responses=[ANALYSIS_OK_JSON]))
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    workflow = wf.create_workflow()
+
+    state = {"input_text": "うるおいを与える化粧水", "retrieved_docs": [], "analysis_result": {},
+             "final_output": {}, "current_step": "start", "debug_info": {}, "query_mode": "local"}
+    result = asyncio.run(workflow.ainvoke(state))
+
+    assert result["final_output"]["compliant"] is True
+    assert result["final_output"]["recommendations"] == ""
+    assert result["workflow_path"] == ["prescreen", "retrieve", "analyze", "summarize"]
+
+
+def test_extract_verdict_reads_conclusion_section():
+    """「不適合」を「適合」と取り違えず、結論部分の判定を使う"""
+    assert wf.extract_verdict("1. Issue: 適合性を検討\n4. Conclusion (結論): 不適合（違反の可能性が高い）") == "non_compliant"
+    assert wf.extract_verdict("Issue: 違反の疑い\nConclusion: 適合") == "compliant"
+    assert wf.extract_verdict("判断できません") == "unclear"
+
+
+def test_analysis_is_validated_and_repaired_once(monkeypatch):
+    """分析結果が形式に合わない場合は1回だけ修復を依頼し、表現の位置を入力テキスト上で特定する"""
+    llm = FakeListChatModel(responses=['{"verdict": "違反"}', ANALYSIS_NG_JSON, RECOMMEND_JSON])
+    monkeypatch.setattr(wf, "llm_gemini", llm)
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+    workflow = wf.create_workflow()
+
+    state = {"input_text": "このクリームでシミが消える", "retrieved_docs": [], "analysis_result": {},
+             "final_output": {}, "current_step": "start", "debug_info": {}, "query_mode": "local",
+             "prescreen_mode": "off"}
+    result = asyncio.run(workflow.ainvoke(state))
+
+    analysis = result["final_output"]["analysis"]
+    assert analysis["verdict"] == "non_compliant"
+    assert (analysis["issues"][0]["start"], analysis["issues"][0]["end"]) == (7, 13)
+    assert analysis["issues"][0]["cited_articles"] == ["薬機法 第66条第1項"]
+    assert result["final_output"]["compliant"] is False
+    assert len(result["usage_metadata"]) == 4  # クエリ生成（なし）・分析・修復・提案
+
+
+def test_reranker_scores_candidates_and_drops_low_scores(monkeypatch):
+    """リランカーを設定すると全スロットの候補をまとめて採点し、しきい値未満の文書はLLMに渡さない"""
+    class FakeReranker:
+        model_name = "fake-reranker"
+
+        def __init__(self):
+            self.calls = []
+
+        def score(self, pairs):
+            self.calls.append(pairs)
+            return [0.9 if "yakkiho" in doc else 0.1 for _, doc in pairs]
+
+    reranker = FakeReranker()
+    monkeypatch.setattr(wf, "get_reranker", lambda: reranker)
+    monkeypatch.setattr(wf, "RERANK_MIN_SCORE", 0.5)
+    monkeypatch.setattr(wf, "search_documents_batch", _fake_search)
+
+    state = {"input_text": "テスト", "query_mode": "local", "prescreen_result": {}, "workflow_path": []}
+    result = asyncio.run(wf.retrieve_documents(state))
+
+    assert len(reranker.calls) == 1 and len(reranker.calls[0]) == 3
+    assert result["retrieved_docs"]["documents"] == [["yakkiho の条文"]]
+    assert result["debug_info"]["retrieved_doc_scores"][0]["rerank_score"] == 0.9
+    assert result["debug_info"]["reranker"] == "fake-reranker"
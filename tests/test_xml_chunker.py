@@ -0,0 +1,64 @@
+from app.rag.xml_chunker import iter_law_paragraphs
+
+SAMPLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Law><LawBody>
+  <LawTitle Abbrev="景表法,景品表示法">不当景品類及び不当表示防止法</LawTitle>
+  <TOC><TOCLabel>目次</TOCLabel></TOC>
+  <MainProvision>
+    <Article Num="5">
+      <ArticleCaption>（不当な表示の禁止）</ArticleCaption>
+      <ArticleTitle>第五条</ArticleTitle>
+      <Paragraph Num="1">
+        <ParagraphNum/>
+        <ParagraphSentence><Sentence>事業者は、次の表示をしてはならない。</Sentence></ParagraphSentence>
+        <Item Num="1">
+          <ItemTitle>一</ItemTitle>
+          <ItemSentence><Column><Sentence>優良誤認</Sentence></Column><Column><Sentence>表示</Sentence></Column></ItemSentence>
+        </Item>
+      </Paragraph>
+      <Paragraph Num="2">
+        <ParagraphNum>２</ParagraphNum>
+        <ParagraphSentence><Sentence>前項の規定は、次のとおり改める。</Sentence></ParagraphSentence>
+        <AmendProvision><NewProvision>
+          <Article Num="9"><ArticleTitle>第九条</ArticleTitle>
+            <Paragraph Num="1"><ParagraphNum/><ParagraphSentence><Sentence>引用された条文</Sentence></ParagraphSentence></Paragraph>
+          </Article>
+        </NewProvision></AmendProvision>
+      </Paragraph>
+    </Article>
+  </MainProvision>
+  <SupplProvision AmendLawNum="令和六年法律第一号">
+    <SupplProvisionLabel>附　則</SupplProvisionLabel>
+    <Paragraph Num="1"><ParagraphCaption>（施行期日）</ParagraphCaption><ParagraphNum/>
+      <ParagraphSentence><Sentence>この法律は公布の日から施行する。</Sentence></ParagraphSentence>
+    </Paragraph>
+  </SupplProvision>
+</LawBody></Law>
+"""
+
+
+def test_iter_law_paragraphs(tmp_path):
+    """項単位のレコードが正しい法令名・条番号・本文で生成される"""
+    xml_path = tmp_path / "law.xml"
+    xml_path.write_text(SAMPLE_XML, encoding="utf-8")
+
+    paras = list(iter_law_paragraphs(xml_path))
+    assert len(paras) == 3
+
+    first, second, suppl = paras
+    assert first["law_title"] == "不当景品類及び不当表示防止法"
+    assert first["law_group"] == "kehyoho"
+    assert first["article_title"] == "第五条"
+    assert first["article_caption"] == "（不当な表示の禁止）"
+    assert first["paragraph_label"] == ""
+    assert first["text"] == "事業者は、次の表示をしてはならない。\n  一 優良誤認　表示"
+
+    # 改正規定内に引用された条は外側の項の本文に含まれ、独立したチャンクにならない
+    assert second["article_title"] == "第五条"
+    assert second["paragraph_label"] == "第2項"
+    assert "引用された条文" in second["text"]
+
+    assert suppl["is_main_provision"] is False
+    assert suppl["suppl_label"] == "附　則"
+    assert suppl["article_caption"] == "（施行期日）"
+    assert suppl["amend_law_num"] == "令和六年法律第一号"